@@ -0,0 +1,76 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wkhtml_crawler import LINK_EXTRACTORS, LINK_EXTRACTOR_BS4, extract_links
+
+# compares the crawler's link extractors on a corpus of saved pages:
+#   python benchmarks/bench_link_extraction.py saved_pages/ --repeat 3
+# without a corpus directory a synthetic one is generated. every extractor's output is checked against bs4's.
+
+
+def load_corpus(corpus_dir):
+    pages = []
+    for dirpath, _, filenames in os.walk(corpus_dir):
+        for filename in sorted(filenames):
+            if filename.lower().endswith((".html", ".htm")):
+                with open(os.path.join(dirpath, filename), 'r', encoding='utf-8', errors='replace') as f: pages.append((filename, f.read()))
+    return pages
+
+
+def synthetic_corpus(page_count, seed=1):
+    rng = random.Random(seed)
+    pages = []
+    for i in range(page_count):
+        parts = ["<!DOCTYPE html><html><head><title>Page %d</title><style>a{color:red}</style></head><body>" % i]
+        for j in range(rng.randint(200, 2000)):
+            parts.append(f"<div class='row r{j}'><p>Lorem ipsum <b>dolor</b> sit amet {j} &amp; more text here.</p>")
+            if rng.random() < 0.3: parts.append(f'<a href="/section/{rng.randint(0, 5000)}.html?x={j}&amp;y=1" class="l">link {j}</a>')
+            if rng.random() < 0.05: parts.append(f"<a href='https://example.org/ext/{j}'>ext</a><!-- <a href='/commented'> -->")
+            parts.append("</div>")
+        parts.append("<script>var s = '<a href=\"/not-a-link\">';</script></body></html>")
+        pages.append((f"synthetic_{i}.html", "".join(parts)))
+    return pages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark crawler link extractors.")
+    parser.add_argument("corpus_dir", nargs="?", help="directory of saved .html pages (default: synthetic corpus)")
+    parser.add_argument("--synthetic", type=int, default=50, help="pages to generate when no corpus is given")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the corpus per extractor (best time is kept)")
+    args = parser.parse_args(argv)
+
+    pages = load_corpus(args.corpus_dir) if args.corpus_dir else synthetic_corpus(args.synthetic)
+    if not pages: print("No pages found."); return 1
+    total_mb = sum(len(text) for _, text in pages) / 1048576
+    print(f"{len(pages)} page(s), {total_mb:.1f} MB of HTML, best of {args.repeat} pass(es)\n")
+
+    reference, results = None, []
+    for extractor in LINK_EXTRACTORS:
+        try: outputs = [extract_links(text, extractor) for _, text in pages]
+        except RuntimeError as e: print(f"{extractor:>10}: skipped ({e})"); continue
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for _, text in pages: extract_links(text, extractor)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if extractor == LINK_EXTRACTOR_BS4: reference = outputs
+        results.append((extractor, best, outputs))
+
+    bs4_time = next((t for name, t, _ in results if name == LINK_EXTRACTOR_BS4), None)
+    print(f"{'extractor':>10} {'seconds':>9} {'MB/s':>8} {'vs bs4':>8} {'links':>8} {'mismatched pages':>17}")
+    for extractor, elapsed, outputs in results:
+        mismatched = [name for (name, _), out, ref in zip(pages, outputs, reference) if out != ref] if reference else []
+        speedup = f"{bs4_time / elapsed:.1f}x" if bs4_time and elapsed else "n/a"
+        print(f"{extractor:>10} {elapsed:9.3f} {total_mb / elapsed if elapsed else 0:8.1f} {speedup:>8} "
+              f"{sum(len(o) for o in outputs):8d} {len(mismatched) if reference else 'n/a':>17}")
+        for name in mismatched[:5]: print(f"{'':>10}   differs from bs4: {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
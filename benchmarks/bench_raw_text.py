@@ -0,0 +1,128 @@
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import htmlizer
+
+# compares htmlizer's Raw Text mode with the tree walk it replaced, on large generated pages:
+#   python benchmarks/bench_raw_text.py --files 4 --mb 10 --workers 1,2,4
+# the old extraction (bs4 find_all + get_text on every element) re-reads the text under every inline ancestor,
+# so it is run on the first file only unless --legacy-files says otherwise. its conversion puts the whole page text on one line
+# per wrapper element, which reportlab lays out very slowly, so it runs in a child process that is killed after --legacy-timeout.
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore magna aliqua".split()
+
+
+def legacy_extract_text(html_filepath):
+    # the previous convert_html_to_pdf_raw extraction, verbatim
+    from bs4 import BeautifulSoup
+    with open(html_filepath, 'r', encoding='utf-8', errors='ignore') as f: html_content = f.read()
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for s in soup(["script", "style"]): s.decompose()
+    text_lines = ['\n' if e.name in ['p','br','div','h1','h2','h3','h4','h5','h6','li','tr'] else e.get_text(separator=' ',strip=True) for e in soup.find_all(True)]
+    full_text = "\n".join([l.strip() for l in ' '.join(text_lines).replace('\n ', '\n').strip().splitlines() if l.strip()])
+    return full_text.split('\n')
+
+
+def legacy_convert(html_filepath, pdf_filepath):
+    doc, styles, story = htmlizer.SimpleDocTemplate(pdf_filepath, pagesize=htmlizer.letter), htmlizer.getSampleStyleSheet(), []
+    for para_text in legacy_extract_text(html_filepath):
+        if para_text.strip(): story.append(htmlizer.Paragraph(htmlizer.xml_escape(para_text), styles['Normal']))
+        story.append(htmlizer.Spacer(1, 0.1 * htmlizer.inch))
+    doc.build(story)
+
+
+def generate_page(path, megabytes, depth, seed):
+    # article markup inside `depth` wrapper elements (main/section/article/table cells...), like a templated site
+    rng = random.Random(seed)
+    wrappers = [("section", ""), ("article", ""), ("main", ""), ("span", " class='w'")] * depth
+    open_tags = "".join(f"<{tag}{attrs}>" for tag, attrs in wrappers[:depth])
+    close_tags = "".join(f"</{tag}>" for tag, _ in reversed(wrappers[:depth]))
+    parts, size, j = [f"<!DOCTYPE html><html><head><title>Large page {seed}</title><style>p {{ margin: 0 }}</style></head><body>{open_tags}"], 0, 0
+    while size < megabytes * 1048576:
+        words = " ".join(rng.choice(WORDS) for _ in range(40))
+        part = (f"<h2>Section {j}</h2><p>{words} <b>bold {j}</b> and <a href='/x/{j}'>a <i>link</i></a> &amp; more.</p>"
+                f"<ul><li>item {j}.1</li><li>item {j}.2 &lt;tag&gt;</li></ul><table><tr><td>{j}</td><td>{words[:30]}</td></tr></table>")
+        if j % 50 == 0: part += "<script>var s = '<p>not text</p>';</script>"
+        parts.append(part); size += len(part); j += 1
+    parts.append(f"{close_tags}</body></html>")
+    with open(path, 'w', encoding='utf-8') as f: f.write("".join(parts))
+
+
+def run_with_timeout(func, args, timeout):
+    # seconds taken, or None if func was still running after timeout
+    process = multiprocessing.get_context("spawn").Process(target=func, args=args)
+    start = time.perf_counter()
+    process.start(); process.join(timeout)
+    if process.is_alive(): process.kill(); process.join(); return None
+    return time.perf_counter() - start
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark htmlizer's Raw Text extraction and parallel conversion on large pages.")
+    parser.add_argument("--files", type=int, default=4, help="generated pages")
+    parser.add_argument("--mb", type=float, default=10, help="size of each page")
+    parser.add_argument("--depth", type=int, default=8, help="wrapper elements around the page content")
+    parser.add_argument("--workers", default="1,2,4", help="process pool sizes for the conversion pass")
+    parser.add_argument("--legacy-files", type=int, default=1, help="files the old extraction and conversion are run on (0 to skip)")
+    parser.add_argument("--legacy-timeout", type=float, default=120, help="seconds before the old conversion is given up on")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="wkhtml_rawbench_")
+    try:
+        files = [os.path.join(work_dir, f"large_{i}.html") for i in range(args.files)]
+        for i, path in enumerate(files): generate_page(path, args.mb, args.depth, i)
+        total_mb = sum(os.path.getsize(path) for path in files) / 1048576
+        print(f"{len(files)} page(s), {total_mb:.1f} MB of HTML, {args.depth} wrapper level(s)\n")
+
+        print(f"{'extraction':<22} {'file':>5} {'seconds':>9} {'MB/s':>7} {'lines':>8} {'words':>10}")
+        parsers = [("lxml target", True)] if htmlizer.lxml_etree is not None else []
+        parsers.append(("stdlib htmlparser", False))
+        for i, path in enumerate(files):
+            mb = os.path.getsize(path) / 1048576
+            new_lines = None
+            for name, use_lxml in parsers:
+                lines, seconds = timed(htmlizer.extract_raw_text, path, use_lxml)
+                new_lines = new_lines or lines
+                print(f"{name:<22} {i:>5} {seconds:9.3f} {mb / seconds:7.1f} {len(lines):8d} {sum(len(l.split()) for l in lines):10d}")
+            if i < args.legacy_files:
+                lines, seconds = timed(legacy_extract_text, path)
+                old_words, new_words = Counter(w for l in lines for w in l.split()), Counter(w for l in new_lines for w in l.split())
+                print(f"{'legacy bs4 find_all':<22} {i:>5} {seconds:9.3f} {mb / seconds:7.1f} {len(lines):8d} {sum(old_words.values()):10d}")
+                print(f"{'':<22} words only in legacy output: {len(set(old_words) - set(new_words))}, only in new: {len(set(new_words) - set(old_words))}, "
+                      f"legacy repeats text {sum(old_words.values()) / max(1, sum(new_words.values())):.1f}x")
+
+        print(f"\n{'conversion':<22} {'files':>5} {'seconds':>9} {'files/s':>8}")
+        for i, path in enumerate(files[:args.legacy_files]):
+            seconds = run_with_timeout(legacy_convert, (path, os.path.join(work_dir, f"legacy_{i}.pdf")), args.legacy_timeout)
+            if seconds is None: print(f"{'legacy, sequential':<22} {1:>5} {f'>{args.legacy_timeout:g}':>9} {'killed':>8}")
+            else: print(f"{'legacy, sequential':<22} {1:>5} {seconds:9.3f} {1 / seconds:8.3f}")
+        for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+            # spawn like htmlizer does, so worker start-up is part of the measurement
+            start = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                results = list(pool.map(htmlizer.convert_html_to_pdf_raw_timed, files, [os.path.join(work_dir, f"new_{workers}_{i}.pdf") for i in range(len(files))]))
+            seconds = time.perf_counter() - start
+            print(f"{f'new, {workers} process(es)':<22} {sum(ok for ok, _ in results):>5} {seconds:9.3f} {len(files) / seconds:8.3f}")
+        if (os.cpu_count() or 1) < 2: print(f"\nonly {os.cpu_count()} cpu available: process pool sizes above 1 cannot show a speedup here.")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+import platform
+import queue
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from wkhtml_engine import DEFAULT_PDF_OPTIONS, WKHTMLTOPDF_EXEC, BatchConverter
+
+# end-to-end benchmarks against a generated site served from localhost, so no network is needed:
+#   python benchmarks/bench_suite.py --pages 300 --links 8 --assets 4 --jobs 1,2,4,8
+#   python benchmarks/bench_suite.py --only crawl,merge --compare
+# every run is appended to benchmarks/results.jsonl; --compare prints the change against the last run with the same settings.
+# sections that need something missing (wkhtmltopdf, htmlizer's packages) are skipped and say why.
+
+SECTIONS = ("crawl", "batch", "htmlizer", "merge")
+DEFAULT_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+# 1x1 transparent png
+PNG_BYTES = bytes.fromhex("89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+                          "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082")
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore magna aliqua".split()
+
+
+class NullLog:
+    # log queue stand-in that drops everything
+    def put(self, msg): pass
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args): pass
+
+
+def generate_site(root, pages, links, assets, page_kb, seed=1):
+    # pages/page_<i>.html form a tree (every page is reachable from index.html) plus `links` random cross links each.
+    # index.html is a copy of page 0, so a full crawl finds pages + 1 urls.
+    # each page references `assets` stylesheets/scripts/images drawn from a shared pool, like a real site's template.
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(root, "pages"), exist_ok=True)
+    os.makedirs(os.path.join(root, "assets"), exist_ok=True)
+    pool = max(assets * 4, 12)
+    for a in range(pool):
+        kind = ("css", "js", "png")[a % 3]
+        with open(os.path.join(root, "assets", f"asset_{a}.{kind}"), 'wb') as f:
+            if kind == "png": f.write(PNG_BYTES)
+            elif kind == "css": f.write((".c%d { margin: %dpx; color: #%06x; }\n" % (a, a, a * 4099) * 200).encode())
+            else: f.write(("var v%d = [%s];\n" % (a, ",".join(str(i) for i in range(500)))).encode())
+    paths = []
+    for i in range(pages):
+        refs = rng.sample(range(pool), min(assets, pool))
+        head = "".join(f'<link rel="stylesheet" href="/assets/asset_{a}.css">' if a % 3 == 0 else
+                       f'<script src="/assets/asset_{a}.js"></script>' if a % 3 == 1 else "" for a in refs)
+        targets = [c for c in (2 * i + 1, 2 * i + 2) if c < pages] + [rng.randrange(pages) for _ in range(links)]
+        body = [f"<h1>Page {i}</h1>"]
+        body += [f'<img src="/assets/asset_{a}.png" alt="">' for a in refs if a % 3 == 2]
+        body += [f'<p><a href="/pages/page_{t}.html">page {t}</a></p>' for t in targets]
+        while sum(len(part) for part in body) < page_kb * 1024:
+            body.append("<p>" + " ".join(rng.choice(WORDS) for _ in range(60)) + "</p>")
+        html = f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>Page {i}</title>{head}</head><body>{''.join(body)}</body></html>"
+        path = os.path.join(root, "pages", f"page_{i}.html")
+        with open(path, 'w', encoding='utf-8') as f: f.write(html)
+        paths.append(path)
+    shutil.copyfile(paths[0], os.path.join(root, "index.html"))
+    return paths
+
+
+def serve_site(root):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=root))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://localhost:{server.server_address[1]}"
+
+
+def bench_crawl(base_url, pages, workers, per_host):
+    from wkhtml_crawler import CRAWLER_DEPENDENCIES_MET, SiteCrawler
+    if not CRAWLER_DEPENDENCIES_MET: return {"skipped": "requests is not installed"}
+
+    def crawl():
+        url_queue = queue.Queue()
+        start = time.perf_counter()
+        # index.html duplicates page 0 on purpose (pages + 1 urls); near-duplicate detection would drop it
+        found = SiteCrawler(base_url + "/index.html", False, 0, NullLog(), url_queue, NullLog(), workers, per_host, near_duplicate_distance=None).run()
+        return found, time.perf_counter() - start, [url_queue.get_nowait()[0] for _ in range(url_queue.qsize())]
+
+    found, seconds, urls = crawl()
+    tracemalloc.start() # separate pass: tracing slows allocation-heavy code down
+    crawl()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"pages_found": found, "expected_pages": pages + 1, "seconds": round(seconds, 3), "pages_per_sec": round(found / seconds, 2),
+            "peak_python_mb": round(peak / 1048576, 2), "urls": urls}
+
+
+def bench_batch(items, work_dir, jobs_levels, wkhtmltopdf, engine):
+    if not (shutil.which(wkhtmltopdf) or os.path.isfile(wkhtmltopdf)): return {"skipped": f"'{wkhtmltopdf}' not found"}
+    results = []
+    for jobs in jobs_levels:
+        out_dir = os.path.join(work_dir, f"batch_j{jobs}")
+        os.makedirs(out_dir)
+        converter = BatchConverter(dict(DEFAULT_PDF_OPTIONS), out_dir, NullLog(), jobs, wkhtmltopdf, engine, retries=0)
+        start = time.perf_counter()
+        succeeded, failed = converter.run(items)
+        seconds = time.perf_counter() - start
+        latency = converter.timing.summary()["latency_seconds"]
+        results.append({"jobs": jobs, "items": len(items), "failed": failed, "seconds": round(seconds, 3),
+                        "pdfs_per_sec": round(succeeded / seconds, 2), "p50": latency["p50"], "p95": latency["p95"]})
+    return {"levels": results}
+
+
+def _import_htmlizer():
+    try:
+        import htmlizer
+        return htmlizer, None
+    except Exception as e: return None, f"htmlizer.py could not be imported ({e})"
+
+
+def bench_htmlizer(files, work_dir, wkhtmltopdf):
+    htmlizer, error = _import_htmlizer()
+    if error: return {"skipped": error}
+    results = {}
+    modes = [("raw", htmlizer.convert_html_to_pdf_raw)]
+    if htmlizer.check_and_configure_wkhtmltopdf(shutil.which(wkhtmltopdf) or wkhtmltopdf): modes.append(("pretty", htmlizer.convert_html_to_pdf_pretty))
+    else: results["pretty"] = {"skipped": f"'{wkhtmltopdf}' not usable by pdfkit"}
+    for mode, convert in modes:
+        out_dir = os.path.join(work_dir, f"htmlizer_{mode}")
+        os.makedirs(out_dir)
+        start, ok = time.perf_counter(), 0
+        for i, path in enumerate(files): ok += bool(convert(path, os.path.join(out_dir, f"{i}.pdf")))
+        seconds = time.perf_counter() - start
+        results[mode] = {"files": len(files), "ok": ok, "seconds": round(seconds, 3), "files_per_sec": round(len(files) / seconds, 2)}
+    return results
+
+
+def bench_merge(work_dir, inputs, pages_per_pdf):
+    htmlizer, error = _import_htmlizer()
+    if error: return {"skipped": error}
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    src_dir = os.path.join(work_dir, "merge_inputs")
+    os.makedirs(src_dir)
+    paths = []
+    for i in range(inputs):
+        path = os.path.join(src_dir, f"{i}.pdf")
+        c = canvas.Canvas(path, pagesize=letter)
+        for p in range(pages_per_pdf):
+            for line in range(40): c.drawString(72, 720 - line * 16, f"input {i} page {p} line {line} " + " ".join(WORDS[:8]))
+            c.showPage()
+        c.save()
+        paths.append(path)
+    output = os.path.join(work_dir, "merged.pdf")
+    tracemalloc.start()
+    start = time.perf_counter()
+    ok = htmlizer.merge_pdfs(paths, output)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"inputs": inputs, "pages": inputs * pages_per_pdf, "ok": bool(ok), "seconds": round(seconds, 3),
+            "output_mb": round(os.path.getsize(output) / 1048576, 2) if os.path.exists(output) else None,
+            "peak_python_mb": round(peak / 1048576, 2)}
+
+
+def git_commit():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError): return None
+
+
+def flatten(value, prefix=""):
+    # {"batch": {"levels": [{"jobs": 2, ...}]}} -> {"batch.levels[0].jobs": 2, ...}, numbers only
+    if isinstance(value, dict): return {k: v for key, item in value.items() for k, v in flatten(item, f"{prefix}.{key}" if prefix else key).items()}
+    if isinstance(value, list): return {k: v for i, item in enumerate(value) for k, v in flatten(item, f"{prefix}[{i}]").items()}
+    return {prefix: value} if isinstance(value, (int, float)) and not isinstance(value, bool) else {}
+
+
+def load_previous(results_path, params):
+    previous = None
+    try:
+        with open(results_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try: record = json.loads(line)
+                except ValueError: continue
+                if record.get("params") == params: previous = record
+    except OSError: pass
+    return previous
+
+
+def print_comparison(previous, current):
+    old, new = flatten(previous["results"]), flatten(current["results"])
+    print(f"\nChange since {previous['timestamp']} (commit {previous.get('commit') or '?'}):")
+    for key in new:
+        if key in old and old[key]:
+            print(f"  {key:<45} {old[key]:>10} -> {new[key]:>10}  ({(new[key] - old[key]) / old[key] * 100:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the crawler, batch converter, htmlizer and PDF merging.")
+    parser.add_argument("--pages", type=int, default=200, help="pages in the synthetic site")
+    parser.add_argument("--links", type=int, default=6, help="random cross links per page (on top of the tree links)")
+    parser.add_argument("--assets", type=int, default=3, help="stylesheets/scripts/images referenced per page")
+    parser.add_argument("--page-kb", type=int, default=20, help="approximate size of each page's text")
+    parser.add_argument("--only", default=",".join(SECTIONS), help=f"comma separated sections to run ({', '.join(SECTIONS)})")
+    parser.add_argument("--crawl-workers", type=int, default=8)
+    parser.add_argument("--crawl-per-host", type=int, default=4)
+    parser.add_argument("--jobs", default="1,2,4", help="concurrency levels for the batch section")
+    parser.add_argument("--batch-items", type=int, default=50, help="urls converted per concurrency level")
+    parser.add_argument("--engine", default="subprocess", choices=("subprocess", "library"))
+    parser.add_argument("--wkhtmltopdf", default=WKHTMLTOPDF_EXEC)
+    parser.add_argument("--htmlizer-files", type=int, default=20, help="files converted per htmlizer mode")
+    parser.add_argument("--merge-inputs", type=int, default=200, help="pdfs merged in the merge section")
+    parser.add_argument("--merge-pages", type=int, default=5, help="pages per merged pdf")
+    parser.add_argument("--results", default=DEFAULT_RESULTS, help="jsonl file runs are appended to")
+    parser.add_argument("--compare", action="store_true", help="compare with the last stored run that used the same settings")
+    parser.add_argument("--no-save", action="store_true", help="don't append this run to --results")
+    args = parser.parse_args(argv)
+
+    sections = [s.strip() for s in args.only.split(",") if s.strip()]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown: parser.error(f"unknown section(s): {', '.join(sorted(unknown))}")
+    jobs_levels = [int(j) for j in args.jobs.split(",") if j.strip()]
+    params = {key: value for key, value in vars(args).items() if key not in ("results", "compare", "no_save")}
+
+    work_dir = tempfile.mkdtemp(prefix="wkhtml_bench_")
+    server = None
+    results = {}
+    try:
+        site_dir = os.path.join(work_dir, "site")
+        files = generate_site(site_dir, args.pages, args.links, args.assets, args.page_kb)
+        server, base_url = serve_site(site_dir)
+        print(f"Synthetic site: {len(files)} page(s) at {base_url} ({work_dir})")
+
+        if "crawl" in sections:
+            results["crawl"] = bench_crawl(base_url, args.pages, args.crawl_workers, args.crawl_per_host)
+            results["crawl"].pop("urls", None)
+            print(f"crawl: {results['crawl']}")
+        if "batch" in sections:
+            urls = [f"{base_url}/pages/page_{i}.html" for i in range(min(args.batch_items, args.pages))]
+            results["batch"] = bench_batch(urls, work_dir, jobs_levels, args.wkhtmltopdf, args.engine)
+            for level in results["batch"].get("levels", []): print(f"batch: {level}")
+            if "skipped" in results["batch"]: print(f"batch: skipped ({results['batch']['skipped']})")
+        if "htmlizer" in sections:
+            results["htmlizer"] = bench_htmlizer(files[:args.htmlizer_files], work_dir, args.wkhtmltopdf)
+            print(f"htmlizer: {results['htmlizer']}")
+        if "merge" in sections:
+            results["merge"] = bench_merge(work_dir, args.merge_inputs, args.merge_pages)
+            print(f"merge: {results['merge']}")
+    finally:
+        if server: server.shutdown(); server.server_close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    record = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(), "python": platform.python_version(),
+              "platform": platform.platform(), "cpus": os.cpu_count(), "params": params, "results": results}
+    if args.compare:
+        previous = load_previous(args.results, params)
+        if previous: print_comparison(previous, record)
+        else: print("\nNo earlier run with the same settings to compare with.")
+    if not args.no_save:
+        with open(args.results, 'a', encoding='utf-8') as f: f.write(json.dumps(record) + "\n")
+        print(f"\nSaved to {args.results}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
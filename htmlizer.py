@@ -1,26 +1,56 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, Listbox, Scrollbar
+from tkinter import filedialog, messagebox
 import customtkinter as ctk
 from tkinterdnd2 import DND_FILES, TkinterDnD
 import threading
 import os
+import re
 import time
+import fnmatch
 import shutil # For shutil.which
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from html.parser import HTMLParser
+from xml.sax.saxutils import escape as xml_escape
 
 # --- pdfkit and wkhtmltopdf ---
 import pdfkit
-from bs4 import BeautifulSoup
+try: from lxml import etree as lxml_etree
+except ImportError: lxml_etree = None
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
-from pypdf import PdfWriter, PdfReader
+from pypdf import PdfReader
+from pypdf.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject, IndirectObject, NameObject,
+                           NullObject, NumberObject, StreamObject, TextStringObject)
+
+from wkhtml_engine import TIMING_REPORT_FILENAME, ITEM_DONE, ITEM_FAILED, ITEM_PENDING, ITEM_RUNNING, ConversionManifest, TimingReport, detach_output, hash_options
+from wkhtml_inputs import InputStore, VirtualListView
+from wkhtml_render_cache import DEFAULT_RENDER_CACHE_DIR, RenderCache
 
 # Global variables for wkhtmltopdf configuration
 WKHTMLTOPDF_PATH = ""
 PDFKIT_CONFIG = None
 
+PRETTY_PDF_OPTIONS = {'page-size':'A4','margin-top':'0.75in','margin-right':'0.75in','margin-bottom':'0.75in','margin-left':'0.75in','encoding':"UTF-8",'no-outline':None,'enable-local-file-access':None}
+# Single PDF + Pretty passes many files to one wkhtmltopdf run; chunk so the command line stays under OS limits (~32k chars on Windows)
+MERGED_CHUNK_MAX_FILES = 200
+MERGED_CHUNK_MAX_CHARS = 24000
+# Raw Text: tags that start a new line, and tags whose content is dropped
+RAW_BLOCK_TAGS = {'p','br','div','h1','h2','h3','h4','h5','h6','li','tr'}
+RAW_SKIPPED_TAGS = {'script','style'}
+RAW_READ_CHUNK = 1 << 20
+# Raw Text files are converted this many at a time in worker processes (reportlab layout is pure python)
+RAW_MAX_WORKERS = os.cpu_count() or 1
+# Scan Directory: default include globs, and how often found files are pushed to the list (whichever comes first)
+SCAN_DEFAULT_INCLUDE = "*.html; *.htm"
+SCAN_CHUNK_SIZE = 2000
+SCAN_FLUSH_SECONDS = 0.25
+# page attributes a page may inherit from its page tree; copied onto each page because merged pages get a new parent
+INHERITED_PAGE_KEYS = ("/Resources", "/MediaBox", "/CropBox", "/Rotate")
+
 def check_and_configure_wkhtmltopdf(manual_path=None):
     global WKHTMLTOPDF_PATH, PDFKIT_CONFIG
     path_to_test = manual_path
@@ -51,17 +81,92 @@ def check_and_configure_wkhtmltopdf(manual_path=None):
         WKHTMLTOPDF_PATH = ""; PDFKIT_CONFIG = None
         return False
 
+def compile_globs(patterns):
+    # "*.html; drafts/*" -> case-insensitive match function for names and root-relative paths, None when empty
+    globs = [g.strip().lower() for g in re.split(r'[;,]', patterns or '') if g.strip()]
+    return re.compile('|'.join(fnmatch.translate(g) for g in globs)).match if globs else None
+
+def scan_html_files(root_dir, include=SCAN_DEFAULT_INCLUDE, exclude=None, cancel_event=None):
+    # walks root_dir with os.scandir and yields (paths, folders scanned so far) in chunks while it goes.
+    # a file is kept when its name or path relative to root_dir matches include and not exclude; excluded folders are not entered
+    include_match, exclude_match = compile_globs(include), compile_globs(exclude)
+    excluded = lambda name, rel: exclude_match is not None and (exclude_match(name) or exclude_match(rel))
+    stack, chunk, dirs_scanned, last_flush = [(root_dir, "")], [], 0, time.monotonic()
+    while stack:
+        if cancel_event is not None and cancel_event.is_set(): return
+        dirpath, rel_prefix = stack.pop()
+        files, subdirs = [], []
+        try:
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    name = entry.name.lower(); rel = rel_prefix + name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not excluded(name, rel): subdirs.append((entry.path, rel + "/"))
+                        elif entry.is_file() and (include_match is None or include_match(name) or include_match(rel)) and not excluded(name, rel):
+                            files.append(entry.path)
+                    except OSError: pass
+        except OSError: pass # unreadable folder, skipped like os.walk does
+        dirs_scanned += 1
+        chunk.extend(sorted(files))
+        stack.extend(sorted(subdirs, reverse=True))
+        if chunk and (len(chunk) >= SCAN_CHUNK_SIZE or time.monotonic() - last_flush >= SCAN_FLUSH_SECONDS):
+            yield chunk, dirs_scanned
+            chunk, last_flush = [], time.monotonic()
+    yield chunk, dirs_scanned
+
+class _RawTextTarget:
+    # single pass over the document: text in document order, a line break at block tags, script/style dropped.
+    # used directly as an lxml parser target, or fed by _RawTextParser
+    def __init__(self): self.pieces, self._text, self._skip = [], [], 0
+
+    def _flush(self):
+        # parsers may deliver one text node in several data() calls
+        if self._text:
+            text = ''.join(self._text).strip(); self._text = []
+            if text and not self._skip: self.pieces.append(text)
+
+    def start(self, tag, attrib=None):
+        self._flush()
+        if tag in RAW_SKIPPED_TAGS: self._skip += 1
+        elif tag in RAW_BLOCK_TAGS: self.pieces.append('\n')
+
+    def end(self, tag):
+        self._flush()
+        if tag in RAW_SKIPPED_TAGS: self._skip = max(0, self._skip - 1)
+        elif tag in RAW_BLOCK_TAGS: self.pieces.append('\n')
+
+    def data(self, data): self._text.append(data)
+
+    def close(self):
+        self._flush()
+        return [l.strip() for l in ' '.join(self.pieces).splitlines() if l.strip()]
+
+
+class _RawTextParser(HTMLParser):
+    def __init__(self, target):
+        super().__init__(convert_charrefs=True)
+        self.target = target
+    def handle_starttag(self, tag, attrs): self.target.start(tag)
+    def handle_endtag(self, tag): self.target.end(tag)
+    def handle_data(self, data): self.target.data(data)
+
+
+def extract_raw_text(html_filepath, use_lxml=lxml_etree is not None):
+    # lines of text for Raw Text mode; the file is parsed in chunks and no tree is built
+    target = _RawTextTarget()
+    if use_lxml: parser = lxml_etree.HTMLParser(target=target, huge_tree=True)
+    else: parser = _RawTextParser(target)
+    with open(html_filepath, 'r', encoding='utf-8', errors='ignore') as f:
+        for chunk in iter(lambda: f.read(RAW_READ_CHUNK), ''): parser.feed(chunk)
+    if use_lxml: return parser.close()
+    parser.close(); return target.close()
+
 def convert_html_to_pdf_raw(html_filepath, pdf_filepath):
     try:
-        with open(html_filepath, 'r', encoding='utf-8', errors='ignore') as f: html_content = f.read()
-        soup = BeautifulSoup(html_content, 'html.parser')
-        for s in soup(["script", "style"]): s.decompose()
-        text_lines = ['\n' if e.name in ['p','br','div','h1','h2','h3','h4','h5','h6','li','tr'] else e.get_text(separator=' ',strip=True) for e in soup.find_all(True)]
-        full_text = "\n".join([l.strip() for l in ' '.join(text_lines).replace('\n ', '\n').strip().splitlines() if l.strip()])
         doc, styles, story = SimpleDocTemplate(pdf_filepath, pagesize=letter), getSampleStyleSheet(), []
-        for para_text in full_text.split('\n'):
-            if para_text.strip(): story.append(Paragraph(para_text.replace('&', '&').replace('<', '<').replace('>', '>'), styles['Normal']))
-            story.append(Spacer(1, 0.1 * inch))
+        for para_text in extract_raw_text(html_filepath):
+            story.append(Paragraph(xml_escape(para_text), styles['Normal'])); story.append(Spacer(1, 0.1 * inch))
         if not story: story.append(Paragraph("No text content found in HTML.", styles['Normal']))
         doc.build(story); return True
     except Exception as e:
@@ -70,11 +175,15 @@ def convert_html_to_pdf_raw(html_filepath, pdf_filepath):
         except: pass
         return False
 
+def convert_html_to_pdf_raw_timed(html_filepath, pdf_filepath):
+    # process pool entry point: (ok, seconds spent converting, not waiting in the pool queue)
+    start = time.monotonic()
+    return convert_html_to_pdf_raw(html_filepath, pdf_filepath), time.monotonic() - start
+
 def convert_html_to_pdf_pretty(html_filepath, pdf_filepath):
     global PDFKIT_CONFIG
     try:
-        options = {'page-size':'A4','margin-top':'0.75in','margin-right':'0.75in','margin-bottom':'0.75in','margin-left':'0.75in','encoding':"UTF-8",'no-outline':None,'enable-local-file-access':None}
-        if PDFKIT_CONFIG: pdfkit.from_file(html_filepath,pdf_filepath,options=options,configuration=PDFKIT_CONFIG); return True
+        if PDFKIT_CONFIG: pdfkit.from_file(html_filepath,pdf_filepath,options=PRETTY_PDF_OPTIONS,configuration=PDFKIT_CONFIG); return True
         else:
             msg="wkhtmltopdf not configured for 'Pretty Text'."
             print(f"{msg} for {html_filepath}")
@@ -87,25 +196,156 @@ def convert_html_to_pdf_pretty(html_filepath, pdf_filepath):
         except:pass
         return False
 
-def merge_pdfs(pdf_filepaths, output_filepath):
+def chunk_for_command_line(html_filepaths):
+    chunks, current, current_chars = [], [], 0
+    for path in html_filepaths:
+        if current and (len(current) >= MERGED_CHUNK_MAX_FILES or current_chars + len(path) + 3 > MERGED_CHUNK_MAX_CHARS):
+            chunks.append(current); current, current_chars = [], 0
+        current.append(path); current_chars += len(path) + 3
+    if current: chunks.append(current)
+    return chunks
+
+def convert_html_files_to_pdf_pretty(html_filepaths, pdf_filepath):
+    # one wkhtmltopdf run with every file as a page object: no per-file process start and no pypdf merge pass
+    if not PDFKIT_CONFIG: print(f"wkhtmltopdf not configured for 'Pretty Text'. Cannot convert {len(html_filepaths)} file(s)."); return False
     try:
-        merger = PdfWriter(); valid_pdfs_merged = 0
-        for pdf_path in pdf_filepaths:
-            if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
+        # a missing image or other media file must not sink the whole chunk, but a page that fails to load must: with
+        # load-error-handling ignore it would come out blank, exit 0 and never reach the file-by-file fallback
+        options = dict(PRETTY_PDF_OPTIONS, **{'load-error-handling':'abort','load-media-error-handling':'ignore'})
+        pdfkit.from_file(list(html_filepaths),pdf_filepath,options=options,configuration=PDFKIT_CONFIG)
+        return os.path.exists(pdf_filepath) and os.path.getsize(pdf_filepath) > 0
+    except Exception as e: print(f"Error PRETTY multi-file conversion ({len(html_filepaths)} files) into {pdf_filepath}: {e}"); return False
+
+class StreamingPdfMerger:
+    # appends pdfs to output_filepath one source at a time. each page and everything it references is written out with
+    # renumbered object ids as soon as it is copied and the source reader is dropped, so memory is bounded by the largest
+    # single input instead of the whole merge. the page tree, one bookmark per source and the xref are written by close().
+    def __init__(self, output_filepath):
+        self.output_filepath = output_filepath
+        self.merged_count = 0
+        self._f = open(output_filepath, 'wb')
+        self._f.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        self._offsets = [0] # object number -> file offset, None while reserved
+        self._pages_id = self._reserve()
+        self._kids, self._bookmarks = [], [] # page object ids; (title, first page id) per source
+        self._lock = threading.Lock()
+        self._pool = None # background merging while conversion is still running, see add_async
+
+    def _reserve(self):
+        self._offsets.append(None); return len(self._offsets) - 1
+
+    def _write(self, obj_id, obj):
+        self._offsets[obj_id] = self._f.tell()
+        self._f.write(b"%d 0 obj\n" % obj_id); obj.write_to_stream(self._f); self._f.write(b"\nendobj\n")
+
+    def _copy(self, obj, id_map, pending):
+        # direct copy with references renumbered; objects referenced for the first time are queued in pending
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key not in id_map: id_map[key] = self._reserve(); pending.append(obj)
+            return IndirectObject(id_map[key], 0, None)
+        if isinstance(obj, StreamObject):
+            copy = EncodedStreamObject() if isinstance(obj, EncodedStreamObject) else DecodedStreamObject()
+            copy._data = obj._data # raw (still encoded) bytes; /Length is rewritten on output
+            copy.update({k: self._copy(v, id_map, pending) for k, v in obj.items() if k != "/Length"})
+            return copy
+        if isinstance(obj, DictionaryObject): return DictionaryObject({k: self._copy(v, id_map, pending) for k, v in obj.items()})
+        if isinstance(obj, ArrayObject): return ArrayObject(self._copy(v, id_map, pending) for v in obj)
+        return obj
+
+    def _inherited(self, page, key):
+        node = page.get("/Parent")
+        while node is not None:
+            node = node.get_object()
+            if key in node: return dict.__getitem__(node, key)
+            node = node.get("/Parent")
+        return None
+
+    def add(self, pdf_path, title=None, delete_after=False):
+        try:
+            if not (os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0): print(f"Skipping non-existent/empty PDF for merging: {pdf_path}"); return False
+            reader = PdfReader(pdf_path)
+            if reader.is_encrypted: reader.decrypt("")
+            pages = list(reader.pages)
+            if not pages: print(f"Skipping empty/invalid PDF: {pdf_path}"); return False
+            with self._lock:
+                kids_before = len(self._kids)
                 try:
-                    reader = PdfReader(pdf_path)
-                    if reader.pages: merger.append(reader); valid_pdfs_merged +=1
-                    else: print(f"Skipping empty/invalid PDF: {pdf_path}")
-                except Exception as e: print(f"Could not read PDF {pdf_path} for merging: {e}")
-            else: print(f"Skipping non-existent/empty PDF for merging: {pdf_path}")
-        if valid_pdfs_merged > 0:
-            with open(output_filepath, 'wb') as f: merger.write(f)
-            merger.close(); return True
-        else:
-            print(f"No valid PDFs to merge into {output_filepath}.")
-            try:c=canvas.Canvas(output_filepath,pagesize=letter);c.drawString(inch,10*inch,"No valid PDF content merged.");c.save()
-            except:pass
-            return False
+                    # pages first, so links between pages of this source point at the copies instead of pulling pages in twice
+                    id_map = {(page.indirect_reference.idnum, page.indirect_reference.generation): self._reserve() for page in pages}
+                    for page in pages:
+                        page_id = id_map[(page.indirect_reference.idnum, page.indirect_reference.generation)]
+                        page_dict = DictionaryObject({k: v for k, v in page.items() if k != "/Parent"})
+                        for key in INHERITED_PAGE_KEYS:
+                            if key not in page_dict:
+                                value = self._inherited(page, key)
+                                if value is not None: page_dict[NameObject(key)] = value
+                        pending = []
+                        copy = self._copy(page_dict, id_map, pending)
+                        copy[NameObject("/Parent")] = IndirectObject(self._pages_id, 0, None)
+                        self._write(page_id, copy); self._kids.append(page_id)
+                        while pending:
+                            ref = pending.pop()
+                            target = ref.get_object()
+                            self._write(id_map[(ref.idnum, ref.generation)], NullObject() if target is None else self._copy(target, id_map, pending))
+                except Exception:
+                    del self._kids[kids_before:]; raise # objects already written stay unreferenced
+                self._bookmarks.append((title or os.path.splitext(os.path.basename(pdf_path))[0], self._kids[kids_before]))
+                self.merged_count += 1
+            return True
+        except Exception as e: print(f"Could not read PDF {pdf_path} for merging: {e}"); return False
+        finally:
+            if delete_after:
+                try: os.remove(pdf_path)
+                except OSError: pass
+
+    def add_async(self, pdf_path, title=None, delete_after=False):
+        # merges on a background thread in submission order; close() waits for it. the future resolves to add()'s result
+        if self._pool is None: self._pool = ThreadPoolExecutor(max_workers=1)
+        return self._pool.submit(self.add, pdf_path, title, delete_after)
+
+    def close(self):
+        # returns True when at least one source was merged; otherwise the file is left for the caller to replace
+        if self._pool: self._pool.shutdown(wait=True); self._pool = None
+        with self._lock:
+            if self._f.closed: return self.merged_count > 0
+            ref = lambda obj_id: IndirectObject(obj_id, 0, None)
+            if self.merged_count:
+                outline_id = self._reserve()
+                item_ids = [self._reserve() for _ in self._bookmarks]
+                for i, (title, page_id) in enumerate(self._bookmarks):
+                    item = DictionaryObject({NameObject("/Title"): TextStringObject(title), NameObject("/Parent"): ref(outline_id),
+                                             NameObject("/Dest"): ArrayObject([ref(page_id), NameObject("/Fit")])})
+                    if i > 0: item[NameObject("/Prev")] = ref(item_ids[i-1])
+                    if i < len(item_ids) - 1: item[NameObject("/Next")] = ref(item_ids[i+1])
+                    self._write(item_ids[i], item)
+                self._write(outline_id, DictionaryObject({NameObject("/Type"): NameObject("/Outlines"), NameObject("/First"): ref(item_ids[0]),
+                                                          NameObject("/Last"): ref(item_ids[-1]), NameObject("/Count"): NumberObject(len(item_ids))}))
+                self._write(self._pages_id, DictionaryObject({NameObject("/Type"): NameObject("/Pages"), NameObject("/Count"): NumberObject(len(self._kids)),
+                                                              NameObject("/Kids"): ArrayObject(ref(k) for k in self._kids)}))
+                catalog_id = self._reserve()
+                self._write(catalog_id, DictionaryObject({NameObject("/Type"): NameObject("/Catalog"), NameObject("/Pages"): ref(self._pages_id),
+                                                          NameObject("/Outlines"): ref(outline_id), NameObject("/PageMode"): NameObject("/UseOutlines")}))
+                for obj_id, offset in enumerate(self._offsets):
+                    if obj_id and offset is None: self._write(obj_id, NullObject()) # reserved by a source that failed half way
+                xref_at = self._f.tell()
+                self._f.write(b"xref\n0 %d\n0000000000 65535 f \n" % len(self._offsets))
+                self._f.write(b"".join(b"%010d 00000 n \n" % offset for offset in self._offsets[1:]))
+                self._f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(self._offsets), catalog_id, xref_at))
+            self._f.close()
+            return self.merged_count > 0
+
+
+def merge_pdfs(pdf_filepaths, output_filepath, titles=None, delete_inputs=False):
+    # titles: bookmark per source (default: file name); delete_inputs removes each source once it is merged
+    try:
+        merger = StreamingPdfMerger(output_filepath)
+        for i, pdf_path in enumerate(pdf_filepaths): merger.add(pdf_path, titles[i] if titles else None, delete_inputs)
+        if merger.close(): return True
+        print(f"No valid PDFs to merge into {output_filepath}.")
+        try:c=canvas.Canvas(output_filepath,pagesize=letter);c.drawString(inch,10*inch,"No valid PDF content merged.");c.save()
+        except:pass
+        return False
     except Exception as e: print(f"Error merging PDFs into {output_filepath}: {e}"); return False
 
 class App(ctk.CTk, TkinterDnD.DnDWrapper):
@@ -115,7 +355,8 @@ class App(ctk.CTk, TkinterDnD.DnDWrapper):
         self.title("HTML to PDF Converter v4")
         self.geometry("850x800") # Increased width for new button
         ctk.set_appearance_mode("system"); ctk.set_default_color_theme("blue")
-        self.html_files = []; self.output_dir = ""; self.output_file = ""
+        self.inputs = InputStore(); self.output_dir = ""; self.output_file = ""
+        self.scan_cancel_event = threading.Event(); self.scan_added = 0
         self.wkhtml_configured = check_and_configure_wkhtmltopdf()
         self._build_ui()
         if not self.wkhtml_configured:
@@ -136,6 +377,20 @@ class App(ctk.CTk, TkinterDnD.DnDWrapper):
 
         self.scan_dir_button = ctk.CTkButton(input_controls_frame, text="Scan Directory (Recursive)", command=self.select_directory_and_scan_recursive)
         self.scan_dir_button.pack(side="left", padx=5, pady=10)
+        self.cancel_scan_button = ctk.CTkButton(input_controls_frame, text="Cancel Scan", command=self.cancel_scan, state="disabled", width=100)
+        self.cancel_scan_button.pack(side="left", padx=5, pady=10)
+
+        # Scan filters: ';' separated globs, matched against file/folder names and paths relative to the scanned folder
+        scan_filter_frame = ctk.CTkFrame(main_frame)
+        scan_filter_frame.pack(pady=(0,10), padx=10, fill="x")
+        ctk.CTkLabel(scan_filter_frame, text="Scan include:").pack(side="left", padx=(10,5), pady=5)
+        self.scan_include_var = tk.StringVar(value=SCAN_DEFAULT_INCLUDE)
+        self.scan_include_entry = ctk.CTkEntry(scan_filter_frame, textvariable=self.scan_include_var, width=200)
+        self.scan_include_entry.pack(side="left", padx=5, pady=5)
+        ctk.CTkLabel(scan_filter_frame, text="Exclude:").pack(side="left", padx=(10,5), pady=5)
+        self.scan_exclude_var = tk.StringVar(value="")
+        self.scan_exclude_entry = ctk.CTkEntry(scan_filter_frame, textvariable=self.scan_exclude_var, width=250, placeholder_text="e.g. node_modules; drafts/*")
+        self.scan_exclude_entry.pack(side="left", padx=5, pady=5, fill="x", expand=True)
         
         # DND registration for the label and the frame it's in.
         input_controls_frame.drop_target_register(DND_FILES)
@@ -147,13 +402,13 @@ class App(ctk.CTk, TkinterDnD.DnDWrapper):
         list_frame = ctk.CTkFrame(main_frame)
         list_frame.pack(pady=10, padx=10, fill="both", expand=True)
         ctk.CTkLabel(list_frame, text="Selected HTML Files:").pack(anchor="w", padx=5)
-        self.listbox = Listbox(list_frame, selectmode=tk.EXTENDED, width=70, height=10, bg="#2E2E2E", fg="white", borderwidth=0, highlightthickness=0) # Darker theme for listbox
-        self.listbox_scrollbar = ctk.CTkScrollbar(list_frame, command=self.listbox.yview) # Use CTkScrollbar
-        self.listbox.configure(yscrollcommand=self.listbox_scrollbar.set)
-        self.listbox_scrollbar.pack(side="right", fill="y")
-        self.listbox.pack(side="left", fill="both", expand=True, padx=(0,5)) # Add padding for scrollbar
-        self.clear_list_button = ctk.CTkButton(main_frame, text="Clear List", command=self.clear_list)
-        self.clear_list_button.pack(pady=(0,10))
+        self.file_view = VirtualListView(list_frame, self.inputs, height=10, bg="#2E2E2E", fg="white", select_bg="#1F538D") # Darker theme, only visible rows are drawn
+        self.file_view.pack(side="left", fill="both", expand=True, padx=(0,5))
+        list_buttons_frame = ctk.CTkFrame(main_frame, fg_color="transparent"); list_buttons_frame.pack(pady=(0,10))
+        self.remove_selected_button = ctk.CTkButton(list_buttons_frame, text="Remove Selected", command=self.remove_selected)
+        self.remove_selected_button.pack(side="left", padx=5)
+        self.clear_list_button = ctk.CTkButton(list_buttons_frame, text="Clear List", command=self.clear_list)
+        self.clear_list_button.pack(side="left", padx=5)
 
         # Conversion options
         options_frame = ctk.CTkFrame(main_frame); options_frame.pack(pady=10, padx=10, fill="x")
@@ -177,6 +432,12 @@ class App(ctk.CTk, TkinterDnD.DnDWrapper):
         self.output_separate_radio.grid(row=1, column=2, padx=(35,0), pady=2, sticky="w")
         self.output_single_radio = ctk.CTkRadioButton(options_frame, text="Single PDF", variable=self.pdf_output_var, value="single", command=self.update_output_options)
         self.output_single_radio.grid(row=2, column=2, padx=(35,0), pady=2, sticky="w")
+        self.incremental_var = tk.BooleanVar(value=False)
+        self.incremental_check = ctk.CTkCheckBox(options_frame, text="Skip unchanged (separate PDFs)", variable=self.incremental_var)
+        self.incremental_check.grid(row=3, column=2, padx=(35,0), pady=2, sticky="w")
+        self.render_cache_var = tk.BooleanVar(value=False)
+        self.render_cache_check = ctk.CTkCheckBox(options_frame, text="Reuse identical renders (cache)", variable=self.render_cache_var)
+        self.render_cache_check.grid(row=4, column=2, padx=(35,0), pady=2, sticky="w")
 
         # Output path
         self.output_path_frame = ctk.CTkFrame(main_frame); self.output_path_frame.pack(pady=10, padx=10, fill="x")
@@ -237,53 +498,60 @@ class App(ctk.CTk, TkinterDnD.DnDWrapper):
         files = filedialog.askopenfilenames(title="Select HTML files", filetypes=(("HTML", "*.html *.htm"), ("All", "*.*")), parent=self)
         if files:
             added = self._add_files_to_list(list(files))
-            self.status_label.configure(text=f"{added if added > 0 else 'No new'} HTML file(s) selected. Total: {len(self.html_files)}")
+            self.status_label.configure(text=f"{added if added > 0 else 'No new'} HTML file(s) selected. Total: {len(self.inputs)}")
     
     def _add_files_to_list(self, file_paths):
-        added_count = 0
-        for f_path in file_paths:
-            if f_path not in self.html_files:
-                self.html_files.append(f_path)
-                self.listbox.insert(tk.END, os.path.basename(f_path))
-                added_count += 1
-        return added_count
+        return len(self.inputs.add_many([(f_path, os.path.basename(f_path)) for f_path in file_paths]))
 
     def select_directory_and_scan_recursive(self):
         directory = filedialog.askdirectory(title="Select Directory to Scan Recursively", parent=self)
         if directory:
             self.set_ui_state(False) # Disable UI
+            self.cancel_scan_button.configure(state="normal")
             self.status_label.configure(text=f"Scanning directory: {directory}...")
             self.progress_bar.configure(mode="indeterminate") # Indicate busy
             self.progress_bar.start()
+            self.scan_cancel_event.clear(); self.scan_added = 0
 
-            scan_thread = threading.Thread(target=self._scan_directory_worker, args=(directory,), daemon=True)
+            scan_thread = threading.Thread(target=self._scan_directory_worker, args=(directory, self.scan_include_var.get(), self.scan_exclude_var.get()), daemon=True)
             scan_thread.start()
 
-    def _scan_directory_worker(self, root_dir):
-        found_paths = []
-        for dirpath, _, filenames in os.walk(root_dir):
-            for filename in filenames:
-                if filename.lower().endswith((".html", ".htm")):
-                    full_path = os.path.join(dirpath, filename)
-                    found_paths.append(full_path)
-        # Schedule UI update back on the main thread
-        self.after(0, self._finalize_recursive_scan, found_paths)
+    def cancel_scan(self):
+        self.scan_cancel_event.set()
+        self.cancel_scan_button.configure(state="disabled"); self.status_label.configure(text="Cancelling scan...")
 
-
-    def _finalize_recursive_scan(self, found_paths):
+    def _scan_directory_worker(self, root_dir, include, exclude):
+        found = 0
+        try:
+            for chunk, dirs_scanned in scan_html_files(root_dir, include, exclude, self.scan_cancel_event):
+                found += len(chunk)
+                # Schedule UI update back on the main thread; callbacks run in order, so the finalize below comes last
+                self.after(0, self._add_scan_chunk, chunk, dirs_scanned, found)
+        except Exception as e: print(f"Scan error in {root_dir}: {e}")
+        self.after(0, self._finalize_recursive_scan, self.scan_cancel_event.is_set())
+
+    def _add_scan_chunk(self, chunk, dirs_scanned, found):
+        self.scan_added += self._add_files_to_list(chunk)
+        if not self.scan_cancel_event.is_set():
+            self.status_label.configure(text=f"Scanning... {dirs_scanned} folder(s), {found} match(es), {self.scan_added} new. Total: {len(self.inputs)}.")
+
+    def _finalize_recursive_scan(self, cancelled):
         self.progress_bar.stop()
         self.progress_bar.configure(mode="determinate")
         self.progress_bar.set(0) # Reset determinate progress bar
-
-        added_count = self._add_files_to_list(found_paths)
+        self.cancel_scan_button.configure(state="disabled")
         
-        self.status_label.configure(text=f"Scan complete. Added {added_count} new HTML file(s). Total: {len(self.html_files)}.")
+        self.status_label.configure(text=f"Scan {'cancelled' if cancelled else 'complete'}. Added {self.scan_added} new HTML file(s). Total: {len(self.inputs)}.")
         self.set_ui_state(True) # Re-enable UI
 
     def clear_list(self):
-        self.html_files.clear(); self.listbox.delete(0, tk.END)
+        self.inputs.clear(); self.file_view.clear_selection()
         self.status_label.configure(text="File list cleared."); self.progress_bar.set(0)
 
+    def remove_selected(self):
+        removed = self.inputs.remove_indices(self.file_view.curselection()); self.file_view.clear_selection()
+        self.status_label.configure(text=f"Removed {removed} file(s). Total: {len(self.inputs)}.")
+
     def update_output_options(self):
         opt = self.pdf_output_var.get()
         show_dir = opt == "separate"
@@ -307,16 +575,18 @@ class App(ctk.CTk, TkinterDnD.DnDWrapper):
         state = "normal" if enabled else "disabled"
         self.select_files_button.configure(state=state)
         self.scan_dir_button.configure(state=state) # New button
-        self.clear_list_button.configure(state=state)
+        self.scan_include_entry.configure(state=state); self.scan_exclude_entry.configure(state=state)
+        self.clear_list_button.configure(state=state); self.remove_selected_button.configure(state=state)
         self.convert_button.configure(state=state)
         self.output_dir_button.configure(state=state); self.output_file_button.configure(state=state)
         self.configure_wkhtml_button.configure(state=state)
         self.raw_radio.configure(state=state); self.output_separate_radio.configure(state=state); self.output_single_radio.configure(state=state)
+        self.incremental_check.configure(state=state); self.render_cache_check.configure(state=state)
         if enabled: self.update_wkhtml_status_ui()
         else: self.pretty_radio.configure(state="disabled")
 
     def start_conversion_thread(self):
-        if not self.html_files: messagebox.showerror("Error", "No HTML files.", parent=self); return
+        if not len(self.inputs): messagebox.showerror("Error", "No HTML files.", parent=self); return
         opt = self.pdf_output_var.get()
         if opt == "separate" and not self.output_dir: messagebox.showerror("Error", "Select output directory.", parent=self); return
         if opt == "single" and not self.output_file: messagebox.showerror("Error", "Select output PDF file.", parent=self); return
@@ -326,38 +596,93 @@ class App(ctk.CTk, TkinterDnD.DnDWrapper):
         threading.Thread(target=self._conversion_worker, daemon=True).start()
 
     def _conversion_worker(self):
-        conv_type, out_opt, total = self.conversion_mode_var.get(), self.pdf_output_var.get(), len(self.html_files)
+        conv_type, out_opt = self.conversion_mode_var.get(), self.pdf_output_var.get()
+        html_files = self.inputs.values(); total = len(html_files)
+        self.inputs.set_statuses(html_files, ITEM_PENDING)
         temp_pdfs, succ_cnt, fail_cnt = [], 0, 0
-        start_tm = time.time(); temp_dir = ""
+        merged_inputs = 0 # inputs that made it into the single pdf
+        manifest, unchanged_cnt = None, 0
+        render_cache, cached_cnt = None, 0
+        start_tm = time.time(); temp_dir = ""; merger = None; pool = None
+        self.timing = TimingReport()
         try:
             target_dir = self.output_dir if out_opt=="separate" else ""
-            if out_opt=="separate": os.makedirs(target_dir,exist_ok=True)
+            if out_opt=="single" and conv_type=="pretty":
+                temp_dir = os.path.join(os.path.dirname(self.output_file) or ".",f"html_pdf_temp_{int(time.time())}")
+                merged_inputs = self._convert_single_pdf_pretty(html_files, temp_dir, self.timing)
+                succ_cnt = 1 if merged_inputs else 0; fail_cnt = total - merged_inputs
+                return
+            if out_opt=="separate":
+                os.makedirs(target_dir,exist_ok=True)
+                if self.incremental_var.get(): manifest = ConversionManifest(target_dir)
             elif out_opt=="single":
                 base_out_dir = os.path.dirname(self.output_file) or "."
                 temp_dir = os.path.join(base_out_dir,f"html_pdf_temp_{int(time.time())}")
                 os.makedirs(temp_dir,exist_ok=True); target_dir = temp_dir
+                merger = StreamingPdfMerger(self.output_file) # each pdf is merged (and its temp file removed) while the next one converts
+            opts_hash = hash_options([conv_type, PRETTY_PDF_OPTIONS if conv_type=="pretty" else None])
+            if self.render_cache_var.get():
+                try: render_cache = RenderCache(DEFAULT_RENDER_CACHE_DIR)
+                except OSError as e_c: print(f"Render cache disabled: {e_c}")
             
-            for i, html_f in enumerate(self.html_files):
+            if conv_type=="raw" and RAW_MAX_WORKERS > 1 and total > 1:
+                # spawn, not fork: tk and this worker thread are already running
+                pool = ProcessPoolExecutor(max_workers=min(RAW_MAX_WORKERS, total), mp_context=multiprocessing.get_context("spawn"))
+
+            jobs = [] # (index, html file, pdf path, manifest fingerprint, pool future or None, render cache key, seconds if reused from the cache)
+            for i, html_f in enumerate(html_files):
                 base = os.path.splitext(os.path.basename(html_f))[0]
                 pdf_n = f"{base}_{i}.pdf" if out_opt=="single" else f"{base}.pdf"
                 pdf_p = os.path.join(target_dir, pdf_n)
-                self.status_label.configure(text=f"Proc {i+1}/{total}: {os.path.basename(html_f)} ({conv_type})")
-                
-                ok = convert_html_to_pdf_raw(html_f,pdf_p) if conv_type=="raw" else convert_html_to_pdf_pretty(html_f,pdf_p)
+                fingerprint = None; file_tm = time.monotonic()
+                if manifest:
+                    unchanged, fingerprint = manifest.check(html_f, opts_hash, pdf_p)
+                    if unchanged:
+                        succ_cnt+=1; unchanged_cnt+=1
+                        self.timing.add(html_f, "unchanged", time.monotonic()-file_tm); self.inputs.set_status(html_f, ITEM_DONE)
+                        continue
+                detach_output(pdf_p)
+                cache_key = render_cache.key_for(html_f, "htmlizer:" + opts_hash, os.path.dirname(os.path.abspath(html_f))) if render_cache else None
+                if cache_key and render_cache.fetch(cache_key, pdf_p):
+                    jobs.append((i, html_f, pdf_p, fingerprint, None, cache_key, time.monotonic()-file_tm)); continue
+                jobs.append((i, html_f, pdf_p, fingerprint, pool.submit(convert_html_to_pdf_raw_timed, html_f, pdf_p) if pool else None, cache_key, None))
+
+            # results are taken in input order so the single pdf keeps it; pooled files convert ahead in the background
+            for i, html_f, pdf_p, fingerprint, future, cache_key, cached_s in jobs:
+                self.status_label.configure(text=f"Proc {i+1}/{total}: {os.path.basename(html_f)} ({conv_type}) - {self.timing.items_per_second():.2f} files/s")
+                self.inputs.set_status(html_f, ITEM_RUNNING)
+                if cached_s is not None: ok, file_s = True, cached_s; cached_cnt+=1
+                elif future:
+                    try: ok, file_s = future.result()
+                    except Exception as e_p: print(f"Error RAW conversion {html_f}: {e_p}"); ok, file_s = False, 0.0
+                else:
+                    file_tm = time.monotonic()
+                    ok = convert_html_to_pdf_raw(html_f,pdf_p) if conv_type=="raw" else convert_html_to_pdf_pretty(html_f,pdf_p)
+                    file_s = time.monotonic()-file_tm
                 
                 if ok and os.path.exists(pdf_p) and os.path.getsize(pdf_p)>0:
+                    self.timing.add(html_f, "ok" if cached_s is None else "cached", file_s, None, os.path.getsize(pdf_p))
                     succ_cnt+=1
-                    if out_opt=="single": temp_pdfs.append(pdf_p)
-                else: fail_cnt+=1; print(f"Fail/Empty: {html_f}")
+                    if cache_key and cached_s is None: render_cache.store(cache_key, pdf_p)
+                    if manifest: manifest.record(html_f, opts_hash, pdf_p, fingerprint)
+                    if out_opt=="single": temp_pdfs.append(pdf_p); merger.add_async(pdf_p, os.path.basename(html_f), delete_after=True)
+                    self.inputs.set_status(html_f, ITEM_DONE)
+                else: fail_cnt+=1; print(f"Fail/Empty: {html_f}"); self.timing.add(html_f, "failed", file_s); self.inputs.set_status(html_f, ITEM_FAILED)
                 self.progress_bar.set((i+1)/total * (0.9 if out_opt=="single" else 1.0))
                 self.update_idletasks()
 
             if out_opt=="single":
                 if temp_pdfs:
-                    self.status_label.configure(text=f"Merging {len(temp_pdfs)} PDFs...")
-                    if merge_pdfs(temp_pdfs, self.output_file): succ_cnt = 1; fail_cnt = total - len(temp_pdfs)
-                    else: self.status_label.configure(text=f"Merge fail: {self.output_file}.",text_color="red"); succ_cnt=0; fail_cnt=total
+                    self.status_label.configure(text=f"Finishing merge of {len(temp_pdfs)} PDFs...")
+                    merge_tm = time.monotonic(); merged = merger.close(); merged_inputs = merger.merged_count
+                    self.timing.extra["merge_seconds"] = round(time.monotonic()-merge_tm, 3) # only the part not overlapped with conversion
+                    if merged: succ_cnt = 1; fail_cnt = total - merged_inputs
+                    else:
+                        self.status_label.configure(text=f"Merge fail: {self.output_file}.",text_color="red"); succ_cnt=0; fail_cnt=total; merged_inputs=0
+                        try:c=canvas.Canvas(self.output_file,pagesize=letter);c.drawString(inch,10*inch,"No valid PDF content merged.");c.save()
+                        except:pass
                 elif total > 0:
+                    merger.close()
                     self.status_label.configure(text="No valid PDFs to merge.",text_color="orange")
                     try:c=canvas.Canvas(self.output_file,pagesize=letter);c.drawString(inch,10*inch,"No PDFs for merge.");c.save()
                     except:pass
@@ -368,20 +693,86 @@ class App(ctk.CTk, TkinterDnD.DnDWrapper):
             messagebox.showerror("Conversion Error", f"Error: {e}", parent=self)
             print(f"Worker error: {e}")
         finally:
+            if pool: pool.shutdown(wait=False, cancel_futures=True)
+            if merger: merger.close() # no-op unless the loop above raised
+            if manifest:
+                try: manifest.save()
+                except OSError as e_m: print(f"Could not write {manifest.path}: {e_m}")
+            if render_cache: print(render_cache.summary())
             if temp_dir and os.path.exists(temp_dir):
                 try: shutil.rmtree(temp_dir); print(f"Cleaned temp: {temp_dir}")
                 except Exception as e_rm: print(f"Err removing temp {temp_dir}: {e_rm}")
             
             dur = time.time() - start_tm
+            self.timing.finish()
+            report_p = os.path.join(self.output_dir if out_opt=="separate" else (os.path.dirname(self.output_file) or "."), TIMING_REPORT_FILENAME)
+            try: self.timing.write(report_p); print(f"{self.timing.summary_line()} Report: {report_p}")
+            except OSError as e_r: print(f"Could not write timing report {report_p}: {e_r}")
             if out_opt == "single":
-                msg = f"Single PDF '{os.path.basename(self.output_file)}'. {len(temp_pdfs)}/{total} merged. Time: {dur:.2f}s" if succ_cnt==1 and os.path.exists(self.output_file) and os.path.getsize(self.output_file)>0 else f"Single PDF fail/empty. {len(temp_pdfs)}/{total} inputs. Time: {dur:.2f}s"
+                msg = f"Single PDF '{os.path.basename(self.output_file)}'. {merged_inputs}/{total} merged. Time: {dur:.2f}s" if succ_cnt==1 and os.path.exists(self.output_file) and os.path.getsize(self.output_file)>0 else f"Single PDF fail/empty. {merged_inputs}/{total} inputs. Time: {dur:.2f}s"
                 col = "green" if succ_cnt==1 and not fail_cnt else "red"
             else:
-                msg = f"{succ_cnt}/{total} PDFs created. Fails: {fail_cnt}. Time: {dur:.2f}s"
+                msg = f"{succ_cnt}/{total} PDFs created{f' ({unchanged_cnt} unchanged)' if unchanged_cnt else ''}{f' ({cached_cnt} from cache)' if cached_cnt else ''}. Fails: {fail_cnt}. Time: {dur:.2f}s ({self.timing.items_per_second():.2f} files/s)"
                 col = "green" if fail_cnt==0 else ("orange" if succ_cnt>0 else "red")
             self.status_label.configure(text=msg, text_color=col)
             self.set_ui_state(True)
 
+    def _convert_single_pdf_pretty(self, html_files, temp_dir, timing):
+        # returns the number of inputs included; temp_dir is only created when chunks or fallbacks need it.
+        # timing gets one record per wkhtmltopdf run (a whole chunk, or a single file after a chunk failed)
+        total = len(html_files)
+        chunks = chunk_for_command_line(html_files)
+        self.status_label.configure(text=f"Converting {total} file(s) in {len(chunks)} wkhtmltopdf run(s)...")
+        run_tm = time.monotonic()
+        if len(chunks) == 1:
+            self.inputs.set_statuses(chunks[0], ITEM_RUNNING)
+            if convert_html_files_to_pdf_pretty(chunks[0], self.output_file):
+                timing.add(f"{total} file(s)", "ok", time.monotonic()-run_tm, None, os.path.getsize(self.output_file))
+                self.inputs.set_statuses(chunks[0], ITEM_DONE)
+                self.progress_bar.set(1.0); return total
+
+        os.makedirs(temp_dir,exist_ok=True)
+        # chunks are merged in the background as they finish, one bookmark per chunk (or per file after a chunk failed)
+        merger = StreamingPdfMerger(self.output_file)
+        chunk_merges, done = [], 0 # (future, inputs in that pdf)
+        try:
+            for ci, chunk in enumerate(chunks):
+                chunk_pdf = os.path.join(temp_dir, f"chunk_{ci}.pdf")
+                self.status_label.configure(text=f"Chunk {ci+1}/{len(chunks)}: {len(chunk)} file(s) (pretty)")
+                run_tm = time.monotonic(); self.inputs.set_statuses(chunk, ITEM_RUNNING)
+                if len(chunks) > 1 and convert_html_files_to_pdf_pretty(chunk, chunk_pdf):
+                    timing.add(f"chunk {ci+1} ({len(chunk)} file(s))", "ok", time.monotonic()-run_tm, None, os.path.getsize(chunk_pdf))
+                    self.inputs.set_statuses(chunk, ITEM_DONE)
+                    title = os.path.basename(chunk[0]) + (f" ... {os.path.basename(chunk[-1])}" if len(chunk) > 1 else "")
+                    chunk_merges.append((merger.add_async(chunk_pdf, title, delete_after=True), len(chunk)))
+                else:
+                    # the multi-object run failed (or already failed above for a single chunk): isolate bad files one by one
+                    print(f"Chunk {ci+1} failed as a whole; converting its {len(chunk)} file(s) individually.")
+                    for fi, html_f in enumerate(chunk):
+                        pdf_p = os.path.join(temp_dir, f"chunk_{ci}_{fi}.pdf"); run_tm = time.monotonic()
+                        if convert_html_to_pdf_pretty(html_f, pdf_p) and os.path.exists(pdf_p) and os.path.getsize(pdf_p)>0:
+                            timing.add(html_f, "ok", time.monotonic()-run_tm, None, os.path.getsize(pdf_p))
+                            chunk_merges.append((merger.add_async(pdf_p, os.path.basename(html_f), delete_after=True), 1))
+                            self.inputs.set_status(html_f, ITEM_DONE)
+                        else: print(f"Fail/Empty: {html_f}"); timing.add(html_f, "failed", time.monotonic()-run_tm); self.inputs.set_status(html_f, ITEM_FAILED)
+                done += len(chunk)
+                self.progress_bar.set(done/total * 0.9); self.update_idletasks()
+        except Exception:
+            merger.close(); raise
+
+        self.status_label.configure(text=f"Finishing merge of {len(chunk_merges)} PDF(s)...")
+        merge_tm = time.monotonic(); merged = merger.close()
+        timing.extra["merge_seconds"] = round(time.monotonic()-merge_tm, 3)
+        if not merged:
+            try: os.remove(self.output_file) # header only, nothing was appended
+            except OSError: pass
+        if not chunk_merges:
+            self.status_label.configure(text="No valid PDFs to merge.",text_color="orange"); return 0
+        if not merged:
+            self.status_label.configure(text=f"Merge fail: {self.output_file}.",text_color="red"); return 0
+        self.progress_bar.set(1.0)
+        return sum(count for future, count in chunk_merges if future.result())
+
 if __name__ == "__main__":
     app = App()
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,269 @@
+import collections
+import email.utils
+import hashlib
+import http.client
+import json
+import os
+import select
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# local http proxy that batch runs point wkhtmltopdf at (--proxy) so stylesheets, scripts, fonts and
+# images shared by many pages are downloaded once. plain http responses are cached on disk with an lru
+# size cap; https goes through CONNECT tunnels and cannot be cached without intercepting tls.
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "wkhtml_gui", "resources")
+DEFAULT_CACHE_MAX_MB = 512
+UPSTREAM_TIMEOUT = 30
+# freshness for cacheable responses that carry no cache headers at all
+DEFAULT_FRESHNESS = 3600
+MAX_HEURISTIC_FRESHNESS = 86400
+STATIC_CONTENT_TYPES = ("text/css", "javascript", "ecmascript", "image/", "font/", "application/font", "application/x-font",
+                        "application/vnd.ms-fontobject", "application/octet-stream")
+STATIC_EXTENSIONS = (".css", ".js", ".mjs", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico", ".bmp",
+                     ".woff", ".woff2", ".ttf", ".otf", ".eot")
+# hop-by-hop headers are never forwarded (rfc 7230 section 6.1)
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailers",
+                      "transfer-encoding", "upgrade", "proxy-connection"}
+STORED_HEADERS = ("content-type", "content-encoding", "etag", "last-modified", "cache-control", "expires", "vary")
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name: directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+def freshness_lifetime(headers, now=None):
+    # seconds a stored response stays fresh, or None when it must not be stored
+    now = now or time.time()
+    cc = parse_cache_control(headers.get("cache-control"))
+    if "no-store" in cc or "private" in cc: return None
+    if "no-cache" in cc: return 0 # storable, but revalidated on every use
+    for name in ("s-maxage", "max-age"):
+        if cc.get(name) is not None:
+            try: return max(0, int(cc[name]))
+            except ValueError: return 0
+    if headers.get("expires"):
+        try: return max(0, int(email.utils.parsedate_to_datetime(headers["expires"]).timestamp() - now))
+        except (TypeError, ValueError): return 0
+    if headers.get("last-modified"):
+        # heuristic freshness: 10% of the resource's age (rfc 7234 section 4.2.2)
+        try: return min(MAX_HEURISTIC_FRESHNESS, max(0, int((now - email.utils.parsedate_to_datetime(headers["last-modified"]).timestamp()) / 10)))
+        except (TypeError, ValueError): pass
+    return DEFAULT_FRESHNESS
+
+
+def is_static_resource(url, content_type):
+    content_type = (content_type or "").lower()
+    if any(marker in content_type for marker in STATIC_CONTENT_TYPES): return True
+    return urlsplit(url).path.lower().endswith(STATIC_EXTENSIONS)
+
+
+class ResourceCache:
+    # url -> response body on disk, evicting least recently used entries past max_bytes
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict() # key -> size, oldest use first
+        self.total_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        existing = []
+        for name in os.listdir(cache_dir):
+            if not name.endswith(".meta"): continue
+            body_path = os.path.join(cache_dir, name[:-5] + ".body")
+            try: existing.append((os.path.getmtime(body_path), name[:-5], os.path.getsize(body_path)))
+            except OSError: self._remove_files(name[:-5])
+        for _, key, size in sorted(existing):
+            self._entries[key] = size; self.total_bytes += size
+        self._evict()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".meta", base + ".body"
+
+    def _remove_files(self, key):
+        for path in self._paths(key):
+            try: os.remove(path)
+            except OSError: pass
+
+    def key_for(self, url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def get(self, url):
+        # returns (meta, body) or None; marks the entry recently used. the files are read under the lock, so another
+        # handler thread evicting, discarding or replacing the entry cannot pull them away halfway through
+        key = self.key_for(url)
+        meta_path, body_path = self._paths(key)
+        with self._lock:
+            if key not in self._entries: return None
+            self._entries.move_to_end(key)
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f: meta = json.load(f)
+                with open(body_path, 'rb') as f: body = f.read()
+                os.utime(body_path)
+            except (OSError, ValueError):
+                self.total_bytes -= self._entries.pop(key, 0); self._remove_files(key); return None
+        return meta, body
+
+    def put(self, url, status, headers, body, lifetime):
+        key = self.key_for(url)
+        meta = {"url": url, "status": status, "headers": {k: v for k, v in headers.items() if k in STORED_HEADERS},
+                "expires_at": time.time() + lifetime}
+        meta_path, body_path = self._paths(key)
+        with self._lock:
+            if len(body) > self.max_bytes: return
+            with open(body_path + ".tmp", 'wb') as f: f.write(body)
+            os.replace(body_path + ".tmp", body_path)
+            with open(meta_path, 'w', encoding='utf-8') as f: json.dump(meta, f)
+            self.total_bytes += len(body) - self._entries.pop(key, 0)
+            self._entries[key] = len(body)
+            self._evict()
+
+    def refresh(self, url, meta, lifetime):
+        meta["expires_at"] = time.time() + lifetime
+        key = self.key_for(url)
+        meta_path, _ = self._paths(key)
+        with self._lock:
+            if key not in self._entries: return # evicted meanwhile; a meta file without its body would be left behind
+            with open(meta_path, 'w', encoding='utf-8') as f: json.dump(meta, f)
+
+    def discard(self, url):
+        key = self.key_for(url)
+        with self._lock:
+            self.total_bytes -= self._entries.pop(key, 0)
+            self._remove_files(key)
+
+    def _evict(self):
+        # caller holds the lock (or is __init__)
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self._remove_files(key)
+
+
+class CachingProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass # wkhtmltopdf issues hundreds of requests per page; stats are reported in summary() instead
+
+    def do_CONNECT(self):
+        # https: blind tunnel, no caching
+        self.server.proxy.count("tunnelled")
+        host, _, port = self.path.rpartition(":")
+        try: upstream = socket.create_connection((host, int(port or 443)), timeout=UPSTREAM_TIMEOUT)
+        except (OSError, ValueError) as e: self.send_error(502, f"CONNECT failed: {e}"); return
+        self.send_response(200, "Connection established"); self.end_headers()
+        self.close_connection = True
+        sockets = [self.connection, upstream]
+        try:
+            while True:
+                readable, _, broken = select.select(sockets, [], sockets, UPSTREAM_TIMEOUT)
+                if broken or not readable: break
+                for sock in readable:
+                    data = sock.recv(65536)
+                    if not data: return
+                    (upstream if sock is self.connection else self.connection).sendall(data)
+        except OSError: pass
+        finally: upstream.close()
+
+    def do_GET(self): self._proxy(cacheable=True)
+    def do_HEAD(self): self._proxy(cacheable=False)
+    def do_POST(self): self._proxy(cacheable=False)
+
+    def _proxy(self, cacheable):
+        url = self.path
+        if not url.startswith("http://"): self.send_error(400, "Only absolute http:// URLs are proxied"); return
+        proxy = self.server.proxy
+        cacheable = cacheable and "authorization" not in {k.lower() for k in self.headers.keys()}
+        cached = proxy.cache.get(url) if cacheable else None
+        if cached and cached[0]["expires_at"] > time.time():
+            proxy.count("hits"); self._send_cached(*cached); return
+
+        request_headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        if cached: # stale: revalidate instead of downloading again
+            if cached[0]["headers"].get("etag"): request_headers["If-None-Match"] = cached[0]["headers"]["etag"]
+            if cached[0]["headers"].get("last-modified"): request_headers["If-Modified-Since"] = cached[0]["headers"]["last-modified"]
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)) if self.command == "POST" else None
+
+        parts = urlsplit(url)
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=UPSTREAM_TIMEOUT)
+        try:
+            conn.request(self.command, (parts.path or "/") + (f"?{parts.query}" if parts.query else ""), body=body, headers=request_headers)
+            response = conn.getresponse()
+            response_headers = {k.lower(): v for k, v in response.getheaders()}
+            if cached and response.status == 304:
+                response.read()
+                lifetime = freshness_lifetime(dict(cached[0]["headers"], **{k: v for k, v in response_headers.items() if k in STORED_HEADERS}))
+                if lifetime is not None: proxy.cache.refresh(url, cached[0], lifetime)
+                proxy.count("revalidated"); self._send_cached(*cached); return
+            data = response.read() if self.command != "HEAD" else b""
+        except (OSError, http.client.HTTPException) as e:
+            proxy.count("errors"); self.send_error(502, f"Upstream error: {e}"); return
+        finally: conn.close()
+
+        lifetime = freshness_lifetime(response_headers)
+        if (cacheable and response.status == 200 and lifetime is not None and "set-cookie" not in response_headers
+                and is_static_resource(url, response_headers.get("content-type"))):
+            proxy.cache.put(url, response.status, response_headers, data, lifetime); proxy.count("misses")
+        else:
+            proxy.count("uncacheable")
+            if cached: proxy.cache.discard(url) # stale copy the origin no longer lets us keep
+        self.send_response(response.status, response.reason)
+        for name, value in response.getheaders():
+            if name.lower() not in HOP_BY_HOP_HEADERS and name.lower() != "content-length": self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if data: self.wfile.write(data)
+
+    def _send_cached(self, meta, data):
+        self.server.proxy.count("bytes_from_cache", len(data))
+        self.send_response(meta["status"])
+        for name, value in meta["headers"].items(): self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD": self.wfile.write(data)
+
+
+class CachingProxy:
+    # owns the listening socket and the cache; start() before the batch, stop() after
+    def __init__(self, cache_dir, max_mb=DEFAULT_CACHE_MAX_MB, host="127.0.0.1", port=0):
+        self.cache = ResourceCache(cache_dir, int(max_mb * 1024 * 1024))
+        self.host, self.port = host, port
+        self.stats = collections.Counter()
+        self._stats_lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self._server.server_address[1]}"
+
+    def count(self, name, amount=1):
+        with self._stats_lock: self.stats[name] += amount
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), CachingProxyHandler)
+        self._server.daemon_threads = True
+        self._server.proxy = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server: self._server.shutdown(); self._server.server_close(); self._server = None
+
+    def summary(self):
+        with self._stats_lock: stats = dict(self.stats)
+        hits = stats.get("hits", 0) + stats.get("revalidated", 0)
+        lookups = hits + stats.get("misses", 0)
+        ratio = f"{100.0 * hits / lookups:.1f}%" if lookups else "n/a"
+        return (f"Resource cache: {hits} hit(s) ({stats.get('revalidated', 0)} revalidated), {stats.get('misses', 0)} miss(es), "
+                f"hit ratio {ratio}, {stats.get('bytes_from_cache', 0) / 1048576:.1f} MB served from cache, "
+                f"{stats.get('uncacheable', 0)} uncacheable, {stats.get('tunnelled', 0)} https tunnel(s), {stats.get('errors', 0)} error(s); "
+                f"{self.cache.total_bytes / 1048576:.1f}/{self.cache.max_bytes / 1048576:.0f} MB used.")
@@ -0,0 +1,747 @@
+import collections
+import email.utils
+import gzip
+import hashlib
+import html
+import io
+import math
+import queue
+import re
+import sqlite3
+import threading
+import time
+import zlib
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from html.parser import HTMLParser
+from urllib.parse import quote, unquote_plus, urldefrag, urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    CRAWLER_DEPENDENCIES_MET = True
+except ImportError:
+    CRAWLER_DEPENDENCIES_MET = False
+
+# optional link extractor back ends
+try: from bs4 import BeautifulSoup
+except ImportError: BeautifulSoup = None
+try: from lxml import etree as lxml_etree
+except ImportError: lxml_etree = None
+
+CRAWLER_USER_AGENT = "WkHtmlToPdfGUI-Crawler/1.0"
+CRAWL_REQUEST_TIMEOUT = 10
+# fetches in flight at once, and the cap per host (also the keep-alive pool size per host)
+DEFAULT_CRAWL_WORKERS = 8
+DEFAULT_CRAWL_PER_HOST = 4
+# politeness: hosts get DEFAULT_CRAWL_DELAY seconds between fetches unless robots.txt asks for more (Crawl-delay or
+# Request-rate). a 429/503 pushes the host back by its Retry-After (or RATE_LIMIT_BACKOFF) and doubles its delay
+DEFAULT_CRAWL_DELAY = 0.0
+RATE_LIMIT_BACKOFF = 10.0
+RATE_LIMIT_MAX_DELAY = 60.0
+RATE_LIMIT_RETRIES = 3 # times one url is put back after a 429/503 before it counts as failed
+SCHEDULER_POLL = 0.5 # longest the crawl loop sleeps while hosts are waiting out their delay or sitemaps are read
+# sitemap seeding: sitemaps read per crawl, and with a page limit, how many sitemap urls are queued per wanted page
+SITEMAP_MAX_FILES = 1000
+SITEMAP_SEED_FACTOR = 2
+SITEMAP_BATCH = 500
+# namespaces of the sitemap protocol (and none, which some generators write); <loc>s of extensions (image:, video:) are ignored
+SITEMAP_NAMESPACES = ("http://www.sitemaps.org/schemas/sitemap/0.9", "http://www.google.com/schemas/sitemap/0.9", "")
+# crawl state is committed to disk at least this often (seconds / changed rows)
+CHECKPOINT_INTERVAL = 2.0
+CHECKPOINT_MAX_CHANGES = 500
+
+# link extractors: stdlib streaming parser, regex pre-pass, lxml parser target, or the original BeautifulSoup tree.
+# see benchmarks/bench_link_extraction.py; lxml is used when installed, otherwise the stdlib parser
+LINK_EXTRACTOR_HTMLPARSER = "htmlparser"
+LINK_EXTRACTOR_REGEX = "regex"
+LINK_EXTRACTOR_LXML = "lxml"
+LINK_EXTRACTOR_BS4 = "bs4"
+LINK_EXTRACTORS = (LINK_EXTRACTOR_HTMLPARSER, LINK_EXTRACTOR_REGEX, LINK_EXTRACTOR_LXML, LINK_EXTRACTOR_BS4)
+DEFAULT_LINK_EXTRACTOR = LINK_EXTRACTOR_LXML if lxml_etree is not None else LINK_EXTRACTOR_HTMLPARSER
+
+# url states in the crawl store; an alias is another url of a page already fetched (redirect target, rel=canonical),
+# a duplicate a page whose text is a near-duplicate of one already found
+URL_QUEUED, URL_IN_FLIGHT, URL_HTML, URL_SKIPPED, URL_ALIAS, URL_DUPLICATE = 0, 1, 2, 3, 4, 5
+
+# query parameters kept by default: they usually select different content (pagination, article ids, searches)
+DEFAULT_SIGNIFICANT_PARAMS = ("page", "p", "pg", "paged", "start", "offset", "id", "q")
+# never significant, even when every other parameter is kept
+TRACKING_PARAM_RE = re.compile(r'^(utm_\w+|fbclid|gclid|dclid|msclkid|mc_[ce]id|_ga|_hs\w+|ref|sessionid|phpsessid|jsessionid|sid)$', re.I)
+INDEX_PAGE_RE = re.compile(r'/(?:index|default)\.(?:html?|php|aspx?|jsp)$', re.I)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+PERCENT_ESCAPE_RE = re.compile(r'%([0-9A-Fa-f]{2})')
+UNRESERVED_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+# simhash near-duplicate detection: pages whose 64-bit text fingerprints differ in at most this many bits are
+# duplicates. the fingerprint is indexed in SIMHASH_BANDS 16-bit bands, so distances up to SIMHASH_BANDS-1 are always found
+DEFAULT_NEAR_DUPLICATE_DISTANCE = 3
+SIMHASH_BANDS = 4
+SIMHASH_MIN_WORDS = 50 # shorter pages are never called duplicates
+# only shingles starting with one in this many distinct words are hashed; the choice depends on the word alone, so two
+# similar pages sample the same shingles (about 3x less hashing than every shingle)
+SIMHASH_SAMPLE = 4
+SIMHASH_MIN_SHINGLES = 8
+
+
+def get_base_domain_for_scope(netloc):
+    parts = netloc.split('.')
+    if not parts or not parts[0]: return netloc
+    if len(parts) == 1 or all(part.isdigit() for part in parts): return netloc
+    common_slds = {'co', 'com', 'org', 'net', 'ac', 'edu', 'gov', 'mil', 'ne', 'or'}
+    if len(parts) > 2 and parts[-2] in common_slds: return '.'.join(parts[-3:])
+    elif len(parts) >= 2: return '.'.join(parts[-2:])
+    else: return netloc
+
+
+class _HrefCollector(HTMLParser):
+    # collects <a href> values without building a tree
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'a': return
+        href = None
+        for name, value in attrs: # last duplicate wins, like BeautifulSoup
+            if name == 'href': href = value if value is not None else ''
+        if href is not None: self.hrefs.append(href)
+
+    handle_startendtag = handle_starttag
+
+
+class _LxmlHrefTarget:
+    # lxml parser target: start-tag events only, no tree is kept
+    def __init__(self): self.hrefs = []
+    def start(self, tag, attrib):
+        if tag == 'a' and 'href' in attrib: self.hrefs.append(attrib['href'])
+    def end(self, tag): pass
+    def data(self, data): pass
+    def close(self): return self.hrefs
+
+
+# comments and raw-text elements are dropped before the regex pass so it only sees real tags
+_NON_MARKUP_RE = re.compile(r'<!--.*?-->|<(script|style|textarea|title)\b[^>]*>.*?</\1\s*>', re.I | re.S)
+_A_TAG_RE = re.compile(r'<a(?=[\s/>])([^>]*)>', re.I)
+_HREF_ATTR_RE = re.compile(r'''(?:^|[\s/"'])href(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?(?=[\s/>]|$)''', re.I)
+_LINK_TAG_RE = re.compile(r'<link(?=[\s/>])([^>]*)>', re.I)
+_ATTR_RE = re.compile(r'''([^\s"'=<>/`]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+))''')
+# site chrome shared by every page is left out of the text fingerprint, as are tags
+_BOILERPLATE_RE = re.compile(r'<(nav|header|footer|aside)\b[^>]*>.*?</\1\s*>', re.I | re.S)
+_TAG_RE = re.compile(r'<[^>]*>')
+_WORD_RE = re.compile(r'\w+')
+
+
+def extract_links(html_text, extractor=DEFAULT_LINK_EXTRACTOR):
+    # raw href values of <a> tags in document order; every extractor returns the same list for well-formed pages
+    if extractor == LINK_EXTRACTOR_HTMLPARSER:
+        collector = _HrefCollector(); collector.feed(html_text); collector.close()
+        return collector.hrefs
+    if extractor == LINK_EXTRACTOR_REGEX:
+        hrefs = []
+        for tag in _A_TAG_RE.finditer(_NON_MARKUP_RE.sub('', html_text)):
+            matches = list(_HREF_ATTR_RE.finditer(tag.group(1)))
+            if not matches: continue
+            quoted_dq, quoted_sq, bare = matches[-1].groups()
+            value = next((v for v in (quoted_dq, quoted_sq, bare) if v is not None), '')
+            hrefs.append(html.unescape(value))
+        return hrefs
+    if extractor == LINK_EXTRACTOR_LXML and lxml_etree is not None:
+        parser = lxml_etree.HTMLParser(target=_LxmlHrefTarget())
+        parser.feed(html_text)
+        return parser.close()
+    if extractor == LINK_EXTRACTOR_BS4 and BeautifulSoup is not None:
+        soup = BeautifulSoup(html_text, 'html.parser')
+        return [link['href'] for link in soup.find_all('a', href=True)]
+    if extractor in LINK_EXTRACTORS: raise RuntimeError(f"Link extractor '{extractor}' needs a package that is not installed.")
+    raise ValueError(f"Unknown link extractor '{extractor}'. Choose from: {', '.join(LINK_EXTRACTORS)}")
+
+
+def extract_canonical(html_text):
+    # href of the page's <link rel="canonical">, or None
+    end = re.search(r'<body[\s>]', html_text, re.I)
+    for tag in _LINK_TAG_RE.finditer(_NON_MARKUP_RE.sub('', html_text[:end.start() if end else 65536])):
+        attrs = {m.group(1).lower(): html.unescape(next(v for v in m.groups()[1:] if v is not None)) for m in _ATTR_RE.finditer(tag.group(1))}
+        if "canonical" in attrs.get("rel", "").lower().split() and attrs.get("href", "").strip(): return attrs["href"].strip()
+    return None
+
+
+def page_simhash(html_text):
+    # 64-bit simhash of the page's visible text over sampled 3-word shingles; None for pages too short to compare
+    text = _TAG_RE.sub(' ', _BOILERPLATE_RE.sub(' ', _NON_MARKUP_RE.sub(' ', html_text)))
+    words = _WORD_RE.findall(html.unescape(text).lower())
+    if len(words) < SIMHASH_MIN_WORDS: return None
+    anchors = {word for word in set(words) if zlib.crc32(word.encode('utf-8')) % SIMHASH_SAMPLE == 0}
+    shingles = {' '.join(words[i:i + 3]) for i in range(len(words) - 2) if words[i] in anchors}
+    if len(shingles) < SIMHASH_MIN_SHINGLES: return None
+    bits = ''.join([format(int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big'), '064b') for shingle in shingles])
+    half = len(shingles) / 2
+    # bit i is set when most shingle hashes have it set; a strided slice of the joined bit strings is one bit's column
+    return int(''.join('1' if bits[i::64].count('1') > half else '0' for i in range(64)), 2)
+
+
+def simhash_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class RobotsDisallowed(Exception):
+    pass
+
+
+class HostRateLimited(Exception):
+    # the host answered 429/503; retry_after is seconds, None when it did not say
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}" + (f", retry after {retry_after:g}s" if retry_after else ""))
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    if not value: return None
+    try: return max(0.0, float(value))
+    except ValueError: pass
+    try: return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError): return None
+
+
+_FRACTIONAL_DELAY_RE = re.compile(r'^(\s*crawl-delay\s*:\s*)(\d*\.\d+)', re.I)
+
+
+def parse_robots(robots_url, text):
+    # RobotFileParser only reads whole-second Crawl-delays; fractional ones are rounded up rather than ignored
+    robots = RobotFileParser(robots_url)
+    robots.parse([_FRACTIONAL_DELAY_RE.sub(lambda m: m.group(1) + str(math.ceil(float(m.group(2)))), line) for line in text.splitlines()])
+    return robots
+
+
+def robots_delay(robots, user_agent=CRAWLER_USER_AGENT):
+    # seconds between fetches asked for by robots.txt (Crawl-delay, or Request-rate n/s), 0 if neither is set
+    delay = robots.crawl_delay(user_agent) or 0
+    rate = robots.request_rate(user_agent)
+    if rate and rate.requests: delay = max(delay, rate.seconds / rate.requests)
+    return float(delay)
+
+
+class PolitenessScheduler:
+    # per-host politeness: the crawl loop only starts fetches for hosts that are ready (one at a time for a host with a
+    # delay, else up to max_per_host; one at a time while a host's robots.txt is not known yet), and each request waits
+    # its turn (wait_turn) so requests to a host with a delay are at least delay seconds apart
+    def __init__(self, max_per_host, min_delay=DEFAULT_CRAWL_DELAY, wait_for_robots=True):
+        self.max_per_host = max(1, max_per_host)
+        self.min_delay = max(0.0, min_delay or 0.0)
+        self.wait_for_robots = wait_for_robots
+        self._delays = {} # host -> seconds, once robots.txt is known
+        self._in_flight = collections.Counter()
+        self._next_start = {} # host -> monotonic time before which it gets no new fetch
+        self._lock = threading.Lock() # set_delay is called from fetch threads
+
+    def set_delay(self, host, seconds, last_request=None):
+        # last_request: monotonic time of a request already sent (robots.txt), the next one waits for it too
+        with self._lock:
+            delay = self._delays[host] = max(self.min_delay, seconds or 0.0)
+            if last_request is not None and delay: self._next_start[host] = max(self._next_start.get(host, 0.0), last_request + delay)
+
+    def delay(self, host):
+        with self._lock: return self._delays.get(host, self.min_delay)
+
+    def _ready(self, host, now):
+        # caller holds the lock
+        if self._next_start.get(host, 0.0) > now: return False
+        if host not in self._delays and self.wait_for_robots: limit = 1
+        else: limit = 1 if self._delays.get(host, self.min_delay) > 0 else self.max_per_host
+        return self._in_flight[host] < limit
+
+    def busy_hosts(self):
+        now = time.monotonic()
+        with self._lock: return {host for host in set(self._in_flight) | set(self._next_start) if not self._ready(host, now)}
+
+    def try_start(self, host):
+        # claims a fetch slot for host if it is ready
+        with self._lock:
+            if not self._ready(host, time.monotonic()): return False
+            self._in_flight[host] += 1
+            return True
+
+    def wait_turn(self, host):
+        # called on the thread about to send a request to host: sleeps out the host's delay, then books the next turn
+        while True:
+            with self._lock:
+                now = time.monotonic(); start = self._next_start.get(host, 0.0)
+                if start <= now:
+                    delay = self._delays.get(host, self.min_delay)
+                    if delay: self._next_start[host] = now + delay
+                    return
+            time.sleep(start - now)
+
+    def finished(self, host):
+        with self._lock:
+            self._in_flight[host] -= 1
+            if self._in_flight[host] <= 0: del self._in_flight[host]
+
+    def back_off(self, host, seconds):
+        # after a 429/503: nothing for seconds, and the host's delay doubled from then on
+        with self._lock:
+            self._next_start[host] = max(self._next_start.get(host, 0.0), time.monotonic() + seconds)
+            self._delays[host] = min(RATE_LIMIT_MAX_DELAY, max(1.0, 2 * self._delays.get(host, self.min_delay)))
+
+    def seconds_until_ready(self):
+        # until the next host waiting out its delay may start again, or None if none is waiting
+        now = time.monotonic()
+        with self._lock: waits = [start - now for start in self._next_start.values() if start > now]
+        return min(waits) if waits else None
+
+
+def open_sitemap(session, url):
+    # streams a sitemap (xml, gzipped xml, or plain text with one url per line) without loading it into memory;
+    # returns (response, binary file object). Content-Encoding gzip is undone by urllib3, .xml.gz files by their magic bytes
+    response = session.get(url, timeout=CRAWL_REQUEST_TIMEOUT, stream=True)
+    try:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        response.raw.auto_close = False # the buffered reader on top must see eof, not a closed file
+        stream = io.BufferedReader(response.raw)
+        if stream.peek(2)[:2] == b'\x1f\x8b': stream = io.BufferedReader(gzip.GzipFile(fileobj=stream))
+        return response, stream
+    except Exception: response.close(); raise
+
+
+def iter_sitemap(stream):
+    # ("url" | "sitemap", loc) for each <url>/<sitemap> entry of a sitemap or sitemap index, parsed incrementally
+    if stream.peek(64).lstrip().removeprefix(b'\xef\xbb\xbf').lstrip()[:1] != b'<': # a utf-8 bom (iis/.net sitemaps) is not text
+        for line in stream:
+            url = line.decode('utf-8', 'replace').strip().lstrip('\ufeff')
+            if url.startswith(('http://', 'https://')): yield "url", url
+        return
+    root = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if root is None: root = elem; continue
+        if event != "end": continue
+        namespace, _, tag = elem.tag[1:].rpartition('}') if elem.tag.startswith('{') else ("", "", elem.tag)
+        if tag not in ("url", "sitemap") or namespace not in SITEMAP_NAMESPACES: continue
+        loc = elem.find(f"{{{namespace}}}loc" if namespace else "loc") # the entry's own <loc>, not an <image:loc> inside it
+        if loc is not None and (loc.text or "").strip(): yield tag, loc.text.strip()
+        root.clear() # entries already read are dropped, so memory stays flat on 50,000-url sitemaps
+
+
+def page_hints(content_length, link_count):
+    # cost hints passed to the converter with every url found (see wkhtml_engine.estimate_item_cost)
+    return {key: value for key, value in (("content_length", content_length), ("links", link_count)) if value is not None}
+
+
+def normalize_escapes(text):
+    # rfc 3986 percent-encoding normalisation: escaped unreserved characters are decoded, other escapes upper-cased and
+    # left escaped (%2F stays a character of its segment, %E9 stays the byte it is). characters a url may not contain
+    # (spaces, non-ascii) are escaped the way requests sends them
+    text = quote(text, safe="%/:@!$&'()*+,;=~?[]")
+    return PERCENT_ESCAPE_RE.sub(lambda m: chr(int(m.group(1), 16)) if chr(int(m.group(1), 16)) in UNRESERVED_CHARS else "%" + m.group(1).upper(), text)
+
+
+def crawl_host(url):
+    # lower-case host without the default port: the key politeness delays and robots.txt are kept under, however a url spells it
+    parsed = urlsplit(url.strip())
+    host = (parsed.hostname or "").rstrip(".")
+    try: port = parsed.port
+    except ValueError: port = None
+    if ":" in host: host = f"[{host}]" # ipv6 literal
+    return host if port is None or port == DEFAULT_PORTS.get(parsed.scheme.lower()) else f"{host}:{port}"
+
+
+def crawl_fetch_url(url):
+    # the url as it is requested: only the fragment goes, dropped parameters and index pages are kept (see UrlCanonicalizer)
+    return urldefrag(url.strip())[0]
+
+
+class UrlCanonicalizer:
+    # maps the spellings of one page's url to one key: lower-case scheme and host, no default port, credentials or
+    # fragment, normalised percent-encoding, index pages folded into their directory and only significant query parameters, sorted.
+    # the key only tells whether a page was seen already; pages are fetched from their own url (crawl_fetch_url)
+    def __init__(self, keep_params=DEFAULT_SIGNIFICANT_PARAMS, fold_index_pages=True, lowercase_paths=False):
+        # keep_params: parameter names kept in the query, "*" for all but tracking parameters.
+        # lowercase_paths is for servers with case-insensitive paths (iis)
+        self.keep_params = {name.strip().lower() for name in keep_params if name.strip()}
+        self.keep_all = "*" in self.keep_params
+        self.fold_index_pages = fold_index_pages
+        self.lowercase_paths = lowercase_paths
+
+    def significant(self, name):
+        if TRACKING_PARAM_RE.match(name): return False
+        return self.keep_all or name.lower() in self.keep_params
+
+    def canonicalize(self, url):
+        # None for urls that cannot be fetched (no host, bad port)
+        parsed = urlsplit(url.strip())
+        scheme = parsed.scheme.lower()
+        if not (parsed.hostname or "").rstrip("."): return None
+        try: parsed.port
+        except ValueError: return None
+        netloc = crawl_host(url)
+        path = parsed.path.lower() if self.lowercase_paths else parsed.path
+        path = urljoin("/", normalize_escapes(path)) # resolves . and .. segments
+        if self.fold_index_pages: path = INDEX_PAGE_RE.sub("/", path)
+        # parameters stay as written apart from their escapes, so values in other encodings keep their bytes
+        query = sorted(normalize_escapes(param) for param in parsed.query.split("&") if param and self.significant(unquote_plus(param.split("=", 1)[0])))
+        return urlunsplit((scheme, netloc, path, "&".join(query), ""))
+
+
+def normalize_crawl_url(url, canonicalizer=None):
+    return (canonicalizer or UrlCanonicalizer()).canonicalize(url)
+
+
+class CrawlStore:
+    # frontier and visited index in sqlite, so a crawl can resume after a crash and memory stays flat on huge sites.
+    # ":memory:" gives the same behaviour without persistence. only the crawl thread touches the store.
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        if path != ":memory:": self.conn.execute("PRAGMA journal_mode=WAL"); self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS crawl_meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, state INTEGER NOT NULL, final_url TEXT)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS urls_state ON urls (state)")
+        # page size and link count, replayed on resume as scheduling hints for the converter
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(urls)")}
+        for column in ("content_length", "link_count"):
+            if column not in columns: self.conn.execute(f"ALTER TABLE urls ADD COLUMN {column} INTEGER")
+        # url is the canonical key (see UrlCanonicalizer); fetch_url the url the page is requested from (null: the key)
+        if "fetch_url" not in columns: self.conn.execute("ALTER TABLE urls ADD COLUMN fetch_url TEXT")
+        # host of queued urls, so the politeness scheduler can pass over hosts that are waiting out their delay
+        if "host" not in columns:
+            self.conn.execute("ALTER TABLE urls ADD COLUMN host TEXT")
+            rows = self.conn.execute("SELECT url FROM urls WHERE state IN (?, ?)", (URL_QUEUED, URL_IN_FLIGHT)).fetchall()
+            self.conn.executemany("UPDATE urls SET host=? WHERE url=?", ((urlsplit(url).netloc, url) for url, in rows))
+        # text fingerprints of the pages found, looked up by band (see find_near_duplicate)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS page_simhash (url TEXT PRIMARY KEY, simhash INTEGER NOT NULL, "
+                          + ", ".join(f"b{i} INTEGER NOT NULL" for i in range(SIMHASH_BANDS)) + ")")
+        for i in range(SIMHASH_BANDS): self.conn.execute(f"CREATE INDEX IF NOT EXISTS page_simhash_b{i} ON page_simhash (b{i})")
+        self.conn.commit()
+        self._changes = 0
+        self._last_checkpoint = time.monotonic()
+
+    def open_crawl(self, start_url):
+        # returns True when this store already holds a crawl of start_url; a different crawl is discarded
+        row = self.conn.execute("SELECT value FROM crawl_meta WHERE key='start_url'").fetchone()
+        if row and row[0] == start_url:
+            self.conn.execute("UPDATE urls SET state=? WHERE state=?", (URL_QUEUED, URL_IN_FLIGHT)) # fetches lost in the crash
+            self.conn.commit(); return True
+        self.conn.execute("DELETE FROM urls"); self.conn.execute("DELETE FROM page_simhash")
+        self.conn.execute("DELETE FROM crawl_meta")
+        self.conn.execute("INSERT OR REPLACE INTO crawl_meta (key, value) VALUES ('start_url', ?)", (start_url,))
+        self.conn.commit(); return False
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM crawl_meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO crawl_meta (key, value) VALUES (?, ?)", (key, value))
+        self._changes += 1
+
+    def add_urls(self, urls):
+        # (canonical key, fetch url) pairs; ignores keys already queued or visited and returns how many were new
+        cursor = self.conn.executemany("INSERT OR IGNORE INTO urls (url, state, host, fetch_url) VALUES (?, ?, ?, ?)",
+                                       ((key, URL_QUEUED, urlsplit(key).netloc, fetch_url) for key, fetch_url in urls))
+        added = max(0, cursor.rowcount)
+        self._changes += added
+        return added
+
+    def take_queued(self, limit, skip_hosts=(), accept=None):
+        # (key, fetch url) of the oldest queued urls first (breadth-first), marked in flight. urls of skip_hosts, and of
+        # hosts accept(host) turns down, stay queued; a few times limit rows are looked at so one busy host cannot hide the others
+        skip_hosts = list(skip_hosts)[:500] # sqlite caps bound parameters; accept() still filters the rest
+        where = f" AND host NOT IN ({', '.join('?' * len(skip_hosts))})" if skip_hosts else ""
+        rows = self.conn.execute(f"SELECT url, COALESCE(fetch_url, url), host FROM urls WHERE state=?{where} ORDER BY rowid LIMIT ?",
+                                 [URL_QUEUED] + skip_hosts + [limit * 4]).fetchall()
+        urls = []
+        for key, fetch_url, host in rows:
+            if len(urls) >= limit: break
+            if accept is None or accept(host): urls.append((key, fetch_url))
+        self.conn.executemany("UPDATE urls SET state=? WHERE url=?", ((URL_IN_FLIGHT, key) for key, _ in urls))
+        self._changes += len(urls)
+        return urls
+
+    def requeue(self, url):
+        self.conn.execute("UPDATE urls SET state=? WHERE url=?", (URL_QUEUED, url))
+        self._changes += 1
+
+    def mark_done(self, url, final_url=None, hints=None, state=None):
+        # final_url is set for html pages; None records a skipped or failed url
+        hints = hints or {}
+        if state is None: state = URL_HTML if final_url else URL_SKIPPED
+        self.conn.execute("UPDATE urls SET state=?, final_url=?, content_length=?, link_count=? WHERE url=?",
+                          (state, final_url, hints.get("content_length"), hints.get("links"), url))
+        self._changes += 1
+
+    def claim_aliases(self, urls):
+        # records other urls of a page being added (where it redirected to, its rel=canonical) as visited.
+        # False, claiming nothing, when one of them was fetched or claimed already: the page is a duplicate
+        for url in urls:
+            row = self.conn.execute("SELECT state FROM urls WHERE url=?", (url,)).fetchone()
+            if row and row[0] not in (URL_QUEUED, URL_SKIPPED): return False
+        self.conn.executemany("INSERT OR REPLACE INTO urls (url, state) VALUES (?, ?)", ((url, URL_ALIAS) for url in urls))
+        self._changes += len(urls)
+        return True
+
+    def find_near_duplicate(self, simhash, max_distance):
+        # (url, distance) of a page whose fingerprint is within max_distance bits, or None. with SIMHASH_BANDS bands at
+        # least one band is identical for any distance below SIMHASH_BANDS, so only those rows are compared
+        bands = [(simhash >> (16 * i)) & 0xFFFF for i in range(SIMHASH_BANDS)]
+        where = " OR ".join(f"b{i}=?" for i in range(SIMHASH_BANDS))
+        for url, other in self.conn.execute(f"SELECT url, simhash FROM page_simhash WHERE {where}", bands):
+            distance = simhash_distance(simhash, other & 0xFFFFFFFFFFFFFFFF)
+            if distance <= max_distance: return url, distance
+        return None
+
+    def add_simhash(self, url, simhash):
+        signed = simhash - (1 << 64) if simhash >= 1 << 63 else simhash # sqlite integers are signed 64-bit
+        self.conn.execute(f"INSERT OR REPLACE INTO page_simhash VALUES (?, ?, {', '.join('?' * SIMHASH_BANDS)})",
+                          [url, signed] + [(simhash >> (16 * i)) & 0xFFFF for i in range(SIMHASH_BANDS)])
+        self._changes += 1
+
+    def found_urls(self):
+        # [(final_url, hints)] in the order they were found
+        return [(row[0], page_hints(row[1], row[2]))
+                for row in self.conn.execute("SELECT final_url, content_length, link_count FROM urls WHERE state=? ORDER BY rowid", (URL_HTML,))]
+
+    def count(self, state):
+        return self.conn.execute("SELECT COUNT(*) FROM urls WHERE state=?", (state,)).fetchone()[0]
+
+    def maybe_checkpoint(self):
+        if self._changes >= CHECKPOINT_MAX_CHANGES or time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL: self.checkpoint()
+
+    def checkpoint(self):
+        self.conn.commit()
+        self._changes = 0; self._last_checkpoint = time.monotonic()
+
+    def close(self):
+        self.checkpoint(); self.conn.close()
+
+
+class SiteCrawler:
+    # finds html pages under start_url; (url, hints) tuples go to url_queue, log lines and status text to the other queues
+    def __init__(self, start_url, include_subdomains=True, max_pages=0, log_queue=None, url_queue=None, status_queue=None,
+                 max_workers=DEFAULT_CRAWL_WORKERS, max_per_host=DEFAULT_CRAWL_PER_HOST, state_path=None, spool=None,
+                 link_extractor=None, canonicalizer=None, honor_canonical=True, near_duplicate_distance=DEFAULT_NEAR_DUPLICATE_DISTANCE,
+                 respect_robots=True, use_sitemaps=True, min_delay=DEFAULT_CRAWL_DELAY):
+        self.start_url = start_url
+        self.include_subdomains = include_subdomains
+        self.max_pages = max_pages
+        self.log_queue = log_queue if log_queue is not None else queue.Queue()
+        self.url_queue = url_queue if url_queue is not None else queue.Queue()
+        self.status_queue = status_queue if status_queue is not None else queue.Queue()
+        self.max_workers = max(1, max_workers)
+        self.max_per_host = max(1, max_per_host)
+        self.state_path = state_path # sqlite file for resumable crawls; None keeps the state in memory
+        self.spool = spool # wkhtml_engine.HtmlSpool; keeps each page's html so the converter needn't fetch it again
+        self.link_extractor = link_extractor or DEFAULT_LINK_EXTRACTOR
+        self.canonicalizer = canonicalizer or UrlCanonicalizer()
+        self.honor_canonical = honor_canonical # a page whose rel=canonical was crawled already is a duplicate
+        # max simhash distance for near-duplicate pages (capped at SIMHASH_BANDS-1); None or negative turns detection off
+        self.near_duplicate_distance = None if near_duplicate_distance is None or near_duplicate_distance < 0 else min(near_duplicate_distance, SIMHASH_BANDS - 1)
+        self.respect_robots = respect_robots # robots.txt Disallow and Crawl-delay/Request-rate
+        self.use_sitemaps = use_sitemaps # seed the frontier from sitemap.xml / the sitemaps robots.txt lists
+        self.scheduler = PolitenessScheduler(self.max_per_host, min_delay, wait_for_robots=respect_robots)
+        self.found_html_pages_count = 0
+        self.robots_skipped_count = 0
+        self._robots = {} # host -> RobotFileParser, or None when the host has no usable robots.txt
+        self._robots_locks = collections.defaultdict(threading.Lock)
+        self._robots_locks_lock = threading.Lock()
+
+    def _make_session(self):
+        # one keep-alive pool shared by all fetch threads instead of a fresh connection per page
+        session = requests.Session()
+        session.headers['User-Agent'] = CRAWLER_USER_AGENT
+        adapter = HTTPAdapter(pool_connections=max(10, self.max_workers), pool_maxsize=self.max_per_host)
+        session.mount('http://', adapter); session.mount('https://', adapter)
+        return session
+
+    def robots_for(self, session, url):
+        # robots.txt rules for url's host, fetched once per host (None: no rules). with respect_robots the host's
+        # politeness delay is set from it, counting the robots.txt request itself
+        parts = urlsplit(url); host = crawl_host(url)
+        with self._robots_locks_lock: lock = self._robots_locks[host]
+        with lock:
+            if host in self._robots: return self._robots[host]
+            robots, robots_url = None, f"{parts.scheme}://{parts.netloc}/robots.txt"
+            requested = time.monotonic()
+            try:
+                self.scheduler.wait_turn(host); requested = time.monotonic()
+                response = session.get(robots_url, timeout=CRAWL_REQUEST_TIMEOUT)
+                if response.status_code in (401, 403):
+                    robots = RobotFileParser(robots_url); robots.disallow_all = True
+                    self.log_queue.put(f"robots.txt of {host} is forbidden ({response.status_code}); treating the whole host as disallowed.")
+                elif response.status_code < 400: robots = parse_robots(robots_url, response.text)
+            except requests.exceptions.RequestException as e: self.log_queue.put(f"Could not read {robots_url} ({e}); assuming no rules.")
+            self._robots[host] = robots
+            if self.respect_robots:
+                delay = robots_delay(robots) if robots else 0.0
+                self.scheduler.set_delay(host, delay, requested)
+                if delay > self.scheduler.min_delay: self.log_queue.put(f"{host}: robots.txt asks for {delay:g}s between requests.")
+            return robots
+
+    def fetch_page(self, session, url):
+        # runs on a fetch thread; returns (final_url, links, hints, rel=canonical url, text simhash) for html pages
+        # and (final_url, None, None, None, None) otherwise
+        if self.respect_robots:
+            robots = self.robots_for(session, url)
+            if robots and not robots.can_fetch(CRAWLER_USER_AGENT, url): raise RobotsDisallowed(url)
+        self.scheduler.wait_turn(crawl_host(url))
+        response = session.get(url, timeout=CRAWL_REQUEST_TIMEOUT, allow_redirects=True)
+        if response.status_code in (429, 503): raise HostRateLimited(response.status_code, parse_retry_after(response.headers.get('retry-after')))
+        response.raise_for_status()
+        if 'text/html' not in response.headers.get('content-type', '').lower(): return response.url, None, None, None, None
+        if self.spool: self.spool.store(response.url, response.content)
+        text = response.text
+        links = [urljoin(response.url, href) for href in extract_links(text, self.link_extractor)]
+        canonical = extract_canonical(text) if self.honor_canonical else None
+        simhash = page_simhash(text) if self.near_duplicate_distance is not None else None
+        try: content_length = int(response.headers['content-length'])
+        except (KeyError, ValueError): content_length = len(response.content)
+        return response.url, links, page_hints(content_length, len(links)), canonical and urljoin(response.url, canonical), simhash
+
+    def _in_scope(self, url, scope_domain):
+        host = urlsplit(url).hostname or ""
+        return host == scope_domain or (self.include_subdomains and host.endswith("." + scope_domain))
+
+    def _seed_from_sitemaps(self, session, start_url, scope_domain, seeds, stop_event):
+        # runs on its own thread: streams the sitemaps robots.txt lists (else /sitemap.xml), and the sitemaps their indexes
+        # lead to, passing in-scope (key, fetch url) pairs to the crawl loop in batches; None marks the end
+        parts = urlsplit(start_url)
+        limit = None if self.max_pages == 0 else self.max_pages * SITEMAP_SEED_FACTOR
+        batch, found, seen = [], 0, set()
+        try:
+            robots = self.robots_for(session, start_url)
+            pending = collections.deque((robots.site_maps() if robots else None) or [f"{parts.scheme}://{parts.netloc}/sitemap.xml"])
+            while pending and not stop_event.is_set() and (limit is None or found < limit) and len(seen) < SITEMAP_MAX_FILES:
+                sitemap_url = pending.popleft()
+                if sitemap_url in seen: continue
+                seen.add(sitemap_url)
+                host = crawl_host(sitemap_url)
+                while not self.scheduler.try_start(host): # sitemap requests take their turn like page fetches
+                    if stop_event.wait(0.1): return
+                try:
+                    self.scheduler.wait_turn(host)
+                    response, stream = open_sitemap(session, sitemap_url)
+                    try:
+                        for kind, loc in iter_sitemap(stream):
+                            if stop_event.is_set() or (limit is not None and found >= limit): break
+                            if urlsplit(loc).scheme not in ('http', 'https') or not self._in_scope(loc, scope_domain): continue
+                            if kind == "sitemap": pending.append(loc); continue
+                            key = self.canonicalizer.canonicalize(loc)
+                            if not key: continue
+                            batch.append((key, crawl_fetch_url(loc))); found += 1
+                            if len(batch) >= SITEMAP_BATCH: seeds.put(batch); batch = []
+                    finally: response.close()
+                except (requests.exceptions.RequestException, ET.ParseError, OSError, EOFError) as e: self.log_queue.put(f"Sitemap {sitemap_url} not used: {e}")
+                finally: self.scheduler.finished(host)
+            if found: self.log_queue.put(f"Sitemaps: {found} page url(s) read from {len(seen)} sitemap file(s).")
+        except Exception as e: self.log_queue.put(f"Sitemap seeding stopped: {e}")
+        finally:
+            if batch: seeds.put(batch)
+            seeds.put(None)
+
+    def _remaining(self):
+        return None if self.max_pages == 0 else self.max_pages - self.found_html_pages_count
+
+    def run(self):
+        store = None
+        stop_seeding = threading.Event()
+        try:
+            store = CrawlStore(self.state_path or ":memory:")
+            start_key, start_url = self.canonicalizer.canonicalize(self.start_url), crawl_fetch_url(self.start_url)
+            if not start_key: raise ValueError(f"not a crawlable url: {self.start_url}")
+            if store.open_crawl(start_key):
+                # replay pages found before the interruption, then carry on with the stored frontier
+                found = store.found_urls()
+                for url_and_hints in found: self.url_queue.put(url_and_hints)
+                self.found_html_pages_count = len(found)
+                self.log_queue.put(f"Resuming crawl from {self.state_path}: {len(found)} page(s) found, {store.count(URL_QUEUED)} queued.")
+            else: store.add_urls([(start_key, start_url)])
+            scope_domain = get_base_domain_for_scope(urlsplit(start_key).hostname)
+            self.log_queue.put(f"Scope domain: {scope_domain} ({self.max_workers} concurrent fetches, {self.max_per_host} per host, "
+                               f"robots.txt {'respected' if self.respect_robots else 'ignored'}"
+                               + (f", at least {self.scheduler.min_delay:g}s between requests to a host)" if self.scheduler.min_delay else ")"))
+            session = self._make_session()
+            in_flight = {}
+            rate_limited = collections.Counter() # key -> 429/503 answers so far
+            seeds, seeder = queue.Queue(), None
+            if self.use_sitemaps and not store.get_meta("sitemaps_seeded"):
+                seeder = threading.Thread(target=self._seed_from_sitemaps, args=(session, start_url, scope_domain, seeds, stop_seeding), daemon=True)
+                seeder.start()
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                while True:
+                    remaining = self._remaining()
+                    if remaining is not None and remaining <= 0: break
+                    while seeder:
+                        try: batch = seeds.get_nowait()
+                        except queue.Empty: break
+                        if batch is None: seeder = None; store.set_meta("sitemaps_seeded", "1")
+                        else: store.add_urls(batch)
+                    # don't start more fetches than pages still wanted; non-html results free their slot again.
+                    # hosts waiting out their politeness delay are passed over, so other hosts keep every slot busy
+                    slots = self.max_workers if remaining is None else min(self.max_workers, remaining)
+                    if len(in_flight) < slots:
+                        for key, current_url in store.take_queued(slots - len(in_flight), self.scheduler.busy_hosts(), self.scheduler.try_start):
+                            self.status_queue.put(f"Found: {self.found_html_pages_count}, Crawling: {current_url[:70]}...")
+                            in_flight[pool.submit(self.fetch_page, session, current_url)] = key, current_url
+                    wake_in = self.scheduler.seconds_until_ready()
+                    if seeder: wake_in = min(wake_in or SCHEDULER_POLL, SCHEDULER_POLL)
+                    if not in_flight:
+                        if seeder is None and not store.count(URL_QUEUED): break
+                        time.sleep(min(wake_in or SCHEDULER_POLL, SCHEDULER_POLL)); continue
+
+                    done, _ = wait(in_flight, timeout=wake_in, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        key, current_url = in_flight.pop(future) # the store tracks pages by key, the log names the url fetched
+                        host = urlsplit(key).netloc
+                        self.scheduler.finished(host)
+                        try: final_url, links, hints, canonical, simhash = future.result()
+                        except RobotsDisallowed:
+                            self.robots_skipped_count += 1
+                            self.log_queue.put(f"Skipped (disallowed by robots.txt): {current_url}"); store.mark_done(key); continue
+                        except HostRateLimited as e:
+                            rate_limited[key] += 1
+                            self.scheduler.back_off(host, RATE_LIMIT_BACKOFF if e.retry_after is None else e.retry_after)
+                            if rate_limited[key] > RATE_LIMIT_RETRIES:
+                                self.log_queue.put(f"Crawl error for {current_url}: still rate limited ({e}) after {RATE_LIMIT_RETRIES} retries"); store.mark_done(key); continue
+                            self.log_queue.put(f"Rate limited by {host} ({e}); slowing to one request every {self.scheduler.delay(host):g}s and retrying {current_url}")
+                            store.requeue(key); continue
+                        except requests.exceptions.RequestException as e: self.log_queue.put(f"Crawl error for {current_url}: {e}"); store.mark_done(key); continue
+                        except Exception as e: self.log_queue.put(f"Processing error {current_url}: {e}"); store.mark_done(key); continue
+                        if links is None: self.log_queue.put(f"Skipped (not HTML): {current_url}"); store.mark_done(key); continue
+                        remaining = self._remaining()
+                        if remaining is not None and remaining <= 0: continue # left in flight; requeued if the crawl is resumed
+
+                        # the page may be known under the url it redirected to or its rel=canonical; if either was crawled it is a duplicate
+                        aliases = {self.canonicalizer.canonicalize(url) for url in (final_url, canonical) if url and self._in_scope(url, scope_domain)}
+                        aliases.discard(None); aliases.discard(key)
+                        if not store.claim_aliases(aliases):
+                            self.log_queue.put(f"Skipped (same page as one already crawled, via redirect or rel=canonical): {current_url}")
+                            store.mark_done(key, final_url, state=URL_ALIAS); continue
+
+                        new_urls = []
+                        for abs_url in links:
+                            if urlsplit(abs_url).scheme not in ('http', 'https') or not self._in_scope(abs_url, scope_domain): continue
+                            link_key = self.canonicalizer.canonicalize(abs_url)
+                            if link_key: new_urls.append((link_key, crawl_fetch_url(abs_url)))
+                        store.add_urls(new_urls) # near-duplicates are still followed: their links may differ (pagination)
+
+                        duplicate = store.find_near_duplicate(simhash, self.near_duplicate_distance) if simhash is not None else None
+                        if duplicate:
+                            self.log_queue.put(f"Skipped (near-duplicate of {duplicate[0]}, {duplicate[1]} bit(s) apart): {current_url}")
+                            store.mark_done(key, final_url, hints, URL_DUPLICATE); continue
+                        if simhash is not None: store.add_simhash(key, simhash)
+                        store.mark_done(key, final_url, hints)
+                        self.url_queue.put((final_url, hints))
+                        self.found_html_pages_count += 1
+                    store.maybe_checkpoint()
+                for future in in_flight: future.cancel()
+            session.close()
+            self.status_queue.put(f"Crawl finished. Found {self.found_html_pages_count} HTML pages.")
+            self.log_queue.put(f"Crawl completed. Added {self.found_html_pages_count} unique HTML pages.")
+            aliases, duplicates = store.count(URL_ALIAS), store.count(URL_DUPLICATE)
+            if aliases or duplicates: self.log_queue.put(f"Not added: {duplicates} near-duplicate page(s); {aliases} url(s) resolved to pages already crawled (redirects, rel=canonical).")
+            if self.robots_skipped_count: self.log_queue.put(f"{self.robots_skipped_count} url(s) skipped as disallowed by robots.txt.")
+        except Exception as e: self.log_queue.put(f"Critical crawl error: {e}"); self.status_queue.put("Crawl failed.")
+        finally:
+            stop_seeding.set()
+            if store: store.close()
+        return self.found_html_pages_count
@@ -0,0 +1,849 @@
+import argparse
+import collections
+import csv
+import hashlib
+import json
+import os
+import platform
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse, unquote
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+from wkhtml_libwkhtmltox import EVENT_PHASE, EVENT_PROGRESS, EVENT_WARNING, EVENT_ERROR
+
+# tk-free conversion engine shared by wkhtml_gui.py and the command line:
+#   python -m wkhtml_engine -i urls.txt -o out/ --options opts.json
+#   python -m wkhtml_engine --crawl https://example.com -o out/
+
+# determine the executable name based on OS
+WKHTMLTOPDF_EXEC = "wkhtmltopdf.exe" if platform.system() == "Windows" else "wkhtmltopdf"
+
+# constants for queue messages
+LOG_MSG = "LOG_MSG"
+PROGRESS_MSG = "PROGRESS_MSG" # (PROGRESS_MSG, item_index, event_kind, payload), sent live while an item renders
+BATCH_STATS_MSG = "BATCH_STATS_MSG" # (BATCH_STATS_MSG, items_done, total_items, items_per_second), sent as items finish
+ITEM_STATUS_MSG = "ITEM_STATUS_MSG" # (ITEM_STATUS_MSG, item_index, status), sent when an item starts and when it finishes
+ITEM_PENDING, ITEM_RUNNING, ITEM_DONE, ITEM_FAILED = "pending", "running", "done", "failed"
+
+# default number of wkhtmltopdf processes run at once in batch mode
+DEFAULT_MAX_WORKERS = os.cpu_count() or 1
+
+# rendering engines: one wkhtmltopdf process per item, or warm libwkhtmltox worker processes
+ENGINE_SUBPROCESS = "subprocess"
+ENGINE_LIBRARY = "library"
+ENGINES = (ENGINE_SUBPROCESS, ENGINE_LIBRARY)
+
+# per-item wall-clock limit (0 = none) and retries for transient network failures
+DEFAULT_ITEM_TIMEOUT = 300
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BACKOFF = 2.0 # seconds before the first retry, doubled for each further attempt
+RETRY_BACKOFF_MAX = 60.0
+# qt network errors (as printed by wkhtmltopdf and libwkhtmltox) and http statuses worth another attempt
+TRANSIENT_ERROR_RE = re.compile(r"(ConnectionRefused|RemoteHostClosed|HostNotFound|Timeout|TemporaryNetworkFailure|NetworkSessionFailed|"
+                                r"UnknownNetwork|ProxyConnectionRefused|ProxyConnectionClosed|ProxyTimeout|ServiceUnavailable)Error|"
+                                r"HTTP error: (429|502|503|504)\b")
+
+# per-output-directory record of what each pdf was rendered from (incremental re-runs) and how long it took (scheduling)
+MANIFEST_FILENAME = ".wkhtml_manifest.json"
+MANIFEST_SAVE_EVERY = 100
+URL_CHECK_TIMEOUT = 10
+
+# per-run timing report written next to the pdfs (.csv for one row per item, anything else is json)
+TIMING_REPORT_FILENAME = ".wkhtml_timing.json"
+TIMING_SLOWEST_ITEMS = 10
+# where an item's wall time goes; wkhtmltopdf phases are mapped onto load / layout_print / write by timing_phase_for
+TIMING_PHASES = ("check", "spawn", "load", "layout_print", "write", "retry_wait", "other")
+
+# rough cost model for longest-first scheduling of items without a recorded render time, in seconds
+COST_BASE_SECONDS = 1.0 # process start and page setup
+COST_SECONDS_PER_MB = 4.0 # html size (file size, crawled content-length or spooled copy)
+COST_SECONDS_PER_LINK = 0.002 # crawled pages: link-heavy pages tend to be long
+COST_UNKNOWN_URL_SECONDS = 3.0 # remote page nothing is known about
+
+# crawled pages kept on disk so the converter doesn't download them a second time
+DEFAULT_SPOOL_DIR = os.path.join(os.path.expanduser("~"), ".cache", "wkhtml_gui", "spool")
+DEFAULT_SPOOL_MAX_MB = 1024
+SPOOL_MAX_AGE = 24 * 3600 # older copies are ignored and the url is fetched again
+
+# pdf options applied to each item; keys mirror the gui's option widgets
+DEFAULT_PDF_OPTIONS = {
+    "page_size": "A4", "orientation": "Portrait",
+    "grayscale": False, "disable_javascript": False, "toc": False,
+    "margin_top": "10", "margin_bottom": "10", "margin_left": "10", "margin_right": "10",
+}
+
+
+def load_pdf_options(path=None):
+    options = dict(DEFAULT_PDF_OPTIONS)
+    if not path: return options
+    with open(path, 'r', encoding='utf-8') as f: loaded = json.load(f)
+    if not isinstance(loaded, dict): raise ValueError(f"Options file '{path}' must contain a JSON object.")
+    unknown = sorted(set(loaded) - set(DEFAULT_PDF_OPTIONS))
+    if unknown: raise ValueError(f"Unknown option(s) in '{path}': {', '.join(unknown)}")
+    options.update(loaded)
+    return options
+
+
+def is_url(item):
+    return item.startswith("http://") or item.startswith("https://")
+
+
+def generate_pdf_filename_for_item(input_item_str):
+    # urls differing only in their query (?page=2, ?lang=de) get the query and a short hash of it appended,
+    # so paginated and variant pages of a crawl do not overwrite each other's pdf
+    query_suffix = ""
+    if is_url(input_item_str):
+        parsed_url = urlparse(input_item_str)
+        path_part = os.path.basename(unquote(parsed_url.path))
+        if not path_part or path_part == "/":
+            path_elements = [elem for elem in unquote(parsed_url.path).strip('/').split('/') if elem]
+            if not path_elements: path_part = "index"
+            else: path_part = '_'.join(path_elements)
+        name_base = f"{parsed_url.netloc}_{path_part}"
+        if parsed_url.query:
+            readable = re.sub(r'_+', '_', re.sub(r'[^\w.\-]+', '_', unquote(parsed_url.query))).strip('_')[:40]
+            query_suffix = "_" + "_".join(filter(None, (readable, hashlib.sha256(parsed_url.query.encode('utf-8')).hexdigest()[:8])))
+    else: # local file
+        name_base = os.path.splitext(os.path.basename(input_item_str))[0]
+
+    sanitized_name = re.sub(r'[^\w.\-]+', '_', name_base)
+    sanitized_name = re.sub(r'_+', '_', sanitized_name).strip('_')
+    if not sanitized_name: sanitized_name = "untitled_pdf"
+    return f"{sanitized_name[:150]}{query_suffix}.pdf"
+
+
+def build_single_item_command(options, input_item, output_pdf_path, wkhtmltopdf_exec=None, proxy=None):
+    if not input_item or not output_pdf_path: return None
+    command = [wkhtmltopdf_exec or WKHTMLTOPDF_EXEC]
+    command.extend(["--page-size", options["page_size"]])
+    command.extend(["--orientation", options["orientation"]])
+    if options["grayscale"]: command.append("--grayscale")
+    if options["disable_javascript"]: command.append("--disable-javascript")
+    else: command.append("--enable-javascript")
+
+    for opt, key in [("--margin-top", "margin_top"), ("--margin-bottom", "margin_bottom"),
+                     ("--margin-left", "margin_left"), ("--margin-right", "margin_right")]:
+        value = str(options[key]).strip()
+        if value: command.extend([opt, value + "mm"])
+    if proxy: command.extend(["--proxy", proxy])
+
+    if options["toc"]: command.append("toc")
+    command.append(input_item)
+    command.append(output_pdf_path)
+    return command
+
+
+# stderr lines written by wkhtmltopdf's src/shared/progressfeedback.cc
+PROGRESS_PHASE_RE = re.compile(r"^(?P<desc>\S.*?) \((?P<step>\d+)/(?P<steps>\d+)\)$")
+PROGRESS_BAR_RE = re.compile(r"^\[(?P<bar>[=> ]+)\]\s*(?P<status>.*)$")
+PROGRESS_PERCENT_RE = re.compile(r"(\d+)%")
+
+
+def parse_progress_line(line):
+    # -> (EVENT_PHASE, (desc, step, steps)), (EVENT_PROGRESS, (percent, status)), (EVENT_WARNING|EVENT_ERROR, text) or None
+    line = line.strip()
+    if line.startswith("Warning: "): return EVENT_WARNING, line[9:]
+    if line.startswith("Error: "): return EVENT_ERROR, line[7:]
+    match = PROGRESS_BAR_RE.match(line)
+    if match:
+        bar, status = match.group("bar"), match.group("status").strip()
+        percent = PROGRESS_PERCENT_RE.match(status)
+        return EVENT_PROGRESS, (int(percent.group(1)) if percent else 100 * bar.count("=") // len(bar), status)
+    match = PROGRESS_PHASE_RE.match(line)
+    if match: return EVENT_PHASE, (match.group("desc"), int(match.group("step")), int(match.group("steps")))
+    if line == "Done": return EVENT_PHASE, (line, None, None) # the last phase is printed without a counter
+    return None
+
+
+def format_progress_event(kind, payload):
+    # log line for phase/warning/error events; bar updates are only sent as PROGRESS_MSG
+    if kind == EVENT_PHASE:
+        desc, step, steps = payload
+        return desc + (f" ({step}/{steps})" if step else ""), False
+    if kind == EVENT_WARNING: return f"(warning) {payload}", False
+    if kind == EVENT_ERROR: return f"(error) {payload}", True
+    return None
+
+
+def kill_process_tree(process):
+    # wkhtmltopdf is started in its own session/process group, so this also takes down anything it spawned
+    try:
+        if platform.system() == "Windows":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                           creationflags=subprocess.CREATE_NO_WINDOW)
+        else: os.killpg(process.pid, signal.SIGKILL)
+    except OSError: pass
+    try: process.kill()
+    except OSError: pass
+
+
+def timing_phase_for(desc):
+    # "Loading pages", "Loading headers and footers" -> load; "Counting pages", "Resolving links", "Printing pages" -> layout_print; "Done" -> write
+    desc = desc.lower()
+    if desc.startswith("loading"): return "load"
+    return "write" if desc == "done" else "layout_print"
+
+
+def percentile(sorted_values, pct):
+    # nearest-rank percentile of an already sorted list
+    if not sorted_values: return None
+    return sorted_values[max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))]
+
+
+class PhaseTimer:
+    # splits one item's wall time into TIMING_PHASES; spawn runs until wkhtmltopdf reports its first phase.
+    # phase changes may arrive on the stderr reader thread, stop() is called after it has been joined
+    def __init__(self):
+        self.phases = collections.defaultdict(float)
+        self._current, self._since = None, 0.0
+        self._saw_phase = False
+
+    def start(self, phase):
+        self._switch(phase)
+
+    def phase_changed(self, desc):
+        self._saw_phase = True
+        self._switch(timing_phase_for(desc))
+
+    def stop(self):
+        self._switch(None)
+
+    def _switch(self, phase):
+        now = time.monotonic()
+        if self._current: self.phases[self._current] += now - self._since
+        self._current, self._since = phase, now
+
+    def result(self):
+        phases = dict(self.phases)
+        # no progress output (e.g. --quiet wrappers): the time can't be split, so don't pass it off as spawn time
+        if not self._saw_phase and "spawn" in phases: phases["other"] = phases.get("other", 0.0) + phases.pop("spawn")
+        return {name: round(seconds, 4) for name, seconds in phases.items()}
+
+
+class TimingReport:
+    # per-item timings for one run: latency percentiles, throughput, bytes written and the slowest items
+    def __init__(self):
+        self.records = []
+        self.extra = {} # run-level figures, e.g. merge time
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self._finished = None
+        self._lock = threading.Lock()
+
+    def add(self, item, status, seconds, phases=None, bytes_written=0, attempts=1):
+        # status: "ok", "failed", "unchanged" or "cached"
+        record = {"item": item, "status": status, "seconds": round(seconds, 4), "bytes": bytes_written, "attempts": attempts,
+                  "phases": phases or {}}
+        with self._lock: self.records.append(record)
+
+    def elapsed(self):
+        return (self._finished or time.monotonic()) - self._started
+
+    def items_per_second(self):
+        elapsed = self.elapsed()
+        with self._lock: done = len(self.records)
+        return done / elapsed if elapsed > 0 else 0.0
+
+    def finish(self):
+        self._finished = time.monotonic()
+
+    def summary(self):
+        with self._lock: records = list(self.records)
+        rendered = [r for r in records if r["status"] not in ("unchanged", "cached")]
+        latencies = sorted(r["seconds"] for r in rendered)
+        elapsed = self.elapsed()
+        bytes_written = sum(r["bytes"] for r in records)
+        phase_totals = collections.defaultdict(float)
+        for r in rendered:
+            for name, seconds in r["phases"].items(): phase_totals[name] += seconds
+        return dict({
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "wall_seconds": round(elapsed, 3), "items": len(records),
+            "succeeded": sum(r["status"] == "ok" for r in records), "failed": sum(r["status"] == "failed" for r in records),
+            "unchanged": sum(r["status"] == "unchanged" for r in records), "cached": sum(r["status"] == "cached" for r in records),
+            "items_per_second": round(len(records) / elapsed, 3) if elapsed > 0 else None,
+            "bytes_written": bytes_written, "mb_per_second": round(bytes_written / 1048576 / elapsed, 3) if elapsed > 0 else None,
+            "latency_seconds": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+                                "max": latencies[-1] if latencies else None,
+                                "mean": round(sum(latencies) / len(latencies), 4) if latencies else None},
+            "phase_seconds": {name: round(phase_totals[name], 3) for name in TIMING_PHASES if name in phase_totals},
+            "slowest": sorted(rendered, key=lambda r: -r["seconds"])[:TIMING_SLOWEST_ITEMS],
+        }, **self.extra)
+
+    def summary_line(self):
+        summary = self.summary(); latency = summary["latency_seconds"]
+        fmt = lambda value: "n/a" if value is None else f"{value:.2f}s"
+        return (f"Timing: {summary['items']} item(s) in {summary['wall_seconds']:.1f}s, {summary['items_per_second'] or 0:.2f} items/s, "
+                f"p50 {fmt(latency['p50'])}, p95 {fmt(latency['p95'])}, p99 {fmt(latency['p99'])}, "
+                f"{summary['bytes_written'] / 1048576:.1f} MB written.")
+
+    def write(self, path):
+        tmp_path = path + ".tmp"
+        with self._lock: records = list(self.records)
+        if path.lower().endswith(".csv"):
+            with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(["item", "status", "seconds", "bytes", "attempts"] + list(TIMING_PHASES))
+                for r in records:
+                    writer.writerow([r["item"], r["status"], r["seconds"], r["bytes"], r["attempts"]] + [r["phases"].get(name, "") for name in TIMING_PHASES])
+        else:
+            with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(dict(self.summary(), records=records), f, indent=1)
+        os.replace(tmp_path, path)
+
+
+def _pump_lines(stream, on_line):
+    for line in iter(stream.readline, ''): on_line(line.rstrip())
+    stream.close()
+
+
+def hash_options(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def command_options_hash(options):
+    # hash of the command line minus input, output and executable path, so only real option changes re-render
+    return hash_options(build_single_item_command(options, "{input}", "{output}", "wkhtmltopdf"))
+
+
+def detach_output(pdf_path):
+    # a pdf reused from the render cache is a hard link to the cached copy: unlink it before rendering over it,
+    # or wkhtmltopdf would truncate and rewrite the cached copy too
+    try:
+        if os.stat(pdf_path).st_nlink > 1: os.remove(pdf_path)
+    except OSError: pass
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''): digest.update(block)
+    return digest.hexdigest()
+
+
+class ConversionManifest:
+    # remembers the source fingerprint and options hash each pdf in output_dir was made from.
+    # local files: mtime + size, falling back to a content hash when those moved; urls: etag / last-modified via conditional HEAD.
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f: self.items = json.load(f).get("items", {})
+        except (OSError, ValueError, AttributeError): self.items = {}
+
+    def _key(self, item):
+        return item if is_url(item) else os.path.abspath(item)
+
+    def check(self, item, options_hash, pdf_path):
+        # returns (unchanged, fingerprint); the fingerprint is what record() should store after a successful render
+        with self._lock: entry = self.items.get(self._key(item))
+        previous = entry.get("fingerprint") if entry else None
+        same_source, fingerprint = self._url_fingerprint(item, previous) if is_url(item) else self._file_fingerprint(item, previous)
+        unchanged = (entry is not None and same_source
+                     and entry.get("options_hash") == options_hash and entry.get("pdf") == os.path.basename(pdf_path)
+                     and os.path.isfile(pdf_path) and os.path.getsize(pdf_path) > 0)
+        if unchanged and fingerprint != previous: self.record(item, options_hash, pdf_path, fingerprint) # e.g. touched but identical
+        return unchanged, fingerprint
+
+    def _file_fingerprint(self, path, previous):
+        # returns (same_source, fingerprint); hashing is skipped while mtime and size still match
+        try: st = os.stat(path)
+        except OSError: return False, None
+        if previous and previous.get("mtime") == st.st_mtime and previous.get("size") == st.st_size: return True, previous
+        fingerprint = {"mtime": st.st_mtime, "size": st.st_size, "sha256": file_sha256(path)}
+        return bool(previous) and previous.get("sha256") == fingerprint["sha256"], fingerprint
+
+    def _url_fingerprint(self, url, previous):
+        # returns (same_source, fingerprint); servers without etag/last-modified are always treated as changed
+        headers = {"User-Agent": "WkHtmlToPdfGUI/1.0"}
+        if previous and previous.get("etag"): headers["If-None-Match"] = previous["etag"]
+        if previous and previous.get("last_modified"): headers["If-Modified-Since"] = previous["last_modified"]
+        try:
+            with urlopen(Request(url, headers=headers, method="HEAD"), timeout=URL_CHECK_TIMEOUT) as response:
+                etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        except HTTPError as e: return (True, previous) if e.code == 304 and previous else (False, None)
+        except Exception: return False, None
+        if not etag and not last_modified: return False, None
+        fingerprint = {"etag": etag, "last_modified": last_modified}
+        return fingerprint == previous, fingerprint
+
+    def record(self, item, options_hash, pdf_path, fingerprint):
+        if fingerprint is None: return
+        self._update(item, fingerprint=fingerprint, options_hash=options_hash, pdf=os.path.basename(pdf_path))
+
+    def render_seconds(self, item):
+        with self._lock: return self.items.get(self._key(item), {}).get("render_seconds")
+
+    def record_render_time(self, item, seconds):
+        self._update(item, render_seconds=round(seconds, 3))
+
+    def _update(self, item, **fields):
+        with self._lock:
+            self.items.setdefault(self._key(item), {}).update(fields)
+            self._unsaved += 1
+            if self._unsaved < MANIFEST_SAVE_EVERY: return
+        self.save()
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({"version": 1, "items": self.items}, indent=1)
+            self._unsaved = 0
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f: f.write(data)
+        os.replace(tmp_path, self.path)
+
+
+def base_href_tag(url):
+    return b'<base href="' + url.replace('"', '%22').encode("ascii", "xmlcharrefreplace") + b'">'
+
+
+def add_base_href(html_bytes, url):
+    # makes relative links in a copy of a page resolve against url, unless the page sets its own <base>
+    if re.search(rb'<base\s[^>]*href', html_bytes[:8192], re.I) is not None: return html_bytes
+    base_tag = base_href_tag(url)
+    head = re.search(rb'<head(\s[^>]*)?>', html_bytes, re.I)
+    return html_bytes[:head.end()] + base_tag + html_bytes[head.end():] if head else base_tag + html_bytes
+
+
+class HtmlSpool:
+    # url -> raw html bytes on disk with a <base href> pointing back at the url, so relative
+    # resources still resolve when wkhtmltopdf renders the local copy. oldest files go first past max_bytes.
+    def __init__(self, spool_dir, max_mb=DEFAULT_SPOOL_MAX_MB):
+        self.spool_dir = spool_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict() # file name -> size, oldest first
+        self.total_bytes = 0
+        os.makedirs(spool_dir, exist_ok=True)
+        existing = []
+        for name in os.listdir(spool_dir):
+            if not name.endswith(".html"): continue
+            path = os.path.join(spool_dir, name)
+            try: existing.append((os.path.getmtime(path), name, os.path.getsize(path)))
+            except OSError: pass
+        for _, name, size in sorted(existing): self._entries[name] = size; self.total_bytes += size
+
+    def _name(self, url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest() + ".html"
+
+    def store(self, url, html_bytes):
+        html_bytes = add_base_href(html_bytes, url)
+        name = self._name(url)
+        path = os.path.join(self.spool_dir, name)
+        with self._lock:
+            if len(html_bytes) > self.max_bytes: return None
+            with open(path + ".tmp", 'wb') as f: f.write(html_bytes)
+            os.replace(path + ".tmp", path)
+            self.total_bytes += len(html_bytes) - self._entries.pop(name, 0)
+            self._entries[name] = len(html_bytes)
+            while self.total_bytes > self.max_bytes and self._entries:
+                old_name, size = self._entries.popitem(last=False)
+                self.total_bytes -= size
+                try: os.remove(os.path.join(self.spool_dir, old_name))
+                except OSError: pass
+        return path
+
+    def lookup(self, url):
+        path = os.path.join(self.spool_dir, self._name(url))
+        try: fresh = time.time() - os.path.getmtime(path) < SPOOL_MAX_AGE
+        except OSError: return None
+        return path if fresh else None
+
+
+def estimate_item_cost(item, hints=None, history_seconds=None, spooled_path=None):
+    # -> (estimated render seconds, what the estimate is based on)
+    if history_seconds is not None: return history_seconds, "last render"
+    hints = hints or {}
+    size = hints.get("content_length")
+    if size is None and (spooled_path or not is_url(item)):
+        try: size = os.path.getsize(spooled_path or item)
+        except OSError: size = None
+    if size is None and not hints: return COST_UNKNOWN_URL_SECONDS, "unknown url"
+    cost = COST_BASE_SECONDS + (size or 0) / 1048576 * COST_SECONDS_PER_MB + hints.get("links", 0) * COST_SECONDS_PER_LINK
+    basis = f"{(size or 0) / 1024:.0f} KB" + (f", {hints['links']} links" if "links" in hints else "")
+    return cost, basis
+
+
+class BatchConverter:
+    # converts a list of items to one pdf each, posting (LOG_MSG, text, is_error) tuples to log_queue
+    def __init__(self, options, output_dir, log_queue, max_workers=DEFAULT_MAX_WORKERS, wkhtmltopdf_exec=None,
+                 engine=ENGINE_SUBPROCESS, libwkhtmltox_path=None, incremental=False, resource_cache_dir=None, resource_cache_mb=None,
+                 spool_dir=None, spool_max_mb=DEFAULT_SPOOL_MAX_MB, item_timeout=DEFAULT_ITEM_TIMEOUT, retries=DEFAULT_RETRIES,
+                 retry_backoff=DEFAULT_RETRY_BACKOFF, cost_hints=None, report_path=None, render_cache_dir=None, render_cache_mb=None):
+        self.options = options
+        self.output_dir = output_dir
+        self.log_queue = log_queue
+        self.max_workers = max(1, max_workers)
+        self.wkhtmltopdf_exec = wkhtmltopdf_exec or WKHTMLTOPDF_EXEC
+        self.engine = engine
+        self.libwkhtmltox_path = libwkhtmltox_path
+        self.incremental = incremental
+        self.resource_cache_dir = resource_cache_dir # shared subresource cache served to wkhtmltopdf through a local proxy
+        self.resource_cache_mb = resource_cache_mb
+        self.render_cache_dir = render_cache_dir # identical pages rendered with identical options are reused from here
+        self.render_cache_mb = render_cache_mb
+        self.spool = HtmlSpool(spool_dir, spool_max_mb) if spool_dir else None # render crawled urls from their spooled copy
+        self.cost_hints = cost_hints or {} # item -> {"content_length": bytes, "links": count} from the crawler
+        self.report_path = report_path or os.path.join(output_dir, TIMING_REPORT_FILENAME)
+        self.timing = None # TimingReport of the current/last run
+        self.item_timeout = item_timeout or None
+        self.retries = max(0, retries)
+        self.retry_backoff = retry_backoff
+        self.exec_missing = False
+        self.cancelled = False
+        self.unchanged_count = 0
+        self.cached_count = 0
+        self._manifest = None
+        self._render_cache = None
+        self._count_lock = threading.Lock()
+        self._options_hash = command_options_hash(options)
+        self._stop_event = threading.Event() # no new items are started once set
+        self._cancel_event = threading.Event() # items in flight are killed once set
+        self._library_pool = None
+        self._proxy = None
+
+    def estimate_cost(self, item):
+        spooled_path = self.spool.lookup(item) if self.spool and is_url(item) else None
+        return estimate_item_cost(item, self.cost_hints.get(item), self._manifest.render_seconds(item) if self._manifest else None, spooled_path)
+
+    def convert_item(self, index, total_items, item_url_or_file, estimate=None):
+        # runs on a pool thread; log lines are buffered so each item's lines are reported together
+        messages = [(LOG_MSG, f"--- Processing item {index+1}/{total_items}: {item_url_or_file} ---", False)]
+        if estimate: messages.append((LOG_MSG, f"Estimated cost: {estimate[0]:.1f}s ({estimate[1]})", False))
+        if self._stop_event.is_set():
+            messages.append((LOG_MSG, f"Skipping {item_url_or_file}: batch {'cancelled' if self.cancelled else 'stopped'}.", True)); return None, messages
+        self.log_queue.put((ITEM_STATUS_MSG, index, ITEM_RUNNING))
+
+        full_output_pdf_path = os.path.join(self.output_dir, generate_pdf_filename_for_item(item_url_or_file))
+        fingerprint = None
+        started, timer = time.monotonic(), PhaseTimer()
+        if self.incremental:
+            timer.start("check")
+            unchanged, fingerprint = self._manifest.check(item_url_or_file, self._options_hash, full_output_pdf_path)
+            if unchanged:
+                with self._count_lock: self.unchanged_count += 1
+                timer.stop(); self.timing.add(item_url_or_file, "unchanged", time.monotonic() - started, timer.result())
+                messages.append((LOG_MSG, f"Unchanged, keeping {full_output_pdf_path}", False)); return True, messages
+
+        source = item_url_or_file
+        spooled_path = self.spool.lookup(item_url_or_file) if self.spool and is_url(item_url_or_file) else None
+        if spooled_path: source = spooled_path; messages.append((LOG_MSG, f"Rendering crawled copy {spooled_path}", False))
+
+        detach_output(full_output_pdf_path)
+        cache_key = None
+        if self._render_cache:
+            timer.start("check")
+            cache_key = self._render_cache_key(item_url_or_file, spooled_path)
+            if cache_key and self._render_cache.fetch(cache_key, full_output_pdf_path):
+                with self._count_lock: self.cached_count += 1
+                timer.stop(); self.timing.add(item_url_or_file, "cached", time.monotonic() - started, timer.result(), os.path.getsize(full_output_pdf_path))
+                if self.incremental: self._manifest.record(item_url_or_file, self._options_hash, full_output_pdf_path, fingerprint)
+                messages.append((LOG_MSG, f"Rendered identically before, reused cached PDF: {full_output_pdf_path}", False)); return True, messages
+
+        for attempt in range(self.retries + 1):
+            attempt_start = len(messages)
+            ok = None
+            if self._library_pool: ok = self._convert_with_library(index, source, full_output_pdf_path, messages, timer)
+            if ok is None: ok = self._convert_with_subprocess(index, source, full_output_pdf_path, messages, timer)
+            if ok or attempt == self.retries or self._stop_event.is_set(): break
+            if not any(TRANSIENT_ERROR_RE.search(msg[1]) for msg in messages[attempt_start:]): break
+            delay = min(RETRY_BACKOFF_MAX, self.retry_backoff * 2 ** attempt)
+            messages.append((LOG_MSG, f"Transient network error, retrying {item_url_or_file} in {delay:g}s (attempt {attempt+2}/{self.retries+1})", True))
+            timer.start("retry_wait")
+            if self._cancel_event.wait(delay): break
+        timer.stop()
+        elapsed = time.monotonic() - started
+        try: bytes_written = os.path.getsize(full_output_pdf_path) if ok else 0
+        except OSError: bytes_written = 0
+        self.timing.add(item_url_or_file, "ok" if ok else "failed", elapsed, timer.result(), bytes_written, attempt + 1)
+        if ok: self._manifest.record_render_time(item_url_or_file, elapsed)
+        if ok and cache_key: self._render_cache.store(cache_key, full_output_pdf_path)
+        if ok and self.incremental: self._manifest.record(item_url_or_file, self._options_hash, full_output_pdf_path, fingerprint)
+        return ok, messages
+
+    def _render_cache_key(self, item, spooled_path):
+        # a url's page bytes are only known up front through its spooled copy; without one it is rendered uncached
+        if is_url(item):
+            if not spooled_path: self._render_cache.count("uncacheable"); return None
+            return self._render_cache.key_for(spooled_path, self._options_hash, item)
+        return self._render_cache.key_for(item, self._options_hash, os.path.dirname(os.path.abspath(item)))
+
+    def _progress_event(self, index, kind, payload, messages, source, timer):
+        if kind == EVENT_PHASE: timer.phase_changed(payload[0])
+        self.log_queue.put((PROGRESS_MSG, index, kind, payload))
+        line = format_progress_event(kind, payload)
+        if line: messages.append((LOG_MSG, f"{source}: {line[0]}", line[1]))
+
+    def _convert_with_library(self, index, item_url_or_file, full_output_pdf_path, messages, timer):
+        # returns None when no worker could be started so the caller falls back to a wkhtmltopdf process
+        from wkhtml_libwkhtmltox import LibraryWorkerError, build_library_settings
+        timer.start("spawn") # waiting for (or starting) a warm worker
+        try: worker = self._library_pool.acquire()
+        except LibraryWorkerError as e:
+            messages.append((LOG_MSG, f"libwkhtmltox worker unavailable ({e}); using '{self.wkhtmltopdf_exec}' for {item_url_or_file}.", True)); return None
+
+        def on_event(kind, payload):
+            # same event payloads as parse_progress_line produces for wkhtmltopdf's stderr
+            if kind == EVENT_PHASE:
+                phase, phase_count, desc = payload
+                payload = (desc, phase + 1, phase_count - 1) if phase < phase_count - 1 else (desc, None, None)
+            elif kind == EVENT_PROGRESS: payload = (payload, f"{payload}%")
+            self._progress_event(index, kind, payload, messages, "libwkhtmltox", timer)
+
+        messages.append((LOG_MSG, f"Output PDF: {full_output_pdf_path}", False))
+        global_settings, objects = build_library_settings(self.options, item_url_or_file, full_output_pdf_path, self._proxy_url())
+        try: ok, http_error_code = worker.convert(global_settings, objects, on_event, self.item_timeout, self._cancel_event)
+        except LibraryWorkerError as e:
+            timer.stop(); self._library_pool.discard(worker)
+            messages.append((LOG_MSG, f"libwkhtmltox worker stopped converting {item_url_or_file}: {e}", True)); return False
+        timer.stop(); self._library_pool.release(worker)
+
+        if ok: messages.append((LOG_MSG, f"Successfully converted: {item_url_or_file}", False)); return True
+        messages.append((LOG_MSG, f"Failed to convert {item_url_or_file}." + (f" HTTP error: {http_error_code}" if http_error_code else ""), True)); return False
+
+    def _convert_with_subprocess(self, index, item_url_or_file, full_output_pdf_path, messages, timer):
+        command = build_single_item_command(self.options, item_url_or_file, full_output_pdf_path, self.wkhtmltopdf_exec, self._proxy_url())
+        if not command:
+            messages.append((LOG_MSG, f"Skipping {item_url_or_file}: Could not build command.", True)); return False
+
+        messages.append((LOG_MSG, f"Output PDF: {full_output_pdf_path}", False))
+        messages.append((LOG_MSG, f"Command: {subprocess.list2cmdline(command)}", False))
+
+        try:
+            # own process group/session so a timeout or cancel can kill the whole tree
+            if platform.system() == "Windows": group_options = {"creationflags": subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP}
+            else: group_options = {"start_new_session": True}
+            timer.start("spawn")
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, **group_options)
+
+            def on_stderr(line):
+                event = parse_progress_line(line)
+                if event: self._progress_event(index, *event, messages, "wkhtmltopdf", timer)
+                elif line.strip(): messages.append((LOG_MSG, f"wkhtmltopdf (stderr): {line.strip()}", False))
+            # drain both pipes at once; reading one to eof first lets the other fill up and block the child
+            readers = [threading.Thread(target=_pump_lines, args=(process.stderr, on_stderr), daemon=True),
+                       threading.Thread(target=_pump_lines, args=(process.stdout, lambda line: messages.append((LOG_MSG, f"wkhtmltopdf (stdout): {line.strip()}", False))), daemon=True)]
+            for reader in readers: reader.start()
+            stopped = self._wait_for_process(process)
+            for reader in readers: reader.join(5)
+            timer.stop()
+
+            if stopped: messages.append((LOG_MSG, f"Failed to convert {item_url_or_file}: {stopped}, process killed.", True)); return False
+            if process.returncode == 0: messages.append((LOG_MSG, f"Successfully converted: {item_url_or_file}", False)); return True
+            messages.append((LOG_MSG, f"Failed to convert {item_url_or_file}. Exit code: {process.returncode}", True)); return False
+
+        except FileNotFoundError:
+            # no point starting the remaining items; the first worker to hit this reports it
+            if not self._stop_event.is_set():
+                self._stop_event.set(); self.exec_missing = True
+                messages.append((LOG_MSG, f"'{self.wkhtmltopdf_exec}' not found. Install or set path.", True))
+            return False
+        except Exception as e: messages.append((LOG_MSG, f"Error converting {item_url_or_file}: {e}", True)); return False
+
+    def _wait_for_process(self, process):
+        # returns None once the process exits, or why it had to be killed
+        deadline = time.monotonic() + self.item_timeout if self.item_timeout else None
+        while True:
+            try: process.wait(timeout=0.5); return None
+            except subprocess.TimeoutExpired: pass
+            if self._cancel_event.is_set(): reason = "batch cancelled"
+            elif deadline and time.monotonic() > deadline: reason = f"timed out after {self.item_timeout}s"
+            else: continue
+            kill_process_tree(process); process.wait()
+            return reason
+
+    def cancel(self):
+        # safe to call from any thread: stops scheduling and kills what is running
+        self.cancelled = True
+        self._stop_event.set(); self._cancel_event.set()
+
+    def _proxy_url(self):
+        return self._proxy.url if self._proxy else None
+
+    def _start_resource_cache(self):
+        from wkhtml_cache_proxy import DEFAULT_CACHE_MAX_MB, CachingProxy
+        try: self._proxy = CachingProxy(self.resource_cache_dir, self.resource_cache_mb or DEFAULT_CACHE_MAX_MB).start()
+        except OSError as e: self.log_queue.put((LOG_MSG, f"Resource cache disabled, could not start proxy: {e}", True)); return
+        self.log_queue.put((LOG_MSG, f"Resource cache: {self.resource_cache_dir} via proxy {self._proxy.url}", False))
+
+    def _start_render_cache(self):
+        from wkhtml_render_cache import RenderCache
+        try: self._render_cache = RenderCache(self.render_cache_dir, self.render_cache_mb)
+        except OSError as e: self.log_queue.put((LOG_MSG, f"Render cache disabled: {e}", True)); return
+        self.log_queue.put((LOG_MSG, f"Render cache: {self.render_cache_dir} ({self._render_cache.total_bytes / 1048576:.1f}/{self._render_cache.max_bytes / 1048576:.0f} MB used)", False))
+
+    def _start_library_pool(self):
+        from wkhtml_libwkhtmltox import LibraryWorkerPool, find_libwkhtmltox
+        lib_path = find_libwkhtmltox(self.libwkhtmltox_path)
+        if not lib_path:
+            self.log_queue.put((LOG_MSG, f"libwkhtmltox not found; falling back to '{self.wkhtmltopdf_exec}' processes.", True)); return
+        self.log_queue.put((LOG_MSG, f"Rendering in-process with {lib_path} ({self.max_workers} worker(s)).", False))
+        self._library_pool = LibraryWorkerPool(lib_path, self.max_workers)
+
+    def _check_output_names(self, input_items_list):
+        # items sharing an output pdf would overwrite it, concurrently under the worker pool
+        names = collections.defaultdict(list)
+        for item in input_items_list: names[generate_pdf_filename_for_item(item)].append(item)
+        clashes = {name: items for name, items in names.items() if len(items) > 1}
+        if not clashes: return
+        name, items = next(iter(clashes.items()))
+        self.log_queue.put((LOG_MSG, f"Warning: {sum(len(items) for items in clashes.values())} item(s) share an output file with another item, "
+                                     f"the last one rendered wins (e.g. {name}: {', '.join(items[:3])}).", True))
+
+    def start(self):
+        # sets up what convert_item needs; run() does this itself, long-lived callers (queue workers) pair it with finish()
+        self.timing = TimingReport()
+        if self.engine == ENGINE_LIBRARY: self._start_library_pool()
+        self._manifest = ConversionManifest(self.output_dir)
+        if self.resource_cache_dir: self._start_resource_cache()
+        if self.render_cache_dir: self._start_render_cache()
+
+    def finish(self):
+        if self._library_pool: self._library_pool.close(); self._library_pool = None
+        if self._proxy:
+            self._proxy.stop(); self.log_queue.put((LOG_MSG, self._proxy.summary(), False)); self._proxy = None
+        if self._render_cache: self.log_queue.put((LOG_MSG, self._render_cache.summary(), False)); self._render_cache = None
+        if self._manifest:
+            try: self._manifest.save()
+            except OSError as e: self.log_queue.put((LOG_MSG, f"Could not write {self._manifest.path}: {e}", True))
+        self.timing.finish()
+        try: self.timing.write(self.report_path)
+        except OSError as e: self.log_queue.put((LOG_MSG, f"Could not write timing report {self.report_path}: {e}", True))
+        else: self.log_queue.put((LOG_MSG, f"{self.timing.summary_line()} Report: {self.report_path}", False))
+
+    def run(self, input_items_list):
+        total_items = len(input_items_list)
+        success_count = 0
+        fail_count = 0
+
+        self.start()
+        try:
+            # longest-first: big items start while every worker is busy instead of running alone at the end
+            estimates = [self.estimate_cost(item) for item in input_items_list]
+            self._check_output_names(input_items_list)
+            order = sorted(range(total_items), key=lambda i: -estimates[i][0])
+            if total_items > 1:
+                longest = order[0]
+                self.log_queue.put((LOG_MSG, f"Scheduling longest first: ~{sum(cost for cost, _ in estimates):.0f}s of rendering estimated across {self.max_workers} worker(s); "
+                                             f"longest is item {longest+1} (~{estimates[longest][0]:.1f}s, {estimates[longest][1]}).", False))
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {pool.submit(self.convert_item, i, total_items, input_items_list[i], estimates[i]): i for i in order}
+                # each item's lines are buffered and reported together as soon as it finishes
+                try:
+                    for future in as_completed(futures):
+                        ok, messages = future.result()
+                        for msg in messages: self.log_queue.put(msg)
+                        self.log_queue.put((ITEM_STATUS_MSG, futures[future], ITEM_DONE if ok else ITEM_PENDING if ok is None else ITEM_FAILED))
+                        if ok: success_count += 1
+                        else: fail_count += 1
+                        self.log_queue.put((BATCH_STATS_MSG, success_count + fail_count, total_items, self.timing.items_per_second()))
+                except KeyboardInterrupt:
+                    self.cancel(); raise
+        finally:
+            self.finish()
+
+        unchanged_note = f" ({self.unchanged_count} unchanged, skipped)" if self.unchanged_count else ""
+        if self.cached_count: unchanged_note += f" ({self.cached_count} reused from the render cache)"
+        if self.cancelled: self.log_queue.put((LOG_MSG, "--- Batch conversion cancelled. ---", True))
+        self.log_queue.put((LOG_MSG, f"--- Batch conversion finished. Success: {success_count}{unchanged_note}, Failed: {fail_count} ---", False))
+        return success_count, fail_count
+
+
+class ConsoleLog:
+    # queue stand-in for the command line: prints log tuples and crawler strings as they arrive
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self._lock = threading.Lock()
+
+    def put(self, msg):
+        if isinstance(msg, tuple):
+            if msg[0] != LOG_MSG: return
+            text = ("WARNING: " + msg[1]) if msg[2] else msg[1]
+        else: text = str(msg)
+        with self._lock: print(text, file=self.stream, flush=True)
+
+
+def read_input_list(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m wkhtml_engine", description="Headless batch HTML to PDF conversion with wkhtmltopdf.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("-i", "--input-list", help="text file with one file path or URL per line")
+    source.add_argument("--crawl", metavar="START_URL", help="crawl a site and convert every HTML page found")
+    parser.add_argument("-o", "--output-dir", required=True, help="directory for the generated PDFs")
+    parser.add_argument("--options", help="JSON file with PDF options (see DEFAULT_PDF_OPTIONS)")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_MAX_WORKERS, help="max concurrent wkhtmltopdf processes")
+    parser.add_argument("--wkhtmltopdf", default=WKHTMLTOPDF_EXEC, help="path to the wkhtmltopdf executable")
+    parser.add_argument("--engine", choices=ENGINES, default=ENGINE_SUBPROCESS, help="render with wkhtmltopdf processes or in-process via libwkhtmltox (falls back to processes if the library is missing)")
+    parser.add_argument("--incremental", action="store_true", help=f"skip items whose source and options are unchanged since the last run (tracked in {MANIFEST_FILENAME})")
+    parser.add_argument("--resource-cache", metavar="DIR", help="serve CSS/JS/images/fonts shared across the batch from this on-disk cache via a local proxy")
+    parser.add_argument("--resource-cache-mb", type=int, default=512, help="size cap for --resource-cache")
+    parser.add_argument("--render-cache", metavar="DIR", help="reuse the PDF of any page rendered before with the same content and options (content-addressed, hard-linked when possible)")
+    parser.add_argument("--render-cache-mb", type=int, default=2048, help="size cap for --render-cache; least recently used PDFs are evicted")
+    parser.add_argument("--spool", metavar="DIR", help="keep crawled HTML here and render URLs from it instead of downloading them again")
+    parser.add_argument("--spool-mb", type=int, default=DEFAULT_SPOOL_MAX_MB, help="size cap for --spool")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_ITEM_TIMEOUT, help="seconds before a single item is killed (0=no limit)")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="extra attempts for items failing with a transient network error")
+    parser.add_argument("--retry-backoff", type=float, default=DEFAULT_RETRY_BACKOFF, help="seconds before the first retry, doubled for each further attempt")
+    parser.add_argument("--report", help=f"where to write the timing report (.json or .csv; default: OUTPUT_DIR/{TIMING_REPORT_FILENAME})")
+    parser.add_argument("--libwkhtmltox", help="path to libwkhtmltox (default: $WKHTMLTOX_LIB or the system library path)")
+    parser.add_argument("--include-subdomains", action="store_true", help="crawl: follow links to subdomains")
+    parser.add_argument("--max-pages", type=int, default=50, help="crawl: maximum pages (0=unlimited)")
+    parser.add_argument("--crawl-workers", type=int, default=8, help="crawl: fetches in flight at once")
+    parser.add_argument("--crawl-per-host", type=int, default=4, help="crawl: max concurrent connections per host")
+    parser.add_argument("--link-extractor", choices=("htmlparser", "regex", "lxml", "bs4"), help="crawl: how links are pulled out of pages (default: lxml if installed, else htmlparser)")
+    parser.add_argument("--keep-params", help="crawl: comma-separated query parameters that select different pages, '*' for all but tracking parameters, '' for none (default: page,p,pg,paged,start,offset,id,q)")
+    parser.add_argument("--ignore-canonical", action="store_true", help="crawl: add pages even if their rel=canonical url was crawled already")
+    parser.add_argument("--near-duplicate-distance", type=int, default=3, help="crawl: skip pages whose text simhash is within this many bits (0-3) of a page already found; -1 turns it off")
+    parser.add_argument("--ignore-robots", action="store_true", help="crawl: do not read robots.txt (Disallow rules and Crawl-delay are not honoured)")
+    parser.add_argument("--no-sitemaps", action="store_true", help="crawl: only find pages by following links, not from sitemap.xml")
+    parser.add_argument("--crawl-delay", type=float, default=0.0, help="crawl: minimum seconds between requests to one host (robots.txt may ask for more)")
+    parser.add_argument("--crawl-state", help="crawl: sqlite file holding the frontier; an interrupted crawl of the same start URL resumes from it")
+    args = parser.parse_args(argv)
+
+    try: options = load_pdf_options(args.options)
+    except (OSError, ValueError) as e: parser.error(str(e))
+    if not os.path.isdir(args.output_dir): parser.error(f"Output directory '{args.output_dir}' is not valid or does not exist.")
+    log = ConsoleLog()
+    cost_hints = {}
+
+    if args.crawl:
+        # imported lazily so plain batches never pay for requests/bs4
+        import queue
+        from wkhtml_crawler import CRAWLER_DEPENDENCIES_MET, DEFAULT_SIGNIFICANT_PARAMS, SiteCrawler, UrlCanonicalizer
+        if not CRAWLER_DEPENDENCIES_MET: parser.error("Crawler deps missing: 'requests'. (pip install requests)")
+        url_queue = queue.Queue()
+        SiteCrawler(args.crawl, args.include_subdomains, max(0, args.max_pages), log_queue=log, url_queue=url_queue,
+                    max_workers=args.crawl_workers, max_per_host=args.crawl_per_host, state_path=args.crawl_state,
+                    spool=HtmlSpool(args.spool, args.spool_mb) if args.spool else None, link_extractor=args.link_extractor,
+                    canonicalizer=UrlCanonicalizer(DEFAULT_SIGNIFICANT_PARAMS if args.keep_params is None else args.keep_params.split(",")),
+                    honor_canonical=not args.ignore_canonical, near_duplicate_distance=args.near_duplicate_distance,
+                    respect_robots=not args.ignore_robots, use_sitemaps=not args.no_sitemaps, min_delay=args.crawl_delay).run()
+        while not url_queue.empty():
+            url, hints = url_queue.get_nowait()
+            cost_hints[url] = hints
+        items = list(cost_hints)
+    else:
+        try: items = read_input_list(args.input_list)
+        except OSError as e: parser.error(str(e))
+
+    if not items: log.put((LOG_MSG, "No input items to convert.", True)); return 1
+    converter = BatchConverter(options, args.output_dir, log, args.jobs, args.wkhtmltopdf, args.engine, args.libwkhtmltox, args.incremental,
+                                args.resource_cache, args.resource_cache_mb, args.spool, args.spool_mb, args.timeout, args.retries, args.retry_backoff,
+                                cost_hints, args.report, args.render_cache, args.render_cache_mb)
+    try: success_count, fail_count = converter.run(items)
+    except KeyboardInterrupt: return 130
+    return 0 if fail_count == 0 else (2 if converter.exec_missing else 1)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
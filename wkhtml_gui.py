@@ -7,42 +7,73 @@ import threading
 import os
 import platform
 import queue 
-from urllib.parse import urlparse, urljoin, unquote
 import re
-
-try:
-    import requests
-    from bs4 import BeautifulSoup
-    CRAWLER_DEPENDENCIES_MET = True
-except ImportError:
-    CRAWLER_DEPENDENCIES_MET = False
-
-# determine the executable name based on OS
-WKHTMLTOPDF_EXEC = "wkhtmltopdf.exe" if platform.system() == "Windows" else "wkhtmltopdf"
+import time
+import logging
+import logging.handlers
+import sqlite3
+
+import wkhtml_engine
+from wkhtml_engine import LOG_MSG, PROGRESS_MSG, BATCH_STATS_MSG, ITEM_STATUS_MSG, ITEM_PENDING, EVENT_PHASE, EVENT_PROGRESS, DEFAULT_MAX_WORKERS, BatchConverter
+from wkhtml_inputs import InputStore, VirtualListView
+from wkhtml_jobqueue import JobQueue, follow_batch, start_local_worker
+import wkhtml_crawler
+from wkhtml_cache_proxy import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_MB
+from wkhtml_render_cache import DEFAULT_RENDER_CACHE_DIR, DEFAULT_RENDER_CACHE_MAX_MB
+from wkhtml_crawler import CRAWLER_DEPENDENCIES_MET, DEFAULT_CRAWL_WORKERS, DEFAULT_CRAWL_PER_HOST, DEFAULT_SIGNIFICANT_PARAMS, SiteCrawler, UrlCanonicalizer
+
+WKHTMLTOPDF_EXEC = wkhtml_engine.WKHTMLTOPDF_EXEC
 
 # constants for queue messages
-LOG_MSG = "LOG_MSG"
 MSGBOX_MSG = "MSGBOX_MSG"
 BUTTON_STATE_MSG = "BUTTON_STATE_MSG"
 ASK_PATH_MSG = "ASK_PATH_MSG"
 CRAWL_COMPLETE_SIGNAL = "CRAWL_COMPLETE_SIGNAL"
 
+# log pipeline: the widget keeps the last LOG_MAX_LINES lines, everything is also written to a rotating file
+LOG_MAX_LINES = 5000
+LOG_LINES_PER_TICK = 5000 # per queue, per 100 ms tick
+LOG_FILE = os.path.join(os.path.expanduser("~"), ".cache", "wkhtml_gui", "wkhtml_gui.log")
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+QUEUE_WORKER_LOG_FILE = os.path.join(os.path.dirname(LOG_FILE), "queue_worker.log") # console output of workers started from the gui
+
+
+def make_file_logger(path=LOG_FILE):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding='utf-8')
+    except OSError: return None
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger = logging.getLogger("wkhtml_gui")
+    logger.setLevel(logging.INFO); logger.propagate = False
+    logger.handlers = [handler]
+    return logger
+
 class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("WkHtmlToPdf GUI")
         self.geometry("700x900")
 
-        self.input_items = [] 
+        self.inputs = InputStore()
+        self._batch_items = [] # snapshot the running batch's item indices refer to
+        self._pending_log = [] # (line, tag) waiting for the next flush
+        self._log_batching = False
+        self.batch_converter = None # set while a batch runs, for the cancel button
+        self.queue_cancel_event = None # set while a submitted job queue batch is followed, for the cancel button
+        self.item_cost_hints = {} # crawled url -> size/link hints for longest-first scheduling
+        self._item_phases = {} # item index -> current wkhtmltopdf phase, for the conversion status label
+        self.file_logger = make_file_logger()
 
         # --- Input Section ---
         input_frame = ttk.LabelFrame(self, text="Input HTML Documents (Files or URLs)")
         input_frame.pack(padx=10, pady=10, fill="x")
-        self.input_listbox = tk.Listbox(input_frame, selectmode=tk.EXTENDED, height=6)
-        self.input_listbox.pack(side=tk.LEFT, fill="both", expand=True, padx=5, pady=5)
+        self.input_view = VirtualListView(input_frame, self.inputs, height=6)
+        self.input_view.pack(side=tk.LEFT, fill="both", expand=True, padx=5, pady=5)
         if DND_FILES:
-            self.input_listbox.drop_target_register(DND_FILES)
-            self.input_listbox.dnd_bind('<<Drop>>', self.add_dropped_files)
+            self.input_view.canvas.drop_target_register(DND_FILES)
+            self.input_view.canvas.dnd_bind('<<Drop>>', self.add_dropped_files)
         else:
             ttk.Label(input_frame, text="Install 'tkinterdnd2' for drag-and-drop.").pack(pady=2)
         input_buttons_frame = ttk.Frame(input_frame)
@@ -61,7 +92,7 @@ class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
         self.log_message("GUI Started. Each input item will be converted to a separate PDF.")
         self.check_wkhtmltopdf()
         if not CRAWLER_DEPENDENCIES_MET:
-            self.log_message("Crawler disabled: 'requests' and/or 'beautifulsoup4' not found.", error=True)
+            self.log_message("Crawler disabled: 'requests' not found.", error=True)
 
         self.crawl_log_queue = queue.Queue()
         self.crawl_url_queue = queue.Queue()
@@ -108,15 +139,56 @@ class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
         self.output_dir_var = tk.StringVar()
         ttk.Entry(output_frame, textvariable=self.output_dir_var, width=60).pack(side=tk.LEFT, fill="x", expand=True, padx=5, pady=5)
         ttk.Button(output_frame, text="Browse...", command=self.browse_output_directory).pack(side=tk.LEFT, padx=5, pady=5)
+        self.incremental_var = tk.BooleanVar()
+        ttk.Checkbutton(output_frame, text="Skip unchanged", variable=self.incremental_var).pack(side=tk.LEFT, padx=5, pady=5)
 
     def setup_command_execution_ui(self):
         cmd_frame = ttk.LabelFrame(self, text="Command & Execution")
         cmd_frame.pack(padx=10, pady=5, fill="x")
         self.command_preview_var = tk.StringVar()
         ttk.Entry(cmd_frame, textvariable=self.command_preview_var, state="readonly", font=("Courier", 9)).pack(fill="x", padx=5, pady=5)
+        batch_options_frame = ttk.Frame(cmd_frame)
+        batch_options_frame.pack(fill="x", padx=5)
+        ttk.Label(batch_options_frame, text="Max Concurrency:").pack(side=tk.LEFT, padx=(0, 2), pady=2)
+        self.max_workers_var = tk.StringVar(value=str(DEFAULT_MAX_WORKERS))
+        ttk.Spinbox(batch_options_frame, from_=1, to=max(64, DEFAULT_MAX_WORKERS), textvariable=self.max_workers_var, width=4).pack(side=tk.LEFT, padx=2, pady=2)
+        ttk.Label(batch_options_frame, text="Engine:").pack(side=tk.LEFT, padx=(15, 2), pady=2)
+        self.engine_var = tk.StringVar(value=wkhtml_engine.ENGINE_SUBPROCESS)
+        ttk.Combobox(batch_options_frame, textvariable=self.engine_var, values=list(wkhtml_engine.ENGINES), state="readonly", width=10).pack(side=tk.LEFT, padx=2, pady=2)
+        self.resource_cache_var = tk.BooleanVar()
+        ttk.Checkbutton(batch_options_frame, text="Shared Resource Cache (MB):", variable=self.resource_cache_var).pack(side=tk.LEFT, padx=(15, 2), pady=2)
+        self.resource_cache_mb_var = tk.StringVar(value=str(DEFAULT_CACHE_MAX_MB))
+        ttk.Entry(batch_options_frame, textvariable=self.resource_cache_mb_var, width=6).pack(side=tk.LEFT, padx=2, pady=2)
+        self.render_cache_var = tk.BooleanVar()
+        ttk.Checkbutton(batch_options_frame, text="Render Cache (MB):", variable=self.render_cache_var).pack(side=tk.LEFT, padx=(15, 2), pady=2)
+        self.render_cache_mb_var = tk.StringVar(value=str(DEFAULT_RENDER_CACHE_MAX_MB))
+        ttk.Entry(batch_options_frame, textvariable=self.render_cache_mb_var, width=6).pack(side=tk.LEFT, padx=2, pady=2)
+        batch_limits_frame = ttk.Frame(cmd_frame)
+        batch_limits_frame.pack(fill="x", padx=5)
+        ttk.Label(batch_limits_frame, text="Timeout per Item (s, 0=none):").pack(side=tk.LEFT, padx=(0, 2), pady=2)
+        self.item_timeout_var = tk.StringVar(value=str(wkhtml_engine.DEFAULT_ITEM_TIMEOUT))
+        ttk.Entry(batch_limits_frame, textvariable=self.item_timeout_var, width=6).pack(side=tk.LEFT, padx=2, pady=2)
+        ttk.Label(batch_limits_frame, text="Retries on Network Errors:").pack(side=tk.LEFT, padx=(15, 2), pady=2)
+        self.retries_var = tk.StringVar(value=str(wkhtml_engine.DEFAULT_RETRIES))
+        ttk.Spinbox(batch_limits_frame, from_=0, to=10, textvariable=self.retries_var, width=4).pack(side=tk.LEFT, padx=2, pady=2)
+        job_queue_frame = ttk.Frame(cmd_frame)
+        job_queue_frame.pack(fill="x", padx=5)
+        self.job_queue_var = tk.BooleanVar()
+        ttk.Checkbutton(job_queue_frame, text="Submit to Job Queue:", variable=self.job_queue_var).pack(side=tk.LEFT, padx=(0, 2), pady=2)
+        self.job_queue_path_var = tk.StringVar()
+        ttk.Entry(job_queue_frame, textvariable=self.job_queue_path_var, width=30).pack(side=tk.LEFT, fill="x", expand=True, padx=2, pady=2)
+        ttk.Button(job_queue_frame, text="Browse...", command=self.browse_job_queue_file).pack(side=tk.LEFT, padx=2, pady=2)
+        self.job_queue_local_worker_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(job_queue_frame, text="Start Local Worker", variable=self.job_queue_local_worker_var).pack(side=tk.LEFT, padx=(15, 2), pady=2)
         ttk.Button(cmd_frame, text="Generate Command Preview", command=self.update_command_preview).pack(side=tk.LEFT, padx=5, pady=5)
         self.convert_button = ttk.Button(cmd_frame, text="Convert to PDF(s)", command=self.start_batch_conversion)
         self.convert_button.pack(side=tk.RIGHT, padx=5, pady=5)
+        self.cancel_button = ttk.Button(cmd_frame, text="Cancel", command=self.cancel_batch_conversion, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, padx=5, pady=5)
+        self.batch_rate_var = tk.StringVar()
+        ttk.Label(cmd_frame, textvariable=self.batch_rate_var).pack(side=tk.RIGHT, padx=5, pady=5)
+        self.conversion_status_var = tk.StringVar()
+        ttk.Label(cmd_frame, textvariable=self.conversion_status_var).pack(side=tk.RIGHT, padx=5, pady=5)
 
     def setup_log_ui(self):
         log_frame = ttk.LabelFrame(self, text="Log / Status")
@@ -127,20 +199,33 @@ class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
         log_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.log_text.pack(fill="both", expand=True, padx=5, pady=5)
         self.log_text.tag_config("error_tag", foreground="orange")
+        if self.file_logger: self.log_message(f"Full log: {LOG_FILE}")
 
     def _add_input_item(self, item_value, display_text=None, update_preview=True):
-        if item_value not in self.input_items:
-            self.input_items.append(item_value)
-            actual_display_text = display_text if display_text is not None else item_value
-            self.input_listbox.insert(tk.END, actual_display_text)
+        if self.inputs.add(item_value, display_text):
             if update_preview: self.update_command_preview()
             return True
         return False
 
     def log_message(self, message, error=False):
+        if error: self._pending_log.append(("WARNING: " + message, "error_tag"))
+        else: self._pending_log.append((message, ()))
+        if not self._log_batching: self.flush_log() # direct calls show up immediately; queued lines wait for the tick
+
+    def flush_log(self):
+        # one insert, one trim and one scroll for everything logged since the last flush
+        if not self._pending_log: return
+        lines, self._pending_log = self._pending_log, []
+        if self.file_logger:
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+            try: self.file_logger.info("\n".join(f"{stamp} {line}" for line, _ in lines))
+            except Exception: pass
+        insert_args = []
+        for line, tag in lines[-LOG_MAX_LINES:]: insert_args += [line + "\n", tag]
         self.log_text.config(state=tk.NORMAL)
-        if error: self.log_text.insert(tk.END, "WARNING: " + message + "\n", "error_tag")
-        else: self.log_text.insert(tk.END, message + "\n")
+        self.log_text.insert(tk.END, *insert_args)
+        excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - LOG_MAX_LINES
+        if excess > 0: self.log_text.delete("1.0", f"{excess + 1}.0")
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
 
@@ -164,7 +249,7 @@ class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
     def add_files(self):
         files = filedialog.askopenfilenames(title="Select HTML Files", filetypes=(("HTML files", "*.html *.htm"), ("All files", "*.*")))
         if files:
-            added_count = sum(1 for f in files if self._add_input_item(f, os.path.basename(f) + f" ({f})", False))
+            added_count = len(self.inputs.add_many([(f, os.path.basename(f) + f" ({f})") for f in files]))
             if added_count > 0: self.log_message(f"Added {added_count} file(s)."); self.update_command_preview()
 
     def add_dropped_files(self, event):
@@ -172,12 +257,11 @@ class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
         dropped_files = re.findall(r'\{.*?\}|\S+', files_str) if '{' in files_str else files_str.split() 
         dropped_files = [f.strip('{}') for f in dropped_files]
         
-        added_count = 0
+        html_files = []
         for file_path in dropped_files:
-            if file_path.lower().endswith((".html", ".htm")) and os.path.exists(file_path):
-                if self._add_input_item(file_path, os.path.basename(file_path) + f" ({file_path})", update_preview=False):
-                    added_count +=1
+            if file_path.lower().endswith((".html", ".htm")) and os.path.exists(file_path): html_files.append((file_path, os.path.basename(file_path) + f" ({file_path})"))
             else: self.log_message(f"Skipped (not HTML/not found): {file_path}", error=True)
+        added_count = len(self.inputs.add_many(html_files))
         if added_count > 0: self.log_message(f"Added {added_count} file(s) via DND."); self.update_command_preview()
 
     def add_url_dialog(self):
@@ -187,13 +271,13 @@ class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
             else: self.log_message(f"URL already in list: {url}")
 
     def remove_selected(self):
-        selected_indices = self.input_listbox.curselection()
+        selected_indices = self.input_view.curselection()
         if not selected_indices: self.log_message("No items selected to remove.", error=True); return
-        for i in sorted(selected_indices, reverse=True): self.input_listbox.delete(i); del self.input_items[i]
-        self.log_message(f"Removed {len(selected_indices)} item(s)."); self.update_command_preview()
+        removed = self.inputs.remove_indices(selected_indices); self.input_view.clear_selection()
+        self.log_message(f"Removed {removed} item(s)."); self.update_command_preview()
 
     def clear_all(self):
-        self.input_listbox.delete(0, tk.END); self.input_items.clear()
+        self.inputs.clear(); self.input_view.clear_selection()
         self.log_message("Cleared all input items."); self.update_command_preview()
 
     def browse_output_directory(self):
@@ -201,43 +285,19 @@ class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
         if dir_path: self.output_dir_var.set(dir_path); self.log_message(f"Output directory: {dir_path}"); self.update_command_preview()
 
     def generate_pdf_filename_for_item(self, input_item_str):
-        if input_item_str.startswith("http://") or input_item_str.startswith("https://"):
-            parsed_url = urlparse(input_item_str)
-            path_part = os.path.basename(unquote(parsed_url.path))
-            if not path_part or path_part == "/":
-                path_elements = [elem for elem in unquote(parsed_url.path).strip('/').split('/') if elem]
-                if not path_elements: path_part = "index"
-                else: path_part = '_'.join(path_elements)
-            name_base = f"{parsed_url.netloc}_{path_part}"
-        else: # local file
-            name_base = os.path.splitext(os.path.basename(input_item_str))[0]
-
-        sanitized_name = re.sub(r'[^\w.\-]+', '_', name_base)
-        sanitized_name = re.sub(r'_+', '_', sanitized_name).strip('_')
-        if not sanitized_name: sanitized_name = "untitled_pdf"
-        return f"{sanitized_name[:150]}.pdf"
+        return wkhtml_engine.generate_pdf_filename_for_item(input_item_str)
+
+    def get_pdf_options(self):
+        return {"page_size": self.page_size_var.get(), "orientation": self.orientation_var.get(),
+                "grayscale": self.grayscale_var.get(), "disable_javascript": self.disable_js_var.get(), "toc": self.toc_var.get(),
+                "margin_top": self.margin_top_var.get(), "margin_bottom": self.margin_bottom_var.get(),
+                "margin_left": self.margin_left_var.get(), "margin_right": self.margin_right_var.get()}
 
     def build_single_item_command(self, input_item, output_pdf_path):
-        if not input_item or not output_pdf_path: return None
-        command = [WKHTMLTOPDF_EXEC]
-        command.extend(["--page-size", self.page_size_var.get()])
-        command.extend(["--orientation", self.orientation_var.get()])
-        if self.grayscale_var.get(): command.append("--grayscale")
-        if self.disable_js_var.get(): command.append("--disable-javascript")
-        else: command.append("--enable-javascript")
-
-        for opt, var_name_str in [("--margin-top", "margin_top_var"), ("--margin-bottom", "margin_bottom_var"), 
-                                  ("--margin-left", "margin_left_var"), ("--margin-right", "margin_right_var")]:
-            var_value = getattr(self, var_name_str).get()
-            if var_value: command.extend([opt, var_value + "mm"])
-        
-        if self.toc_var.get(): command.append("toc")
-        command.append(input_item)
-        command.append(output_pdf_path)
-        return command
+        return wkhtml_engine.build_single_item_command(self.get_pdf_options(), input_item, output_pdf_path, WKHTMLTOPDF_EXEC)
 
     def update_command_preview(self, event=None):
-        if not self.input_items:
+        if not len(self.inputs):
             self.command_preview_var.set("Add input items and select output directory.")
             return
         
@@ -246,13 +306,13 @@ class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
             self.command_preview_var.set("Select an output directory.")
             return
 
-        first_item = self.input_items[0]
+        first_item = self.inputs.value(0)
         example_output_filename = self.generate_pdf_filename_for_item(first_item)
         example_output_path = os.path.join(output_dir, example_output_filename)
         
         command_list = self.build_single_item_command(first_item, example_output_path)
         
-        num_items = len(self.input_items)
+        num_items = len(self.inputs)
         preview_text = f"Batch mode: {num_items} item(s) to directory '{os.path.basename(output_dir)}'.\n"
         if command_list:
             preview_text += f"Preview for first item: {subprocess.list2cmdline(command_list)}"
@@ -261,8 +321,13 @@ class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
         self.command_preview_var.set(preview_text)
 
 
+    def browse_job_queue_file(self):
+        path = filedialog.asksaveasfilename(title="Job Queue File", defaultextension=".sqlite", confirmoverwrite=False,
+                                            filetypes=[("Job queue", "*.sqlite"), ("All files", "*.*")])
+        if path: self.job_queue_path_var.set(path)
+
     def start_batch_conversion(self):
-        input_items_snapshot = list(self.input_items)
+        input_items_snapshot = self.inputs.values()
         output_directory = self.output_dir_var.get()
 
         if not input_items_snapshot:
@@ -272,60 +337,109 @@ class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
         if not os.path.isdir(output_directory):
             self.log_message(f"Output directory '{output_directory}' is not valid or does not exist.", error=True); messagebox.showerror("Error", f"Output directory '{output_directory}' is not valid or does not exist."); return
 
-        self.log_message(f"Starting batch conversion of {len(input_items_snapshot)} item(s)...")
+        try: max_workers = max(1, int(self.max_workers_var.get()))
+        except ValueError: self.log_message("Max concurrency must be a number.", error=True); messagebox.showerror("Invalid Input", "Max Concurrency must be a number."); return
+        try: batch_options = {"item_timeout": max(0.0, float(self.item_timeout_var.get())), "retries": max(0, int(self.retries_var.get()))}
+        except ValueError: messagebox.showerror("Invalid Input", "Timeout and retries must be numbers."); return
+        batch_options.update(engine=self.engine_var.get(), incremental=self.incremental_var.get(), cost_hints=dict(self.item_cost_hints))
+        if self.crawl_spool_var.get(): batch_options["spool_dir"] = wkhtml_engine.DEFAULT_SPOOL_DIR
+        if self.resource_cache_var.get():
+            try: batch_options.update(resource_cache_dir=DEFAULT_CACHE_DIR, resource_cache_mb=max(1, int(self.resource_cache_mb_var.get())))
+            except ValueError: messagebox.showerror("Invalid Input", "Resource cache size must be a number (MB)."); return
+        if self.render_cache_var.get():
+            try: batch_options.update(render_cache_dir=DEFAULT_RENDER_CACHE_DIR, render_cache_mb=max(1, int(self.render_cache_mb_var.get())))
+            except ValueError: messagebox.showerror("Invalid Input", "Render cache size must be a number (MB)."); return
+        queue_path = self.job_queue_path_var.get().strip() if self.job_queue_var.get() else None
+        if self.job_queue_var.get() and not queue_path: messagebox.showerror("Error", "Please choose a job queue file."); return
+
+        self.log_message(f"Starting batch conversion of {len(input_items_snapshot)} item(s) with up to {max_workers} concurrent process(es)...")
         self.convert_button.config(state=tk.DISABLED, text="Converting...")
-        
-        thread = threading.Thread(target=self.run_batch_conversion_thread, args=(input_items_snapshot, output_directory))
+        self.cancel_button.config(state=tk.NORMAL)
+        self.batch_rate_var.set("")
+        self._item_phases = {}
+        self._batch_items = input_items_snapshot; self.inputs.set_statuses(input_items_snapshot, ITEM_PENDING)
+        if queue_path:
+            self.queue_cancel_event = threading.Event()
+            thread = threading.Thread(target=self.run_queue_batch_thread, args=(input_items_snapshot, output_directory, queue_path, max_workers, self.get_pdf_options(),
+                                                                               self.job_queue_local_worker_var.get(), self.queue_cancel_event), kwargs=batch_options)
+        else: thread = threading.Thread(target=self.run_batch_conversion_thread, args=(input_items_snapshot, output_directory, max_workers, self.get_pdf_options()), kwargs=batch_options)
         thread.daemon = True
         thread.start()
 
-    def run_batch_conversion_thread(self, input_items_list, output_dir_path):
-        total_items = len(input_items_list)
-        success_count = 0
-        fail_count = 0
-
-        for i, item_url_or_file in enumerate(input_items_list):
-            self.conversion_log_queue.put((LOG_MSG, f"--- Processing item {i+1}/{total_items}: {item_url_or_file} ---", False))
-            
-            generated_pdf_name = self.generate_pdf_filename_for_item(item_url_or_file)
-            full_output_pdf_path = os.path.join(output_dir_path, generated_pdf_name)
-            
-            command = self.build_single_item_command(item_url_or_file, full_output_pdf_path)
-            if not command:
-                self.conversion_log_queue.put((LOG_MSG, f"Skipping {item_url_or_file}: Could not build command.", True)); fail_count += 1; continue
-            
-            self.conversion_log_queue.put((LOG_MSG, f"Output PDF: {full_output_pdf_path}", False))
-            self.conversion_log_queue.put((LOG_MSG, f"Command: {subprocess.list2cmdline(command)}", False))
-            
-            try:
-                process_creation_flags = subprocess.CREATE_NO_WINDOW if platform.system() == "Windows" else 0
-                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, 
-                                           universal_newlines=True, creationflags=process_creation_flags)
-                
-                for line in iter(process.stdout.readline, ''): self.conversion_log_queue.put((LOG_MSG, f"wkhtmltopdf (stdout): {line.strip()}", False))
-                for line in iter(process.stderr.readline, ''): self.conversion_log_queue.put((LOG_MSG, f"wkhtmltopdf (stderr): {line.strip()}", False))
-                
-                process.wait()
-
-                if process.returncode == 0: self.conversion_log_queue.put((LOG_MSG, f"Successfully converted: {item_url_or_file}", False)); success_count += 1
-                else: self.conversion_log_queue.put((LOG_MSG, f"Failed to convert {item_url_or_file}. Exit code: {process.returncode}", True)); fail_count += 1
-
-            except FileNotFoundError:
-                self.conversion_log_queue.put((LOG_MSG, f"'{WKHTMLTOPDF_EXEC}' not found. Install or set path.", True))
-                self.conversion_log_queue.put((MSGBOX_MSG, "showerror", "Error", f"'{WKHTMLTOPDF_EXEC}' not found. Conversion stopped."))
-                self.conversion_log_queue.put((ASK_PATH_MSG,)); fail_count = total_items - i; break
-            except Exception as e: self.conversion_log_queue.put((LOG_MSG, f"Error converting {item_url_or_file}: {e}", True)); fail_count += 1
-        
-        self.conversion_log_queue.put((LOG_MSG, f"--- Batch conversion finished. Success: {success_count}, Failed: {fail_count} ---", False))
+    def cancel_batch_conversion(self):
+        if self.batch_converter:
+            self.log_message("Cancelling batch: no new items will start, running items are being stopped...", error=True)
+            self.batch_converter.cancel()
+        if self.queue_cancel_event:
+            self.log_message("Cancelling the submitted batch: its queued and running jobs are being withdrawn...", error=True)
+            self.queue_cancel_event.set()
+        self.cancel_button.config(state=tk.DISABLED)
+
+    def run_batch_conversion_thread(self, input_items_list, output_dir_path, max_workers=1, pdf_options=None, **batch_options):
+        converter = BatchConverter(pdf_options or wkhtml_engine.DEFAULT_PDF_OPTIONS, output_dir_path, self.conversion_log_queue, max_workers, WKHTMLTOPDF_EXEC,
+                                   **batch_options)
+        self.batch_converter = converter
+        try: success_count, fail_count = converter.run(input_items_list)
+        finally: self.batch_converter = None
+        if converter.cancelled:
+            self.conversion_log_queue.put((BUTTON_STATE_MSG, "normal", "Convert to PDF(s)"))
+            self.conversion_log_queue.put((MSGBOX_MSG, "showinfo", "Batch Result", f"Batch cancelled after {success_count} successful conversion(s).")); return
+        if converter.exec_missing:
+            self.conversion_log_queue.put((MSGBOX_MSG, "showerror", "Error", f"'{WKHTMLTOPDF_EXEC}' not found. Conversion stopped."))
+            self.conversion_log_queue.put((ASK_PATH_MSG,))
         self.conversion_log_queue.put((BUTTON_STATE_MSG, "normal", "Convert to PDF(s)"))
         if fail_count > 0 and success_count == 0 and not WKHTMLTOPDF_EXEC: pass
         elif fail_count > 0: self.conversion_log_queue.put((MSGBOX_MSG, "showwarning", "Batch Result", f"Batch finished with {fail_count} failure(s). Check log."))
         elif success_count > 0: self.conversion_log_queue.put((MSGBOX_MSG, "showinfo", "Batch Result", f"Batch successfully converted {success_count} item(s)."))
 
+    def run_queue_batch_thread(self, input_items_list, output_dir_path, queue_path, max_workers, pdf_options, local_worker, cancel_event, **batch_options):
+        # submits one job per item and follows the queue; any worker serving queue_path renders them (this machine's, if local_worker)
+        try:
+            job_queue = JobQueue(queue_path)
+            batch_id = job_queue.submit(input_items_list, output_dir_path, pdf_options or wkhtml_engine.DEFAULT_PDF_OPTIONS,
+                                        {key: batch_options[key] for key in ("item_timeout", "retries", "incremental")}, batch_options.get("cost_hints"))
+        except sqlite3.Error as e:
+            self.conversion_log_queue.put((LOG_MSG, f"Could not submit to job queue {queue_path}: {e}", True))
+            self.conversion_log_queue.put((BUTTON_STATE_MSG, "normal", "Convert to PDF(s)")); self.queue_cancel_event = None; return
+        self.conversion_log_queue.put((LOG_MSG, f"Submitted batch {batch_id} ({len(input_items_list)} job(s)) to {queue_path}; waiting for workers...", False))
+        # caches and the libwkhtmltox path belong to the worker process, so only a worker started here gets the ones ticked here
+        worker_settings = {key: batch_options[key] for key in ("libwkhtmltox_path", "resource_cache_dir", "resource_cache_mb", "render_cache_dir", "render_cache_mb") if batch_options.get(key)}
+        cache_names = [name for key, name in (("resource_cache_dir", "Shared Resource Cache"), ("render_cache_dir", "Render Cache")) if key in worker_settings]
+        if cache_names and not local_worker:
+            self.conversion_log_queue.put((LOG_MSG, f"{' and '.join(cache_names)} not applied: queue workers use the caches they were started with "
+                                                    "(--resource-cache / --render-cache). Tick 'Start Local Worker' to run one with these settings.", True))
+        if batch_options.get("spool_dir"):
+            self.conversion_log_queue.put((LOG_MSG, "Reuse Crawled HTML does not apply to queued batches: workers download each page themselves.", True))
+        if local_worker:
+            try: start_local_worker(queue_path, max_workers, WKHTMLTOPDF_EXEC, batch_options.get("engine", wkhtml_engine.ENGINE_SUBPROCESS), log_path=QUEUE_WORKER_LOG_FILE, **worker_settings)
+            except OSError as e: self.conversion_log_queue.put((LOG_MSG, f"Could not start a local worker: {e}", True))
+            else: self.conversion_log_queue.put((LOG_MSG, "Started a local worker" + (f" with {' and '.join(cache_names)}" if cache_names else "") + f", log: {QUEUE_WORKER_LOG_FILE}", False))
+        try:
+            success_count, fail_count, _ = follow_batch(job_queue, batch_id, self.conversion_log_queue, cancel_event)
+            if cancel_event.is_set(): job_queue.cancel(batch_id); success_count, fail_count, _ = follow_batch(job_queue, batch_id, self.conversion_log_queue)
+        except sqlite3.Error as e:
+            self.conversion_log_queue.put((LOG_MSG, f"Lost the job queue {queue_path}: {e}", True)); success_count, fail_count = 0, 0
+        finally: job_queue.close(); self.queue_cancel_event = None
+        self.conversion_log_queue.put((LOG_MSG, f"--- Batch {batch_id} finished. Success: {success_count}, Failed: {fail_count} ---", False))
+        self.conversion_log_queue.put((BUTTON_STATE_MSG, "normal", "Convert to PDF(s)"))
+        if cancel_event.is_set(): self.conversion_log_queue.put((MSGBOX_MSG, "showinfo", "Batch Result", f"Batch cancelled after {success_count} successful conversion(s)."))
+        elif fail_count > 0: self.conversion_log_queue.put((MSGBOX_MSG, "showwarning", "Batch Result", f"Batch finished with {fail_count} failure(s). Check log."))
+        elif success_count > 0: self.conversion_log_queue.put((MSGBOX_MSG, "showinfo", "Batch Result", f"Batch successfully converted {success_count} item(s)."))
+
+    def show_item_progress(self, index, kind, payload):
+        if kind == EVENT_PHASE:
+            desc, step, steps = payload
+            if not step: self._item_phases.pop(index, None); return
+            self._item_phases[index] = f"{desc} ({step}/{steps})"
+            self.conversion_status_var.set(f"Item {index+1}: {self._item_phases[index]}")
+        elif kind == EVENT_PROGRESS:
+            self.conversion_status_var.set(f"Item {index+1}: {self._item_phases.get(index, '')} {payload[1]}".replace("  ", " "))
+
     def setup_crawler_ui(self):
         crawler_frame = ttk.LabelFrame(self, text="Site Crawler")
         crawler_frame.pack(padx=10, pady=5, fill="x")
-        if not CRAWLER_DEPENDENCIES_MET: ttk.Label(crawler_frame, text="Crawler disabled: 'requests'/'beautifulsoup4' missing.", foreground="red").pack(padx=5, pady=5); return
+        self.crawl_spool_var = tk.BooleanVar()
+        if not CRAWLER_DEPENDENCIES_MET: ttk.Label(crawler_frame, text="Crawler disabled: 'requests' missing.", foreground="red").pack(padx=5, pady=5); return
         crawl_options_frame = ttk.Frame(crawler_frame)
         crawl_options_frame.pack(fill="x", padx=5, pady=5)
         ttk.Label(crawl_options_frame, text="Start URL:").grid(row=0, column=0, padx=5, pady=2, sticky="w")
@@ -338,18 +452,44 @@ class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
         ttk.Entry(crawl_options_frame, textvariable=self.crawl_max_pages_var, width=7).grid(row=1, column=1, padx=5, pady=2, sticky="w")
         self.crawl_button = ttk.Button(crawl_options_frame, text="Crawl Site & Add URLs", command=self.start_crawl_operation)
         self.crawl_button.grid(row=1, column=2, padx=10, pady=5, sticky="e")
+        ttk.Label(crawl_options_frame, text="Concurrent Fetches / Per Host:").grid(row=2, column=0, padx=5, pady=2, sticky="w")
+        crawl_concurrency_frame = ttk.Frame(crawl_options_frame)
+        crawl_concurrency_frame.grid(row=2, column=1, padx=5, pady=2, sticky="w")
+        self.crawl_workers_var = tk.StringVar(value=str(DEFAULT_CRAWL_WORKERS))
+        ttk.Entry(crawl_concurrency_frame, textvariable=self.crawl_workers_var, width=4).pack(side=tk.LEFT)
+        ttk.Label(crawl_concurrency_frame, text=" / ").pack(side=tk.LEFT)
+        self.crawl_per_host_var = tk.StringVar(value=str(DEFAULT_CRAWL_PER_HOST))
+        ttk.Entry(crawl_concurrency_frame, textvariable=self.crawl_per_host_var, width=4).pack(side=tk.LEFT)
+        ttk.Checkbutton(crawl_options_frame, text="Reuse Crawled HTML", variable=self.crawl_spool_var).grid(row=2, column=2, padx=10, pady=2, sticky="w")
+        ttk.Label(crawl_options_frame, text="State File (resume):").grid(row=3, column=0, padx=5, pady=2, sticky="w")
+        self.crawl_state_path_var = tk.StringVar()
+        ttk.Entry(crawl_options_frame, textvariable=self.crawl_state_path_var, width=40).grid(row=3, column=1, padx=5, pady=2, sticky="ew")
+        ttk.Button(crawl_options_frame, text="Browse...", command=self.browse_crawl_state_file).grid(row=3, column=2, padx=10, pady=2, sticky="e")
+        ttk.Label(crawl_options_frame, text="Keep Query Params (*=all):").grid(row=4, column=0, padx=5, pady=2, sticky="w")
+        self.crawl_keep_params_var = tk.StringVar(value=", ".join(DEFAULT_SIGNIFICANT_PARAMS))
+        ttk.Entry(crawl_options_frame, textvariable=self.crawl_keep_params_var, width=40).grid(row=4, column=1, padx=5, pady=2, sticky="ew")
+        self.crawl_skip_duplicates_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(crawl_options_frame, text="Skip Duplicate Pages", variable=self.crawl_skip_duplicates_var).grid(row=4, column=2, padx=10, pady=2, sticky="w")
+        crawl_politeness_frame = ttk.Frame(crawl_options_frame)
+        crawl_politeness_frame.grid(row=5, column=0, columnspan=3, padx=5, pady=2, sticky="w")
+        self.crawl_respect_robots_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(crawl_politeness_frame, text="Respect robots.txt", variable=self.crawl_respect_robots_var).pack(side=tk.LEFT)
+        self.crawl_sitemaps_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(crawl_politeness_frame, text="Seed from sitemap.xml", variable=self.crawl_sitemaps_var).pack(side=tk.LEFT, padx=(15, 0))
+        ttk.Label(crawl_politeness_frame, text="Min Delay per Host (s):").pack(side=tk.LEFT, padx=(15, 2))
+        self.crawl_delay_var = tk.StringVar(value="0")
+        ttk.Entry(crawl_politeness_frame, textvariable=self.crawl_delay_var, width=5).pack(side=tk.LEFT)
         self.crawl_status_var = tk.StringVar(value="Crawler idle.")
-        ttk.Label(crawl_options_frame, textvariable=self.crawl_status_var).grid(row=2, column=0, columnspan=3, padx=5, pady=2, sticky="w")
+        ttk.Label(crawl_options_frame, textvariable=self.crawl_status_var).grid(row=6, column=0, columnspan=3, padx=5, pady=2, sticky="w")
         crawl_options_frame.columnconfigure(1, weight=1)
     
     def get_base_domain_for_scope(self, netloc):
-        parts = netloc.split('.')
-        if not parts or not parts[0]: return netloc 
-        if len(parts) == 1 or all(part.isdigit() for part in parts): return netloc
-        common_slds = {'co', 'com', 'org', 'net', 'ac', 'edu', 'gov', 'mil', 'ne', 'or'}
-        if len(parts) > 2 and parts[-2] in common_slds: return '.'.join(parts[-3:])
-        elif len(parts) >= 2: return '.'.join(parts[-2:])
-        else: return netloc
+        return wkhtml_crawler.get_base_domain_for_scope(netloc)
+
+    def browse_crawl_state_file(self):
+        path = filedialog.asksaveasfilename(title="Crawl State File", defaultextension=".sqlite", confirmoverwrite=False,
+                                            filetypes=[("Crawl state", "*.sqlite"), ("All files", "*.*")])
+        if path: self.crawl_state_path_var.set(path)
 
     def start_crawl_operation(self):
         if not CRAWLER_DEPENDENCIES_MET: self.log_message("Crawler disabled.", error=True); return
@@ -357,55 +497,31 @@ class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
         if not start_url.startswith(("http://", "https://")): messagebox.showerror("Invalid URL", "Start URL must be http:// or https://"); return
         try: max_pages = int(self.crawl_max_pages_var.get()); max_pages = 0 if max_pages < 0 else max_pages
         except ValueError: messagebox.showerror("Invalid Input", "Max Pages must be a number."); return
+        try: crawler_options = {"max_workers": max(1, int(self.crawl_workers_var.get())), "max_per_host": max(1, int(self.crawl_per_host_var.get())),
+                                "min_delay": max(0.0, float(self.crawl_delay_var.get() or 0))}
+        except ValueError: messagebox.showerror("Invalid Input", "Concurrent fetches, per-host limit and delay must be numbers."); return
+        crawler_options.update(respect_robots=self.crawl_respect_robots_var.get(), use_sitemaps=self.crawl_sitemaps_var.get())
+        crawler_options["state_path"] = self.crawl_state_path_var.get().strip() or None
+        if self.crawl_spool_var.get(): crawler_options["spool"] = wkhtml_engine.HtmlSpool(wkhtml_engine.DEFAULT_SPOOL_DIR)
+        crawler_options["canonicalizer"] = UrlCanonicalizer(self.crawl_keep_params_var.get().split(","))
+        if not self.crawl_skip_duplicates_var.get(): crawler_options.update(honor_canonical=False, near_duplicate_distance=None)
         
         self.crawl_button.config(state=tk.DISABLED); self.crawl_status_var.set("Starting crawl...")
         self.log_message(f"Crawl: {start_url} (Max: {max_pages if max_pages > 0 else 'unlimited'}, SubD: {self.crawl_include_subdomains_var.get()})")
-        self.log_message("Note: This crawler does not currently respect robots.txt.", error=True)
-        thread = threading.Thread(target=self.execute_crawl_thread, args=(start_url, self.crawl_include_subdomains_var.get(), max_pages))
+        if not crawler_options["respect_robots"]: self.log_message("Note: robots.txt is ignored for this crawl.", error=True)
+        thread = threading.Thread(target=self.execute_crawl_thread, args=(start_url, self.crawl_include_subdomains_var.get(), max_pages), kwargs=crawler_options)
         thread.daemon = True; thread.start()
 
-    def execute_crawl_thread(self, start_url, include_subdomains, max_pages):
+    def execute_crawl_thread(self, start_url, include_subdomains, max_pages, **crawler_options):
         try:
-            q_crawl = queue.Queue(); q_crawl.put(start_url)
-            visited_urls = set(); found_html_pages_count = 0
-            scope_domain = self.get_base_domain_for_scope(urlparse(start_url).netloc)
-            self.crawl_log_queue.put(f"Scope domain: {scope_domain}")
-            headers = {'User-Agent': "WkHtmlToPdfGUI-Crawler/1.0"}
-
-            while not q_crawl.empty() and (max_pages == 0 or found_html_pages_count < max_pages):
-                current_url = q_crawl.get()
-                parsed_c_url = urlparse(current_url)
-                current_url = urljoin(f"{parsed_c_url.scheme}://{parsed_c_url.netloc}", unquote(parsed_c_url.path))
-                if current_url in visited_urls: continue
-                visited_urls.add(current_url)
-                self.crawl_status_queue.put(f"Found: {found_html_pages_count}, Crawling: {current_url[:70]}...")
-                try:
-                    response = requests.get(current_url, headers=headers, timeout=10, allow_redirects=True)
-                    response.raise_for_status()
-                    if 'text/html' in response.headers.get('content-type', '').lower():
-                        self.crawl_url_queue.put(response.url)
-                        found_html_pages_count += 1
-                        soup = BeautifulSoup(response.text, 'html.parser')
-                        for link in soup.find_all('a', href=True):
-                            abs_url = urljoin(response.url, link['href'])
-                            parsed_a_url = urlparse(abs_url)
-                            if parsed_a_url.scheme not in ('http', 'https') or not parsed_a_url.netloc: continue
-                            abs_url = urljoin(f"{parsed_a_url.scheme}://{parsed_a_url.netloc}", unquote(parsed_a_url.path))
-                            
-                            in_scope = (parsed_a_url.netloc == scope_domain) or \
-                                       (include_subdomains and parsed_a_url.netloc.endswith("." + scope_domain))
-                            if in_scope and abs_url not in visited_urls: q_crawl.put(abs_url)
-                    else: self.crawl_log_queue.put(f"Skipped (not HTML): {current_url}")
-                except requests.exceptions.RequestException as e: self.crawl_log_queue.put(f"Crawl error for {current_url}: {e}")
-                except Exception as e: self.crawl_log_queue.put(f"Processing error {current_url}: {e}")
-            self.crawl_status_queue.put(f"Crawl finished. Found {found_html_pages_count} HTML pages.")
-            self.crawl_log_queue.put(f"Crawl completed. Added {found_html_pages_count} unique HTML pages.")
-        except Exception as e: self.crawl_log_queue.put(f"Critical crawl error: {e}"); self.crawl_status_queue.put("Crawl failed.")
+            SiteCrawler(start_url, include_subdomains, max_pages, log_queue=self.crawl_log_queue,
+                        url_queue=self.crawl_url_queue, status_queue=self.crawl_status_queue, **crawler_options).run()
         finally: self.crawl_status_queue.put(CRAWL_COMPLETE_SIGNAL)
 
     def process_background_queues(self):
-        # process crawler queues
-        while not self.crawl_log_queue.empty():
+        self._log_batching = True
+        # process crawler queues; log lines are capped per tick so a flood cannot starve the event loop
+        for _ in range(LOG_LINES_PER_TICK):
             try: self.log_message(f"CRAWL: {self.crawl_log_queue.get_nowait()}")
             except queue.Empty: break
         
@@ -418,38 +534,44 @@ class WkHtmlToPdfGUI(TkinterDnD.Tk if DND_FILES else tk.Tk):
                 else: self.crawl_status_var.set(status)
             except queue.Empty: break
 
-        # Process URLs found by crawler
-        added_new_url_from_crawl = False
+        # Process URLs found by crawler: one bulk add per tick
+        crawled_urls = []
         while not self.crawl_url_queue.empty(): 
             try:
-                url = self.crawl_url_queue.get_nowait()
-                if self._add_input_item(url, display_text=url, update_preview=False):
-                   added_new_url_from_crawl = True
+                url, hints = self.crawl_url_queue.get_nowait()
+                self.item_cost_hints[url] = hints
+                crawled_urls.append(url)
             except queue.Empty:
                 break 
         
-        if added_new_url_from_crawl: 
+        if crawled_urls and self.inputs.add_many(crawled_urls): 
             self.update_command_preview()
 
 
         # process conversion log queue
-        while not self.conversion_log_queue.empty():
+        for _ in range(LOG_LINES_PER_TICK):
             try:
                 msg_type, *payload = self.conversion_log_queue.get_nowait()
                 if msg_type == LOG_MSG: self.log_message(payload[0], error=payload[1])
-                elif msg_type == MSGBOX_MSG: getattr(messagebox, payload[0])(payload[1], payload[2])
+                elif msg_type == MSGBOX_MSG: self.flush_log(); getattr(messagebox, payload[0])(payload[1], payload[2])
+                elif msg_type == PROGRESS_MSG: self.show_item_progress(*payload)
+                elif msg_type == ITEM_STATUS_MSG: self.inputs.set_status(self._batch_items[payload[0]], payload[1])
+                elif msg_type == BATCH_STATS_MSG: self.batch_rate_var.set(f"{payload[0]}/{payload[1]} done, {payload[2]:.2f} items/s")
                 elif msg_type == BUTTON_STATE_MSG:
                     self.convert_button.config(state=(tk.NORMAL if payload[0] == "normal" else tk.DISABLED), text=payload[1])
-                elif msg_type == ASK_PATH_MSG: self.ask_wkhtmltopdf_path()
+                    if payload[0] == "normal": self.conversion_status_var.set(""); self.cancel_button.config(state=tk.DISABLED)
+                elif msg_type == ASK_PATH_MSG: self.flush_log(); self.ask_wkhtmltopdf_path()
             except queue.Empty: break
             except Exception as e: print(f"Error processing conversion queue: {e}")
 
+        self._log_batching = False
+        self.flush_log()
         self.after(100, self.process_background_queues)
 
 
 if __name__ == "__main__":
     if DND_FILES is None: print("tkinterdnd2 not found. DND disabled. (pip install tkinterdnd2)")
-    if not CRAWLER_DEPENDENCIES_MET: print("Crawler deps missing: 'requests','beautifulsoup4'. (pip install requests beautifulsoup4)")
+    if not CRAWLER_DEPENDENCIES_MET: print("Crawler deps missing: 'requests'. (pip install requests)")
     app = WkHtmlToPdfGUI()
     app.update_command_preview() 
     app.mainloop()
@@ -0,0 +1,178 @@
+import collections
+import threading
+import tkinter as tk
+from tkinter import ttk
+
+from wkhtml_engine import ITEM_DONE, ITEM_FAILED, ITEM_PENDING, ITEM_RUNNING
+
+# input list shared by both guis. InputStore keeps the items in order with a dict index (o(1) duplicate checks,
+# one-pass bulk add/remove) and a status per item; VirtualListView draws only the rows that are on screen,
+# so 100k+ items cost one screenful of canvas items instead of a Listbox entry each.
+
+ITEM_STATUSES = (ITEM_PENDING, ITEM_RUNNING, ITEM_DONE, ITEM_FAILED)
+STATUS_COLORS = {ITEM_PENDING: "#8a8a8a", ITEM_RUNNING: "#2f7fd8", ITEM_DONE: "#2e9e44", ITEM_FAILED: "#d9534f"}
+# the view redraws at most this often, and only when the store changed
+VIEW_POLL_MS = 100
+STATUS_COLUMN_WIDTH = 70
+
+
+class InputStore:
+    # ordered (value, display text, status) items; may be updated from worker threads, views poll `version`
+    def __init__(self):
+        self._items = [] # values in list order
+        self._records = {} # value -> [display text, status]
+        self._lock = threading.RLock()
+        self.counts = collections.Counter() # status -> items
+        self.version = 0 # bumped on every change
+
+    def __len__(self): return len(self._items)
+    def __contains__(self, value): return value in self._records
+
+    def values(self):
+        with self._lock: return list(self._items)
+
+    def value(self, index):
+        with self._lock: return self._items[index]
+
+    def rows(self, start, stop):
+        # [(value, display text, status)] for list positions start..stop-1
+        with self._lock: return [(value, *self._records[value]) for value in self._items[start:stop]]
+
+    def add_many(self, items):
+        # items: values or (value, display text) pairs; returns the values that were not already present
+        added = []
+        with self._lock:
+            for item in items:
+                value, display = item if isinstance(item, tuple) else (item, None)
+                if value in self._records: continue
+                self._records[value] = [value if display is None else display, ITEM_PENDING]
+                self._items.append(value); added.append(value)
+            if added: self.counts[ITEM_PENDING] += len(added); self.version += 1
+        return added
+
+    def add(self, value, display=None):
+        return bool(self.add_many([(value, display)]))
+
+    def remove_indices(self, indices):
+        doomed = set(indices)
+        if not doomed: return 0
+        with self._lock:
+            kept = []
+            for index, value in enumerate(self._items):
+                if index in doomed: self.counts[self._records.pop(value)[1]] -= 1
+                else: kept.append(value)
+            removed = len(self._items) - len(kept)
+            self._items = kept; self.version += 1
+        return removed
+
+    def clear(self):
+        with self._lock: self._items, self._records = [], {}; self.counts.clear(); self.version += 1
+
+    def set_status(self, value, status):
+        with self._lock:
+            record = self._records.get(value)
+            if record is None or record[1] == status: return # removed meanwhile, or no change
+            self.counts[record[1]] -= 1; self.counts[status] += 1
+            record[1] = status; self.version += 1
+
+    def set_statuses(self, values, status):
+        with self._lock:
+            for value in values: self.set_status(value, status)
+
+    def summary(self):
+        with self._lock: counts = [f"{self.counts[status]} {status}" for status in ITEM_STATUSES if self.counts[status]]
+        return f"{len(self._items)} item(s)" + (f": {', '.join(counts)}" if counts else "")
+
+
+class VirtualListView(tk.Frame):
+    # [status | text] rows of an InputStore drawn on a canvas. only the visible rows exist as canvas items;
+    # selection is a set of list positions (click, shift+click, ctrl+click, ctrl+a), read with curselection() like a Listbox
+    def __init__(self, parent, store, height=8, row_height=20, bg="white", fg="black", select_bg="#cce4ff", font=None, **kwargs):
+        super().__init__(parent, bg=bg, **kwargs)
+        self.store = store
+        self.row_height = row_height
+        self.fg, self.bg, self.select_bg, self.font = fg, bg, select_bg, font
+        self.top = 0 # list position of the first visible row
+        self.selection = set()
+        self._anchor = None
+        self._rows = [] # (background rect, status text, item text) canvas ids, one per visible row
+        self._drawn_version = None
+        self.summary_var = tk.StringVar(value=store.summary())
+        tk.Label(self, textvariable=self.summary_var, anchor="w", bg=bg, fg=fg).pack(side=tk.BOTTOM, fill="x")
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill="y")
+        self.canvas = tk.Canvas(self, height=height * row_height, bg=bg, highlightthickness=0, takefocus=1)
+        self.canvas.pack(side=tk.LEFT, fill="both", expand=True)
+        self.canvas.bind("<Configure>", lambda event: self._build_rows())
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<Shift-Button-1>", lambda event: self._on_click(event, extend=True))
+        self.canvas.bind("<Control-Button-1>", lambda event: self._on_click(event, toggle=True))
+        self.canvas.bind("<Control-a>", lambda event: self.select_all())
+        self.canvas.bind("<MouseWheel>", lambda event: self.scroll_to(self.top - (1 if event.delta > 0 else -1) * 3))
+        self.canvas.bind("<Button-4>", lambda event: self.scroll_to(self.top - 3))
+        self.canvas.bind("<Button-5>", lambda event: self.scroll_to(self.top + 3))
+        self.canvas.bind("<Prior>", lambda event: self.scroll_to(self.top - len(self._rows)))
+        self.canvas.bind("<Next>", lambda event: self.scroll_to(self.top + len(self._rows)))
+        self.after(VIEW_POLL_MS, self._poll)
+
+    def curselection(self):
+        return sorted(self.selection)
+
+    def clear_selection(self):
+        self.selection.clear(); self._anchor = None; self.redraw()
+
+    def select_all(self):
+        self.selection = set(range(len(self.store))); self.redraw()
+        return "break"
+
+    def scroll_to(self, top):
+        self.top = max(0, min(top, len(self.store) - len(self._rows)))
+        self.redraw()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto": self.scroll_to(int(float(amount) * len(self.store)))
+        else: self.scroll_to(self.top + int(amount) * (len(self._rows) if unit == "pages" else 1))
+
+    def _on_click(self, event, extend=False, toggle=False):
+        self.canvas.focus_set()
+        index = self.top + int(self.canvas.canvasy(event.y) // self.row_height)
+        if index >= len(self.store): return
+        if extend and self._anchor is not None: self.selection = set(range(min(self._anchor, index), max(self._anchor, index) + 1))
+        elif toggle: self.selection ^= {index}; self._anchor = index
+        else: self.selection = {index}; self._anchor = index
+        self.redraw()
+
+    def _build_rows(self):
+        # one set of canvas items per row that fits; redraw() only changes their text and colours
+        self.canvas.delete("all")
+        width, visible = max(1, self.canvas.winfo_width()), max(1, self.canvas.winfo_height() // self.row_height)
+        self._rows = []
+        for row in range(visible):
+            y = row * self.row_height
+            self._rows.append((self.canvas.create_rectangle(0, y, width, y + self.row_height, width=0, fill=self.bg),
+                               self.canvas.create_text(4, y + self.row_height // 2, anchor="w", font=self.font),
+                               self.canvas.create_text(STATUS_COLUMN_WIDTH, y + self.row_height // 2, anchor="w", fill=self.fg, font=self.font)))
+        self.scroll_to(self.top)
+
+    def redraw(self):
+        total = len(self.store)
+        if self.selection and max(self.selection) >= total: self.selection = {i for i in self.selection if i < total}
+        rows = self.store.rows(self.top, self.top + len(self._rows))
+        for i, (rect, status_id, text_id) in enumerate(self._rows):
+            if i < len(rows):
+                _, display, status = rows[i]
+                self.canvas.itemconfigure(rect, fill=self.select_bg if self.top + i in self.selection else self.bg)
+                self.canvas.itemconfigure(status_id, text=status, fill=STATUS_COLORS.get(status, self.fg))
+                self.canvas.itemconfigure(text_id, text=display)
+            else:
+                self.canvas.itemconfigure(rect, fill=self.bg)
+                self.canvas.itemconfigure(status_id, text=""); self.canvas.itemconfigure(text_id, text="")
+        self.scrollbar.set(*((self.top / total, min(1.0, (self.top + len(self._rows)) / total)) if total else (0.0, 1.0)))
+        self.summary_var.set(self.store.summary())
+        self._drawn_version = self.store.version
+
+    def _poll(self):
+        if self.store.version != self._drawn_version:
+            if self.top > max(0, len(self.store) - len(self._rows)): self.scroll_to(self.top) # list shrank under us
+            else: self.redraw()
+        self.after(VIEW_POLL_MS, self._poll)
@@ -0,0 +1,403 @@
+import argparse
+import contextlib
+import json
+import os
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from wkhtml_engine import (BATCH_STATS_MSG, DEFAULT_ITEM_TIMEOUT, DEFAULT_MAX_WORKERS, DEFAULT_RETRIES, DEFAULT_RETRY_BACKOFF, ENGINE_SUBPROCESS, ENGINES,
+                           ITEM_DONE, ITEM_FAILED, ITEM_PENDING, ITEM_RUNNING, ITEM_STATUS_MSG, LOG_MSG, WKHTMLTOPDF_EXEC, BatchConverter, ConsoleLog,
+                           ConversionManifest, estimate_item_cost, load_pdf_options, read_input_list)
+
+# distributed batches: a coordinator (the gui or `submit`) puts items into a job store, a sqlite file on local disk or on storage
+# every worker host mounts, and any number of worker processes lease jobs, renew the lease while rendering and mark them done or failed.
+# a lease that is not renewed expires and its job goes back to the queue, so a worker that dies only costs the time until its leases run out.
+#   python wkhtml_jobqueue.py submit --queue jobs.sqlite -i urls.txt -o out/ --wait
+#   python wkhtml_jobqueue.py worker --queue jobs.sqlite -j 4     (as many as you like, on this or other hosts)
+#   python wkhtml_jobqueue.py status --queue jobs.sqlite
+# lease expiry compares wall clocks of different hosts, keep them in sync (ntp) and leases much longer than any skew.
+
+JOB_QUEUED = "queued"
+JOB_LEASED = "leased"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_STATES = (JOB_QUEUED, JOB_LEASED, JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+JOB_ITEM_STATUS = {JOB_QUEUED: ITEM_PENDING, JOB_LEASED: ITEM_RUNNING, JOB_DONE: ITEM_DONE, JOB_FAILED: ITEM_FAILED, JOB_CANCELLED: ITEM_PENDING}
+
+DEFAULT_LEASE_SECONDS = 60.0
+HEARTBEATS_PER_LEASE = 3 # a lease survives two missed heartbeats
+DEFAULT_MAX_ATTEMPTS = 3 # leases of one job that may expire before it is failed as a worker killer
+WORKER_POLL_SECONDS = 1.0
+MONITOR_POLL_SECONDS = 1.0
+SQLITE_BUSY_TIMEOUT = 30.0
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class JobQueue:
+    # jobs in sqlite, shared by the coordinator and every worker; each process opens its own JobQueue.
+    # all writes run in BEGIN IMMEDIATE transactions, so two workers can never lease the same job. every change bumps a
+    # store-wide sequence number, which is what monitors poll (host clocks differ, the sequence does not).
+    # wal needs shared memory between the processes using it: pass wal=False when workers on other hosts open the file over nfs/smb.
+    def __init__(self, path, wal=True):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        self._lock = threading.RLock()
+        self.conn.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}"); self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction():
+            self.conn.execute("CREATE TABLE IF NOT EXISTS queue_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self.conn.execute("INSERT OR IGNORE INTO queue_meta (key, value) VALUES ('seq', 0)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS batches (id TEXT PRIMARY KEY, output_dir TEXT NOT NULL, options TEXT NOT NULL, "
+                              "settings TEXT NOT NULL, total INTEGER NOT NULL, created REAL NOT NULL)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, batch TEXT NOT NULL, position INTEGER NOT NULL, item TEXT NOT NULL, "
+                              "cost REAL NOT NULL DEFAULT 0, status TEXT NOT NULL, worker TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, "
+                              "max_attempts INTEGER NOT NULL, message TEXT, seconds REAL, seq INTEGER NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, cost)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_batch_seq ON jobs (batch, seq)")
+
+    def close(self):
+        with self._lock: self.conn.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try: yield
+            except BaseException: self.conn.execute("ROLLBACK"); raise
+            self.conn.execute("COMMIT")
+
+    def _next_seq(self):
+        self.conn.execute("UPDATE queue_meta SET value=value+1 WHERE key='seq'")
+        return self.conn.execute("SELECT value FROM queue_meta WHERE key='seq'").fetchone()[0]
+
+    def submit(self, items, output_dir, options, settings=None, cost_hints=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        # queues one job per item and returns the batch id. settings: item_timeout/retries/retry_backoff/incremental for the workers.
+        # costs use the same estimate as local batches, so workers lease the longest items first
+        batch_id = uuid.uuid4().hex[:12]
+        cost_hints = cost_hints or {}
+        manifest = ConversionManifest(output_dir) # render times of earlier runs
+        costs = [estimate_item_cost(item, cost_hints.get(item), manifest.render_seconds(item))[0] for item in items]
+        with self._transaction():
+            seq = self._next_seq()
+            self.conn.execute("INSERT INTO batches (id, output_dir, options, settings, total, created) VALUES (?, ?, ?, ?, ?, ?)",
+                              (batch_id, os.path.abspath(output_dir), json.dumps(options), json.dumps(settings or {}), len(items), time.time()))
+            self.conn.executemany("INSERT INTO jobs (batch, position, item, cost, status, max_attempts, seq) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                  ((batch_id, i, item, costs[i], JOB_QUEUED, max(1, max_attempts), seq) for i, item in enumerate(items)))
+        return batch_id
+
+    def _requeue_expired(self, now):
+        # expired leases go back to the queue; a job whose lease expired max_attempts times keeps killing workers and is failed
+        expired = self.conn.execute("SELECT id, attempts, max_attempts, worker FROM jobs WHERE status=? AND lease_expires<?", (JOB_LEASED, now)).fetchall()
+        if not expired: return 0
+        seq = self._next_seq()
+        for job_id, attempts, max_attempts, worker in expired:
+            if attempts >= max_attempts:
+                self.conn.execute("UPDATE jobs SET status=?, worker=NULL, lease_expires=NULL, message=?, seq=? WHERE id=?",
+                                  (JOB_FAILED, f"lease expired {attempts} time(s), last held by {worker}", seq, job_id))
+            else: self.conn.execute("UPDATE jobs SET status=?, worker=NULL, lease_expires=NULL, seq=? WHERE id=?", (JOB_QUEUED, seq, job_id))
+        return len(expired)
+
+    def requeue_expired(self):
+        with self._transaction(): return self._requeue_expired(time.time())
+
+    def lease(self, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        # the most expensive queued job as a dict (with its batch's output_dir/options/settings), or None when nothing is queued
+        with self._transaction():
+            now = time.time()
+            self._requeue_expired(now)
+            row = self.conn.execute("SELECT j.id, j.batch, j.position, j.item, j.attempts, b.output_dir, b.options, b.settings, b.total "
+                                    "FROM jobs j JOIN batches b ON b.id=j.batch WHERE j.status=? ORDER BY j.cost DESC, j.id LIMIT 1", (JOB_QUEUED,)).fetchone()
+            if not row: return None
+            self.conn.execute("UPDATE jobs SET status=?, worker=?, lease_expires=?, attempts=attempts+1, seq=? WHERE id=?",
+                              (JOB_LEASED, worker_id, now + lease_seconds, self._next_seq(), row[0]))
+        return {"id": row[0], "batch": row[1], "position": row[2], "item": row[3], "attempt": row[4] + 1, "output_dir": row[5],
+                "options": json.loads(row[6]), "settings": json.loads(row[7]), "total": row[8]}
+
+    def heartbeat(self, job_ids, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        # renews the leases this worker still holds; returns the ids it has lost (expired and requeued, or cancelled)
+        job_ids = list(job_ids)
+        if not job_ids: return []
+        with self._transaction():
+            placeholders = ",".join("?" * len(job_ids))
+            held = {row[0] for row in self.conn.execute(f"SELECT id FROM jobs WHERE id IN ({placeholders}) AND status=? AND worker=?", (*job_ids, JOB_LEASED, worker_id))}
+            self.conn.execute(f"UPDATE jobs SET lease_expires=? WHERE id IN ({placeholders}) AND status=? AND worker=?", (time.time() + lease_seconds, *job_ids, JOB_LEASED, worker_id))
+        return [job_id for job_id in job_ids if job_id not in held]
+
+    def complete(self, job_id, worker_id, ok, message=None, seconds=None):
+        # False when the lease was lost meanwhile; the job's state is then left to whoever holds it now
+        with self._transaction():
+            cursor = self.conn.execute("UPDATE jobs SET status=?, worker=?, lease_expires=NULL, message=?, seconds=?, seq=? WHERE id=? AND status=? AND worker=?",
+                                       (JOB_DONE if ok else JOB_FAILED, worker_id, message, seconds, self._next_seq(), job_id, JOB_LEASED, worker_id))
+        return cursor.rowcount == 1
+
+    def release(self, job_id, worker_id):
+        # hands a leased job back without counting the attempt, e.g. when its worker shuts down
+        with self._transaction():
+            self.conn.execute("UPDATE jobs SET status=?, worker=NULL, lease_expires=NULL, attempts=MAX(0, attempts-1), seq=? WHERE id=? AND status=? AND worker=?",
+                              (JOB_QUEUED, self._next_seq(), job_id, JOB_LEASED, worker_id))
+
+    def cancel(self, batch_id):
+        # queued and leased jobs of the batch are cancelled; workers drop their leases at the next heartbeat
+        with self._transaction():
+            return self.conn.execute("UPDATE jobs SET status=?, lease_expires=NULL, seq=? WHERE batch=? AND status IN (?, ?)",
+                                     (JOB_CANCELLED, self._next_seq(), batch_id, JOB_QUEUED, JOB_LEASED)).rowcount
+
+    def counts(self, batch_id=None):
+        # status -> jobs, for one batch or the whole queue
+        with self._lock:
+            if batch_id: rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs WHERE batch=? GROUP BY status", (batch_id,))
+            else: rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            counts = dict.fromkeys(JOB_STATES, 0); counts.update(rows.fetchall())
+        return counts
+
+    def batches(self):
+        # [(batch id, output dir, total, created)] newest first
+        with self._lock: return self.conn.execute("SELECT id, output_dir, total, created FROM batches ORDER BY created DESC").fetchall()
+
+    def workers(self):
+        # worker id -> jobs it holds right now
+        with self._lock: return dict(self.conn.execute("SELECT worker, COUNT(*) FROM jobs WHERE status=? GROUP BY worker", (JOB_LEASED,)).fetchall())
+
+    def changes(self, batch_id, since_seq=0):
+        # (latest seq, [(position, item, status, worker, message)]) for jobs of the batch changed after since_seq
+        with self._lock:
+            seq = self.conn.execute("SELECT value FROM queue_meta WHERE key='seq'").fetchone()[0]
+            rows = self.conn.execute("SELECT position, item, status, worker, message FROM jobs WHERE batch=? AND seq>? AND seq<=? ORDER BY seq, position",
+                                     (batch_id, since_seq, seq)).fetchall()
+        return seq, rows
+
+
+def follow_batch(job_queue, batch_id, log_queue, stop_event=None, poll_seconds=MONITOR_POLL_SECONDS):
+    # posts ITEM_STATUS_MSG / BATCH_STATS_MSG / failure lines for a submitted batch until no job is queued or leased
+    # (or stop_event is set); returns (done, failed, cancelled) counts
+    since_seq, started = 0, time.monotonic()
+    while True:
+        since_seq, rows = job_queue.changes(batch_id, since_seq)
+        for position, item, status, worker, message in rows:
+            log_queue.put((ITEM_STATUS_MSG, position, JOB_ITEM_STATUS[status]))
+            if status == JOB_FAILED: log_queue.put((LOG_MSG, f"Failed on {worker or 'queue'}: {item}" + (f" ({message})" if message else ""), True))
+        counts = job_queue.counts(batch_id)
+        finished = counts[JOB_DONE] + counts[JOB_FAILED]
+        if rows: log_queue.put((BATCH_STATS_MSG, finished, sum(counts.values()) - counts[JOB_CANCELLED], finished / max(1e-9, time.monotonic() - started)))
+        if not counts[JOB_QUEUED] and not counts[JOB_LEASED]: return counts[JOB_DONE], counts[JOB_FAILED], counts[JOB_CANCELLED]
+        if stop_event.wait(poll_seconds) if stop_event else time.sleep(poll_seconds): return counts[JOB_DONE], counts[JOB_FAILED], counts[JOB_CANCELLED]
+
+
+def start_local_worker(queue_path, max_workers=DEFAULT_MAX_WORKERS, wkhtmltopdf_exec=None, engine=ENGINE_SUBPROCESS, exit_when_idle=True, log_path=None,
+                       libwkhtmltox_path=None, resource_cache_dir=None, resource_cache_mb=None, render_cache_dir=None, render_cache_mb=None):
+    # a worker process on this machine; its console output goes to log_path (or is discarded). the library path and caches
+    # are settings of the worker, not of the batch: each worker serving the queue uses its own
+    command = [sys.executable, os.path.abspath(__file__), "worker", "--queue", queue_path, "-j", str(max_workers), "--engine", engine,
+               "--wkhtmltopdf", wkhtmltopdf_exec or WKHTMLTOPDF_EXEC]
+    if libwkhtmltox_path: command.extend(["--libwkhtmltox", libwkhtmltox_path])
+    if resource_cache_dir:
+        command.extend(["--resource-cache", resource_cache_dir])
+        if resource_cache_mb: command.extend(["--resource-cache-mb", str(resource_cache_mb)])
+    if render_cache_dir:
+        command.extend(["--render-cache", render_cache_dir])
+        if render_cache_mb: command.extend(["--render-cache-mb", str(render_cache_mb)])
+    if exit_when_idle: command.append("--exit-when-idle")
+    log_file = open(log_path, 'a', encoding='utf-8') if log_path else subprocess.DEVNULL
+    try: return subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT)
+    finally:
+        if log_path: log_file.close()
+
+
+class QueueWorker:
+    # leases up to max_workers jobs at a time and renders them with one BatchConverter per batch (set up on the batch's first job,
+    # finished, which writes its manifest and a per-worker timing report, once the batch has nothing left queued).
+    # several workers in incremental mode may save the same manifest; an entry lost that way only means one re-render next time
+    def __init__(self, queue_path, log_queue, max_workers=DEFAULT_MAX_WORKERS, wkhtmltopdf_exec=None, engine=ENGINE_SUBPROCESS, libwkhtmltox_path=None,
+                 resource_cache_dir=None, resource_cache_mb=None, lease_seconds=DEFAULT_LEASE_SECONDS, worker_id=None, exit_when_idle=False, wal=True,
+                 render_cache_dir=None, render_cache_mb=None):
+        self.queue = JobQueue(queue_path, wal)
+        self.log_queue = log_queue
+        self.max_workers = max(1, max_workers)
+        self.wkhtmltopdf_exec = wkhtmltopdf_exec or WKHTMLTOPDF_EXEC
+        self.engine = engine
+        self.libwkhtmltox_path = libwkhtmltox_path
+        self.resource_cache_dir = resource_cache_dir
+        self.resource_cache_mb = resource_cache_mb
+        self.render_cache_dir = render_cache_dir # workers sharing one directory reuse each other's renders and one size budget
+        self.render_cache_mb = render_cache_mb
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or default_worker_id()
+        self.exit_when_idle = exit_when_idle
+        self.success_count = 0
+        self.fail_count = 0
+        self.exec_missing = False
+        self._converters = {} # batch id -> started BatchConverter
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        # safe to call from any thread: running items are killed and their jobs handed back to the queue
+        self._stop_event.set()
+        for converter in list(self._converters.values()): converter.cancel()
+
+    def _converter_for(self, job):
+        converter = self._converters.get(job["batch"])
+        if converter is None:
+            settings = job["settings"]
+            report_name = re.sub(r"[^\w.-]", "_", f".wkhtml_timing.{self.worker_id}.json")
+            converter = BatchConverter(job["options"], job["output_dir"], self.log_queue, self.max_workers, self.wkhtmltopdf_exec, self.engine, self.libwkhtmltox_path,
+                                       settings.get("incremental", False), self.resource_cache_dir, self.resource_cache_mb,
+                                       item_timeout=settings.get("item_timeout", DEFAULT_ITEM_TIMEOUT), retries=settings.get("retries", DEFAULT_RETRIES),
+                                       retry_backoff=settings.get("retry_backoff", DEFAULT_RETRY_BACKOFF), report_path=os.path.join(job["output_dir"], report_name),
+                                       render_cache_dir=self.render_cache_dir, render_cache_mb=self.render_cache_mb)
+            converter.start()
+            self._converters[job["batch"]] = converter
+            self.log_queue.put((LOG_MSG, f"Worker {self.worker_id}: joined batch {job['batch']} ({job['total']} item(s)) -> {job['output_dir']}", False))
+        return converter
+
+    def _finish_idle_batches(self, in_flight):
+        busy = {job["batch"] for job, _, _ in in_flight.values()}
+        for batch_id in [b for b in self._converters if b not in busy]:
+            counts = self.queue.counts(batch_id)
+            if not counts[JOB_QUEUED] and not counts[JOB_LEASED]: self._converters.pop(batch_id).finish()
+
+    def _job_finished(self, job, future, started):
+        converter = self._converters[job["batch"]]
+        ok, messages = future.result()
+        for msg in messages: self.log_queue.put(msg)
+        if ok is None or converter.cancelled or converter.exec_missing:
+            # not rendered here (shutting down, or no wkhtmltopdf on this host): another worker gets it
+            self.queue.release(job["id"], self.worker_id)
+            if converter.exec_missing and not self.exec_missing:
+                self.exec_missing = True; self.log_queue.put((LOG_MSG, f"Worker {self.worker_id}: '{self.wkhtmltopdf_exec}' not found, leaving the queue.", True))
+                self.stop()
+            return
+        error = next((msg[1] for msg in reversed(messages) if msg[0] == LOG_MSG and msg[2]), None)
+        if not self.queue.complete(job["id"], self.worker_id, ok, None if ok else error, round(time.monotonic() - started, 3)):
+            if not job.get("lost"): self.log_queue.put((LOG_MSG, f"Worker {self.worker_id}: lease on {job['item']} was lost before it finished; result not recorded.", True))
+        elif ok: self.success_count += 1
+        else: self.fail_count += 1
+
+    def run(self):
+        # returns (succeeded, failed) once stopped, or when exit_when_idle and the queue has nothing queued or leased
+        self.log_queue.put((LOG_MSG, f"Worker {self.worker_id}: serving {self.queue.path} with up to {self.max_workers} item(s) at a time.", False))
+        in_flight = {} # job id -> (job, future, started)
+        heartbeat_every, last_heartbeat = self.lease_seconds / HEARTBEATS_PER_LEASE, time.monotonic()
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while True:
+                while len(in_flight) < self.max_workers and not self._stop_event.is_set():
+                    job = self.queue.lease(self.worker_id, self.lease_seconds)
+                    if job is None: break
+                    converter = self._converter_for(job)
+                    in_flight[job["id"]] = (job, pool.submit(converter.convert_item, job["position"], job["total"], job["item"]), time.monotonic())
+                if not in_flight:
+                    self._finish_idle_batches(in_flight)
+                    if self._stop_event.is_set(): break
+                    if self.exit_when_idle:
+                        counts = self.queue.counts()
+                        if not counts[JOB_QUEUED] and not counts[JOB_LEASED]: break
+                    self._stop_event.wait(WORKER_POLL_SECONDS); continue
+
+                done, _ = wait([future for _, future, _ in in_flight.values()], timeout=WORKER_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                for job_id in [job_id for job_id, (_, future, _) in in_flight.items() if future in done]:
+                    self._job_finished(*in_flight.pop(job_id))
+                if done: self._finish_idle_batches(in_flight)
+                if time.monotonic() - last_heartbeat >= heartbeat_every:
+                    last_heartbeat = time.monotonic()
+                    held = [job_id for job_id, (job, _, _) in in_flight.items() if not job.get("lost")]
+                    for job_id in self.queue.heartbeat(held, self.worker_id, self.lease_seconds):
+                        # cancelled, or expired while this host was stalled: the render finishes but is not recorded
+                        job = in_flight[job_id][0]; job["lost"] = True
+                        self.log_queue.put((LOG_MSG, f"Worker {self.worker_id}: no longer holds {job['item']}.", True))
+                        counts = self.queue.counts(job["batch"])
+                        if not counts[JOB_QUEUED] and not counts[JOB_LEASED]: self._converters[job["batch"]].cancel() # batch cancelled: stop its renders now
+        except KeyboardInterrupt:
+            self.stop(); raise
+        finally:
+            self._stop_event.set()
+            for converter in self._converters.values(): converter.cancel()
+            for job_id, (job, future, started) in list(in_flight.items()):
+                future.exception() # wait for the killed render
+                self.queue.release(job_id, self.worker_id)
+            pool.shutdown()
+            for converter in self._converters.values(): converter.finish()
+            self._converters.clear()
+            self.queue.close()
+        self.log_queue.put((LOG_MSG, f"Worker {self.worker_id} stopped. Success: {self.success_count}, Failed: {self.fail_count}", False))
+        return self.success_count, self.fail_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python wkhtml_jobqueue.py", description="Distributed wkhtmltopdf batches: submit jobs to a shared queue and run workers against it.")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--queue", required=True, help="sqlite job store shared by the coordinator and every worker")
+    common.add_argument("--no-wal", action="store_true", help="use a rollback journal; needed when workers on other hosts open the queue over a network filesystem")
+    commands = parser.add_subparsers(dest="command", required=True)
+    submit = commands.add_parser("submit", parents=[common], help="queue one job per input item")
+    submit.add_argument("-i", "--input-list", required=True, help="text file with one file path or URL per line")
+    submit.add_argument("-o", "--output-dir", required=True, help="directory for the generated PDFs, as seen by the workers")
+    submit.add_argument("--options", help="JSON file with PDF options (see DEFAULT_PDF_OPTIONS)")
+    submit.add_argument("--incremental", action="store_true", help="workers skip items whose source and options are unchanged since the last run")
+    submit.add_argument("--timeout", type=float, default=DEFAULT_ITEM_TIMEOUT, help="seconds before a single item is killed (0=no limit)")
+    submit.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="extra attempts for items failing with a transient network error")
+    submit.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help="leases of one job that may expire (its worker died) before it is failed")
+    submit.add_argument("--wait", action="store_true", help="follow the batch until every job is finished")
+    worker = commands.add_parser("worker", parents=[common], help="lease and render jobs until stopped")
+    worker.add_argument("-j", "--jobs", type=int, default=DEFAULT_MAX_WORKERS, help="items rendered at once by this worker")
+    worker.add_argument("--wkhtmltopdf", default=WKHTMLTOPDF_EXEC, help="path to the wkhtmltopdf executable")
+    worker.add_argument("--engine", choices=ENGINES, default=ENGINE_SUBPROCESS, help="render with wkhtmltopdf processes or in-process via libwkhtmltox")
+    worker.add_argument("--libwkhtmltox", help="path to libwkhtmltox (default: $WKHTMLTOX_LIB or the system library path)")
+    worker.add_argument("--resource-cache", metavar="DIR", help="serve shared CSS/JS/images/fonts from this on-disk cache via a local proxy")
+    worker.add_argument("--resource-cache-mb", type=int, default=512, help="size cap for --resource-cache")
+    worker.add_argument("--render-cache", metavar="DIR", help="reuse the PDF of any page rendered before with the same content and options")
+    worker.add_argument("--render-cache-mb", type=int, default=2048, help="size cap for --render-cache")
+    worker.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS, help="seconds a job stays leased without a heartbeat")
+    worker.add_argument("--worker-id", help="name shown in the queue (default: HOST-PID)")
+    worker.add_argument("--exit-when-idle", action="store_true", help="stop once nothing is queued or leased")
+    commands.add_parser("status", parents=[common], help="show job counts per batch and the workers holding leases")
+    cancel = commands.add_parser("cancel", parents=[common], help="cancel the queued and running jobs of a batch")
+    cancel.add_argument("batch")
+    args = parser.parse_args(argv)
+    log = ConsoleLog()
+
+    if args.command == "worker":
+        worker = QueueWorker(args.queue, log, args.jobs, args.wkhtmltopdf, args.engine, args.libwkhtmltox, args.resource_cache, args.resource_cache_mb,
+                             max(1.0, args.lease), args.worker_id, args.exit_when_idle, not args.no_wal,
+                             args.render_cache, args.render_cache_mb)
+        try: worker.run()
+        except KeyboardInterrupt: return 130
+        return 2 if worker.exec_missing else 0
+
+    job_queue = JobQueue(args.queue, not args.no_wal)
+    if args.command == "submit":
+        try: options = load_pdf_options(args.options); items = read_input_list(args.input_list)
+        except (OSError, ValueError) as e: parser.error(str(e))
+        if not os.path.isdir(args.output_dir): parser.error(f"Output directory '{args.output_dir}' is not valid or does not exist.")
+        if not items: log.put((LOG_MSG, "No input items to convert.", True)); return 1
+        batch_id = job_queue.submit(items, args.output_dir, options, {"item_timeout": args.timeout, "retries": max(0, args.retries), "incremental": args.incremental},
+                                    max_attempts=args.max_attempts)
+        print(batch_id)
+        if not args.wait: return 0
+        try: done, failed, cancelled = follow_batch(job_queue, batch_id, log)
+        except KeyboardInterrupt: return 130
+        log.put((LOG_MSG, f"--- Batch {batch_id} finished. Success: {done}, Failed: {failed}" + (f", Cancelled: {cancelled}" if cancelled else "") + " ---", False))
+        return 0 if failed == 0 else 1
+    if args.command == "cancel":
+        print(f"{job_queue.cancel(args.batch)} job(s) cancelled"); return 0
+
+    job_queue.requeue_expired()
+    for batch_id, output_dir, total, created in job_queue.batches():
+        counts = job_queue.counts(batch_id)
+        print(f"{batch_id}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(created))}  {total} item(s) -> {output_dir}: "
+              + ", ".join(f"{counts[state]} {state}" for state in JOB_STATES if counts[state]))
+    for worker_id, held in sorted(job_queue.workers().items()): print(f"worker {worker_id}: {held} job(s) leased")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
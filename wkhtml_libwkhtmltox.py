@@ -0,0 +1,240 @@
+import collections
+import ctypes
+import ctypes.util
+import itertools
+import multiprocessing
+import os
+import platform
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# in-process rendering through the libwkhtmltox c api (src/lib/pdf.h).
+# qt must be initialised once per process and driven from that process's main thread,
+# so each LibraryWorker owns a long-lived child process that calls wkhtmltopdf_init once
+# and then renders documents sent to it, streaming callback events back to the parent.
+
+LIBRARY_ENV_VAR = "WKHTMLTOX_LIB"
+LIBRARY_CANDIDATES = {
+    "Windows": ["wkhtmltox.dll", "wkhtmltox0.dll"],
+    "Darwin": ["libwkhtmltox.dylib", "libwkhtmltox.0.dylib", "/usr/local/lib/libwkhtmltox.dylib"],
+}.get(platform.system(), ["libwkhtmltox.so", "libwkhtmltox.so.0", "/usr/local/lib/libwkhtmltox.so", "/usr/lib/libwkhtmltox.so.0"])
+
+# seconds to wait for a worker to start and report the library version
+WORKER_START_TIMEOUT = 30
+
+# event kinds sent from a worker process to its parent
+EVENT_READY = "ready"
+EVENT_PHASE = "phase"
+EVENT_PROGRESS = "progress"
+EVENT_WARNING = "warning"
+EVENT_ERROR = "error"
+EVENT_DONE = "done"
+
+
+class LibraryWorkerError(Exception):
+    pass
+
+
+def find_libwkhtmltox(path=None):
+    # explicit path, then $WKHTMLTOX_LIB, then the linker search path and common install locations
+    for candidate in [path, os.environ.get(LIBRARY_ENV_VAR), ctypes.util.find_library("wkhtmltox")] + LIBRARY_CANDIDATES:
+        if not candidate: continue
+        try: ctypes.CDLL(candidate)
+        except OSError: continue
+        return candidate
+    return None
+
+
+def build_library_settings(options, input_item, output_pdf_path, proxy=None):
+    # same mapping as wkhtml_engine.build_single_item_command, expressed as c api settings
+    global_settings = {
+        "size.pageSize": options["page_size"], "orientation": options["orientation"],
+        "colorMode": "Grayscale" if options["grayscale"] else "Color", "out": output_pdf_path,
+    }
+    for name, key in [("margin.top", "margin_top"), ("margin.bottom", "margin_bottom"),
+                      ("margin.left", "margin_left"), ("margin.right", "margin_right")]:
+        value = str(options[key]).strip()
+        if value: global_settings[name] = value + "mm"
+    page_settings = {"page": input_item, "web.enableJavascript": "false" if options["disable_javascript"] else "true"}
+    if proxy: page_settings["load.proxy"] = proxy
+    objects = [{"isTableOfContent": "true"}] if options["toc"] else []
+    objects.append(page_settings)
+    return global_settings, objects
+
+
+def _load_library(lib_path):
+    lib = ctypes.CDLL(lib_path)
+    p, s, i = ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int
+    for name, restype, argtypes in [
+        ("wkhtmltopdf_init", i, [i]), ("wkhtmltopdf_deinit", i, []), ("wkhtmltopdf_version", s, []),
+        ("wkhtmltopdf_create_global_settings", p, []), ("wkhtmltopdf_create_object_settings", p, []),
+        ("wkhtmltopdf_set_global_setting", i, [p, s, s]), ("wkhtmltopdf_set_object_setting", i, [p, s, s]),
+        ("wkhtmltopdf_create_converter", p, [p]), ("wkhtmltopdf_destroy_converter", None, [p]),
+        ("wkhtmltopdf_add_object", None, [p, p, s]), ("wkhtmltopdf_convert", i, [p]),
+        ("wkhtmltopdf_current_phase", i, [p]), ("wkhtmltopdf_phase_count", i, [p]),
+        ("wkhtmltopdf_phase_description", s, [p, i]), ("wkhtmltopdf_http_error_code", i, [p]),
+        ("wkhtmltopdf_set_warning_callback", None, [p, p]), ("wkhtmltopdf_set_error_callback", None, [p, p]),
+        ("wkhtmltopdf_set_phase_changed_callback", None, [p, p]), ("wkhtmltopdf_set_progress_changed_callback", None, [p, p]),
+    ]:
+        func = getattr(lib, name); func.restype = restype; func.argtypes = argtypes
+    return lib
+
+
+_STR_CALLBACK = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.c_char_p)
+_INT_CALLBACK = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.c_int)
+_VOID_CALLBACK = ctypes.CFUNCTYPE(None, ctypes.c_void_p)
+
+
+def _enc(value):
+    return str(value).encode("utf-8")
+
+
+def _library_worker_main(lib_path, task_queue, event_queue):
+    # child process entry point; one task at a time, None shuts the worker down
+    try:
+        lib = _load_library(lib_path)
+        lib.wkhtmltopdf_init(0)
+    except Exception as e: event_queue.put((EVENT_ERROR, None, f"Could not initialise {lib_path}: {e}")); return
+    event_queue.put((EVENT_READY, None, (lib.wkhtmltopdf_version() or b"").decode("utf-8", "replace")))
+
+    while True:
+        task = task_queue.get()
+        if task is None: break
+        job_id, global_settings, objects = task
+        gs = lib.wkhtmltopdf_create_global_settings()
+        for name, value in global_settings.items(): lib.wkhtmltopdf_set_global_setting(gs, _enc(name), _enc(value))
+        converter = lib.wkhtmltopdf_create_converter(gs)
+
+        def on_phase(conv):
+            phase = lib.wkhtmltopdf_current_phase(conv)
+            desc = (lib.wkhtmltopdf_phase_description(conv, phase) or b"").decode("utf-8", "replace")
+            event_queue.put((EVENT_PHASE, job_id, (phase, lib.wkhtmltopdf_phase_count(conv), desc)))
+        # keep references to the ctypes thunks until the converter is destroyed
+        callbacks = [
+            _VOID_CALLBACK(on_phase),
+            _INT_CALLBACK(lambda conv, value: event_queue.put((EVENT_PROGRESS, job_id, value))),
+            _STR_CALLBACK(lambda conv, msg: event_queue.put((EVENT_WARNING, job_id, (msg or b"").decode("utf-8", "replace")))),
+            _STR_CALLBACK(lambda conv, msg: event_queue.put((EVENT_ERROR, job_id, (msg or b"").decode("utf-8", "replace")))),
+        ]
+        lib.wkhtmltopdf_set_phase_changed_callback(converter, ctypes.cast(callbacks[0], ctypes.c_void_p))
+        lib.wkhtmltopdf_set_progress_changed_callback(converter, ctypes.cast(callbacks[1], ctypes.c_void_p))
+        lib.wkhtmltopdf_set_warning_callback(converter, ctypes.cast(callbacks[2], ctypes.c_void_p))
+        lib.wkhtmltopdf_set_error_callback(converter, ctypes.cast(callbacks[3], ctypes.c_void_p))
+
+        for object_settings in objects:
+            os_ptr = lib.wkhtmltopdf_create_object_settings()
+            for name, value in object_settings.items(): lib.wkhtmltopdf_set_object_setting(os_ptr, _enc(name), _enc(value))
+            lib.wkhtmltopdf_add_object(converter, os_ptr, None)
+
+        ok = bool(lib.wkhtmltopdf_convert(converter))
+        http_error_code = lib.wkhtmltopdf_http_error_code(converter)
+        lib.wkhtmltopdf_destroy_converter(converter)
+        event_queue.put((EVENT_DONE, job_id, (ok, http_error_code)))
+
+    lib.wkhtmltopdf_deinit()
+
+
+class LibraryWorker:
+    # parent-side handle for one rendering process
+    _job_ids = itertools.count(1)
+
+    def __init__(self, lib_path):
+        # spawn, not fork: the parent may already be running tk and worker threads
+        ctx = multiprocessing.get_context("spawn")
+        self.task_queue = ctx.Queue()
+        self.event_queue = ctx.Queue()
+        self.process = ctx.Process(target=_library_worker_main, args=(lib_path, self.task_queue, self.event_queue), daemon=True)
+        self.process.start()
+        try: kind, _, payload = self.event_queue.get(timeout=WORKER_START_TIMEOUT)
+        except queue.Empty: kind, payload = EVENT_ERROR, "worker did not start in time"
+        if kind != EVENT_READY: self.close(); raise LibraryWorkerError(payload)
+        self.version = payload
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def convert(self, global_settings, objects, on_event=None, timeout=None, cancel_event=None):
+        # blocks until the document is rendered; on_event(kind, payload) sees every callback event.
+        # qt cannot abort a conversion from outside, so a timeout or cancel kills the worker process
+        job_id = next(self._job_ids)
+        deadline = time.monotonic() + timeout if timeout else None
+        self.task_queue.put((job_id, global_settings, objects))
+        while True:
+            try: kind, event_job_id, payload = self.event_queue.get(timeout=0.5)
+            except queue.Empty:
+                if not self.process.is_alive(): raise LibraryWorkerError(f"worker exited with code {self.process.exitcode}")
+                kind = event_job_id = None
+            if cancel_event is not None and cancel_event.is_set(): self.close(force=True); raise LibraryWorkerError("batch cancelled")
+            if deadline and time.monotonic() > deadline: self.close(force=True); raise LibraryWorkerError(f"timed out after {timeout}s")
+            if event_job_id != job_id: continue
+            if kind == EVENT_DONE: return payload
+            if on_event: on_event(kind, payload)
+
+    def close(self, force=False):
+        if self.process.is_alive() and not force:
+            try: self.task_queue.put(None); self.process.join(5)
+            except Exception: pass
+        if self.process.is_alive(): self.process.kill(); self.process.join()
+
+
+class WorkerPool:
+    # hands out up to `size` warm workers made by _create() (anything with is_alive() and close()); a worker that dies is
+    # replaced on the next acquire. acquire waits while all of them are in use, and release or discard wakes it, so callers
+    # may outnumber the workers
+    def __init__(self, size):
+        self.size = max(1, size)
+        self._idle = collections.deque()
+        self._created = 0
+        self._cond = threading.Condition()
+        self._all = []
+
+    def _create(self):
+        raise NotImplementedError
+
+    def acquire(self):
+        while True:
+            with self._cond:
+                while not self._idle and self._created >= self.size: self._cond.wait()
+                worker = self._idle.popleft() if self._idle else None
+                if worker is None: self._created += 1 # slot reserved; the worker is started outside the lock
+            if worker is None:
+                try: worker = self._create()
+                except Exception:
+                    with self._cond: self._created -= 1; self._cond.notify()
+                    raise
+                with self._cond: self._all.append(worker)
+            if worker.is_alive(): return worker
+            self.discard(worker)
+
+    def prewarm(self):
+        # starts every worker now, side by side, instead of on first use
+        with ThreadPoolExecutor(max_workers=self.size) as starter: workers = list(starter.map(lambda _: self.acquire(), range(self.size)))
+        for worker in workers: self.release(worker)
+
+    def release(self, worker):
+        if not worker.is_alive(): self.discard(worker); return
+        with self._cond: self._idle.append(worker); self._cond.notify()
+
+    def discard(self, worker):
+        # the slot is freed for a replacement, which a waiting acquire starts
+        worker.close()
+        with self._cond:
+            self._created -= 1
+            if worker in self._all: self._all.remove(worker)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond: workers, self._all = list(self._all), []; self._idle.clear()
+        for worker in workers: worker.close()
+
+
+class LibraryWorkerPool(WorkerPool):
+    # LibraryWorkers, each a child process with libwkhtmltox loaded
+    def __init__(self, lib_path, size):
+        super().__init__(size)
+        self.lib_path = lib_path
+
+    def _create(self):
+        return LibraryWorker(self.lib_path)
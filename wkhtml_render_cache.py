@@ -0,0 +1,192 @@
+import collections
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from urllib.parse import unquote
+
+from wkhtml_engine import base_href_tag, is_url
+
+# content-addressed pdf cache: a page whose normalised bytes and full option set were rendered before is
+# hard-linked (or copied) from the cache instead of being rendered again. lru eviction past a size budget.
+
+DEFAULT_RENDER_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "wkhtml_gui", "renders")
+DEFAULT_RENDER_CACHE_MAX_MB = 2048
+RENDER_CACHE_KEY_VERSION = b"wkhtml-render-cache-1"
+# src/href/url(...) references with their value; a relative one makes the render depend on where the page lives
+# and, for local pages, on the files it points to
+REF_RE = re.compile(rb'''\b(srcset|src|href|poster|background|data)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"']+))'''
+                    rb'''|url\(\s*(?:"([^"]*)"|'([^']*)'|([^)\s"']+))|@import\s+(?:"([^"]*)"|'([^']*)')''', re.I)
+ABSOLUTE_REF_RE = re.compile(rb'(?:[a-z][a-z0-9+.-]*:|//|#)', re.I)
+MAX_STYLESHEET_DEPTH = 4 # @import / url() chains followed from local stylesheets
+# other processes (queue workers, the gui and headless batches) may share the directory: a store rescans it when
+# someone else changed it since this process last looked, when this process's own count goes over the budget, and
+# at least this often (for filesystems with coarse directory mtimes)
+RENDER_CACHE_RESCAN_INTERVAL = 60.0
+RENDER_CACHE_STALE_TMP = 3600.0
+
+
+def normalized_page_bytes(data, base=None):
+    # drops the <base> tag HtmlSpool injects into spooled copies (it is accounted for by base) and line ending differences
+    if base and is_url(base): data = data.replace(base_href_tag(base), b"", 1)
+    return data.replace(b"\r\n", b"\n")
+
+
+def relative_refs(data):
+    # relative references in html or css, in order of appearance (srcset candidates one by one)
+    for match in REF_RE.finditer(data):
+        value = next(group for group in match.groups()[1:] if group is not None).strip()
+        candidates = [part.split()[0] for part in value.split(b",") if part.strip()] if match.group(1) and match.group(1).lower() == b"srcset" else [value]
+        for ref in candidates:
+            if ref and not ABSOLUTE_REF_RE.match(ref): yield ref
+
+
+def local_asset_state(data, base_dir):
+    # (path, size, mtime) of every local file the page refers to, following stylesheets into their own imports and
+    # url()s, so editing a stylesheet or image next to an unchanged page changes the cache key
+    state, seen, pending = [], set(), [(data, base_dir, 0)]
+    while pending:
+        data, base_dir, depth = pending.pop()
+        for ref in relative_refs(data):
+            path = unquote(ref.decode("utf-8", "surrogateescape").split("#", 1)[0].split("?", 1)[0])
+            if not path: continue
+            path = os.path.normpath(os.path.join(base_dir, path))
+            if path in seen: continue
+            seen.add(path)
+            try: st = os.stat(path); state.append(f"{path}\0{st.st_size}\0{st.st_mtime_ns}")
+            except OSError: state.append(f"{path}\0missing"); continue
+            if path.lower().endswith(".css") and depth < MAX_STYLESHEET_DEPTH:
+                try:
+                    with open(path, 'rb') as f: pending.append((f.read(), os.path.dirname(path), depth + 1))
+                except OSError: pass
+    return sorted(state)
+
+
+class RenderCache:
+    # key -> <key>.pdf on disk, evicting least recently used entries (by mtime, which fetch refreshes) past max_bytes.
+    # several processes may share one directory: entries stored by the others are picked up on lookup, and the budget
+    # applies to the directory as a whole
+    def __init__(self, cache_dir, max_mb=DEFAULT_RENDER_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int((max_mb or DEFAULT_RENDER_CACHE_MAX_MB) * 1048576)
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict() # key -> size, oldest use first
+        self.total_bytes = 0
+        self._scanned_at = 0.0
+        self._dir_mtime = None # directory mtime after this process's last change to it
+        os.makedirs(cache_dir, exist_ok=True)
+        self._rescan()
+
+    def _rescan(self):
+        # rebuilds the entries from the directory, including pdfs other processes stored, then evicts past the budget
+        existing = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".tmp"):
+                try: # left over from an interrupted store; a recent one may still be written by another process
+                    if time.time() - os.path.getmtime(path) > RENDER_CACHE_STALE_TMP: os.remove(path)
+                except OSError: pass
+            elif name.endswith(".pdf"):
+                try: st = os.stat(path); existing.append((st.st_mtime, name[:-4], st.st_size))
+                except OSError: pass
+        entries = collections.OrderedDict((key, size) for _, key, size in sorted(existing))
+        with self._lock:
+            self._entries, self.total_bytes, self._scanned_at = entries, sum(entries.values()), time.monotonic()
+            self._evict()
+            self._dir_mtime = self._stat_dir()
+
+    def _stat_dir(self):
+        try: return os.stat(self.cache_dir).st_mtime_ns
+        except OSError: return None
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".pdf")
+
+    def count(self, name, amount=1):
+        with self._lock: self.stats[name] += amount
+
+    def key_for(self, source_path, options_key, base=None):
+        # base is the url or directory the page is rendered from; it only becomes part of the key when the page
+        # has relative references, so identical self-contained pages share one entry wherever they come from.
+        # for a local page the size and mtime of the files those references lead to are part of the key as well
+        try:
+            with open(source_path, 'rb') as f: data = normalized_page_bytes(f.read(), base)
+        except OSError: self.count("uncacheable"); return None
+        digest = hashlib.sha256(RENDER_CACHE_KEY_VERSION + b"\0" + options_key.encode("utf-8") + b"\0")
+        if base and next(relative_refs(data), None) is not None:
+            if is_url(base): base = base.split("#", 1)[0].split("?", 1)[0]
+            else:
+                for asset in local_asset_state(data, base): digest.update(asset.encode("utf-8", "surrogateescape") + b"\0")
+            digest.update(base.encode("utf-8", "surrogateescape"))
+        digest.update(b"\0"); digest.update(data)
+        return digest.hexdigest()
+
+    def fetch(self, key, pdf_path):
+        # puts the cached pdf at pdf_path; False on a miss
+        with self._lock: size = self._entries.get(key)
+        cached_path, tmp_path = self._path(key), pdf_path + ".cache.tmp"
+        if size is None: # possibly stored by another process since the last scan
+            try: size = os.path.getsize(cached_path)
+            except OSError: self.count("misses"); return False
+        with self._lock:
+            if key not in self._entries: self.total_bytes += size
+            self._entries[key] = size; self._entries.move_to_end(key)
+        try:
+            os.utime(cached_path)
+            try: os.remove(tmp_path)
+            except FileNotFoundError: pass
+            try: os.link(cached_path, tmp_path) # no copy when the cache and the output share a filesystem
+            except OSError: shutil.copyfile(cached_path, tmp_path)
+            os.replace(tmp_path, pdf_path)
+        except OSError:
+            self.discard(key); self.count("misses"); return False
+        with self._lock: self.stats["hits"] += 1; self.stats["bytes_reused"] += size
+        return True
+
+    def store(self, key, pdf_path):
+        # copies (never links) so a later render over pdf_path cannot touch the cached copy
+        try: size = os.path.getsize(pdf_path)
+        except OSError: return
+        if not size or size > self.max_bytes: return
+        cached_path = self._path(key)
+        tmp_path = f"{cached_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        changed_elsewhere = self._stat_dir() != self._dir_mtime
+        try: shutil.copyfile(pdf_path, tmp_path); os.replace(tmp_path, cached_path)
+        except OSError:
+            try: os.remove(tmp_path)
+            except OSError: pass
+            return
+        with self._lock:
+            self.total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self.stats["stored"] += 1
+            rescan = changed_elsewhere or self.total_bytes > self.max_bytes or time.monotonic() - self._scanned_at > RENDER_CACHE_RESCAN_INTERVAL
+            if not rescan: self._dir_mtime = self._stat_dir()
+        if rescan: self._rescan() # counts what the other processes stored before evicting anything
+
+    def discard(self, key):
+        with self._lock: self.total_bytes -= self._entries.pop(key, 0)
+        try: os.remove(self._path(key))
+        except OSError: pass
+
+    def _evict(self):
+        # caller holds the lock; entries already linked into output folders keep their own link. a pdf another
+        # process still counts is simply a miss there (fetch drops it)
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size; self.stats["evicted"] += 1
+            try: os.remove(self._path(key))
+            except OSError: pass
+
+    def summary(self):
+        self._rescan() # size used by the directory as a whole, other processes' pdfs included
+        with self._lock: stats = dict(self.stats)
+        hits, lookups = stats.get("hits", 0), stats.get("hits", 0) + stats.get("misses", 0)
+        ratio = f"{100.0 * hits / lookups:.1f}%" if lookups else "n/a"
+        return (f"Render cache: {hits} hit(s), {stats.get('misses', 0)} miss(es), hit ratio {ratio}, "
+                f"{stats.get('bytes_reused', 0) / 1048576:.1f} MB of PDFs reused, {stats.get('stored', 0)} stored, "
+                f"{stats.get('evicted', 0)} evicted, {stats.get('uncacheable', 0)} uncacheable; "
+                f"{self.total_bytes / 1048576:.1f}/{self.max_bytes / 1048576:.0f} MB used.")
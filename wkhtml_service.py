@@ -0,0 +1,406 @@
+import argparse
+import collections
+import json
+import math
+import os
+import queue
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from wkhtml_engine import (DEFAULT_MAX_WORKERS, DEFAULT_PDF_OPTIONS, ENGINE_LIBRARY, ENGINE_SUBPROCESS, ENGINES, EVENT_PHASE, EVENT_PROGRESS, ITEM_DONE, ITEM_FAILED, ITEM_PENDING,
+                           ITEM_RUNNING, LOG_MSG, WKHTMLTOPDF_EXEC, ConsoleLog, _pump_lines, add_base_href, build_single_item_command, is_url,
+                           kill_process_tree, load_pdf_options, parse_progress_line, percentile)
+from wkhtml_libwkhtmltox import LibraryWorkerError, LibraryWorkerPool, WorkerPool, build_library_settings, find_libwkhtmltox
+
+# long-running render service for other programs: POST html or a url plus options, get the pdf back, or a job id to fetch it later.
+# renderers are started once and kept warm: wkhtmltopdf processes running with --read-args-from-stdin, which render one command line
+# after another without starting qt/webkit again, or libwkhtmltox worker processes (--engine library).
+# requests beyond the renderers wait in a bounded queue; when it is full the service answers 429 with a Retry-After estimate.
+#   python wkhtml_service.py --port 8710 -j 4 --max-queue 32
+#   curl --data-binary @page.html -H 'Content-Type: text/html' 'http://127.0.0.1:8710/render?page_size=Letter' -o page.pdf
+#   curl -X POST 'http://127.0.0.1:8710/render?url=https://example.com/&async=1'    -> 202 {"job": ...}
+#   curl http://127.0.0.1:8710/jobs/JOB; curl http://127.0.0.1:8710/jobs/JOB/pdf -o page.pdf; curl http://127.0.0.1:8710/metrics
+# pages are rendered with the service user's rights (local files, intranet urls): bind it to trusted interfaces only.
+
+DEFAULT_PORT = 8710
+DEFAULT_MAX_QUEUE = 32 # requests waiting for a renderer before new ones get 429
+DEFAULT_RENDER_TIMEOUT = 60
+MAX_BODY_BYTES = 50 * 1024 * 1024
+RESULT_TTL = 600 # seconds an async job's pdf is kept after it finished
+CLEANUP_INTERVAL = 30
+METRICS_WINDOW = 1000 # latency percentiles cover the most recent renders
+STDIN_RENDERER_KEEP_LINES = 20 # stderr lines kept for the error message of a failed render
+CONTROL_PARAMS = ("url", "html", "base_url", "async", "options")
+PDF_CHUNK_BYTES = 64 * 1024
+
+
+def merge_render_options(defaults, overrides):
+    # request options on top of the service's; values arrive as query strings or json. ValueError names the bad option
+    options = dict(defaults)
+    for key, value in (overrides or {}).items():
+        if key not in DEFAULT_PDF_OPTIONS: raise ValueError(f"unknown option '{key}'")
+        if isinstance(DEFAULT_PDF_OPTIONS[key], bool): options[key] = value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "yes", "on")
+        else: options[key] = str(value).strip()
+    if options["orientation"] not in ("Portrait", "Landscape"): raise ValueError("orientation must be Portrait or Landscape")
+    if not re.fullmatch(r"[A-Za-z0-9]+", options["page_size"]): raise ValueError(f"invalid page_size '{options['page_size']}'")
+    for key in ("margin_top", "margin_bottom", "margin_left", "margin_right"):
+        if options[key] and not re.fullmatch(r"\d+(\.\d+)?", options[key]): raise ValueError(f"{key} must be a number of millimetres")
+    return options
+
+
+def quote_stdin_arg(arg):
+    # quoting for the shell-like line parser behind --read-args-from-stdin (parseString in src/pdf/wkhtmltopdf.cc)
+    if "\n" in arg or "\r" in arg: raise ValueError("line breaks cannot be passed to wkhtmltopdf on stdin")
+    return '"' + arg.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class StdinRenderer:
+    # one warm `wkhtmltopdf --read-args-from-stdin` process: each render is one line of arguments, and the final "Done" phase
+    # wkhtmltopdf prints marks the document finished. wkhtmltopdf exits when a document fails, so the pool replaces the process then
+    def __init__(self, wkhtmltopdf_exec):
+        self.process = subprocess.Popen([wkhtmltopdf_exec, "--read-args-from-stdin"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                        universal_newlines=True, bufsize=1, start_new_session=True)
+        self._lines = queue.Queue() # stderr lines, None once the process has exited
+        threading.Thread(target=self._read_stderr, daemon=True).start()
+
+    def _read_stderr(self):
+        try: _pump_lines(self.process.stderr, self._lines.put)
+        finally: self._lines.put(None)
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def render(self, args, timeout=None):
+        # -> (ok, error message or None)
+        try: self.process.stdin.write(" ".join(quote_stdin_arg(arg) for arg in args) + "\n"); self.process.stdin.flush()
+        except OSError as e: return False, f"wkhtmltopdf is gone: {e}"
+        deadline = time.monotonic() + timeout if timeout else None
+        messages = collections.deque(maxlen=STDIN_RENDERER_KEEP_LINES)
+        while True:
+            try: line = self._lines.get(timeout=max(0.0, deadline - time.monotonic()) if deadline else None)
+            except queue.Empty: self.close(force=True); return False, f"timed out after {timeout}s, process killed"
+            if line is None:
+                self.process.wait()
+                return False, f"wkhtmltopdf exited with code {self.process.returncode}" + (f": {' | '.join(messages)}" if messages else "")
+            event = parse_progress_line(line)
+            if event and event[0] == EVENT_PHASE and event[1][1] is None: return True, None # the last phase has no step count
+            if (event is None or event[0] not in (EVENT_PHASE, EVENT_PROGRESS)) and line.strip(): messages.append(line.strip())
+
+    def close(self, force=False):
+        if self.is_alive() and not force:
+            try: self.process.stdin.close(); self.process.wait(5)
+            except (OSError, subprocess.TimeoutExpired): pass
+        if self.is_alive(): kill_process_tree(self.process); self.process.wait()
+
+
+class StdinRendererPool(WorkerPool):
+    # wkhtmltopdf processes as the pool's workers. each new process renders a blank page first, so qt/webkit
+    # start-up is paid before a request waits on it
+    def __init__(self, wkhtmltopdf_exec, size, warm_up_dir):
+        super().__init__(size)
+        self.wkhtmltopdf_exec = wkhtmltopdf_exec
+        self.warm_up_page = os.path.join(warm_up_dir, "warm_up.html")
+        with open(self.warm_up_page, 'w', encoding='utf-8') as f: f.write("<!DOCTYPE html><html><body></body></html>")
+
+    def _create(self):
+        renderer = StdinRenderer(self.wkhtmltopdf_exec)
+        pdf_path = f"{self.warm_up_page}.{id(renderer)}.pdf"
+        ok, error = renderer.render([self.warm_up_page, pdf_path], DEFAULT_RENDER_TIMEOUT)
+        try: os.remove(pdf_path)
+        except OSError: pass
+        if not ok: renderer.close(force=True); raise OSError(f"warm-up render failed: {error}")
+        return renderer
+
+
+class RenderJob:
+    def __init__(self, job_id, source, options, work_dir):
+        self.id = job_id
+        self.source = source # url, or the html file written for the request
+        self.options = options
+        self.work_dir = work_dir
+        self.pdf_path = os.path.join(work_dir, "out.pdf")
+        self.status = ITEM_PENDING
+        self.error = None
+        self.timed_out = False
+        self.submitted, self.started, self.finished = time.monotonic(), None, None
+        self.done = threading.Event()
+
+    def describe(self):
+        queue_seconds = (self.started or time.monotonic()) - self.submitted
+        render_seconds = (self.finished or time.monotonic()) - self.started if self.started else None
+        return {"job": self.id, "status": self.status, "error": self.error, "queue_seconds": round(queue_seconds, 4),
+                "render_seconds": round(render_seconds, 4) if render_seconds is not None else None}
+
+
+def summarize_seconds(values):
+    values = sorted(values)
+    return {"p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99), "max": values[-1] if values else None,
+            "mean": round(sum(values) / len(values), 4) if values else None, "count": len(values)}
+
+
+class RenderService:
+    # owns the warm renderer pool, the job table and the http server; start() it, stop() when done
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_queue=DEFAULT_MAX_QUEUE, engine=ENGINE_SUBPROCESS, wkhtmltopdf_exec=None, libwkhtmltox_path=None,
+                 options=None, item_timeout=DEFAULT_RENDER_TIMEOUT, work_dir=None, host="127.0.0.1", port=DEFAULT_PORT, log_queue=None):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.engine = engine
+        self.wkhtmltopdf_exec = wkhtmltopdf_exec or WKHTMLTOPDF_EXEC
+        self.libwkhtmltox_path = libwkhtmltox_path
+        self.options = dict(options or DEFAULT_PDF_OPTIONS)
+        self.item_timeout = item_timeout or None
+        self.work_dir = work_dir
+        self.host, self.port = host, port
+        self.log_queue = log_queue or ConsoleLog()
+        self.stats = collections.Counter()
+        self._jobs = {} # job id -> RenderJob, until its result has been sent (sync) or has expired (async)
+        self._lock = threading.Lock()
+        self._admitted = 0 # jobs waiting or rendering
+        self._running = 0
+        self._latencies = collections.deque(maxlen=METRICS_WINDOW) # (total, queue wait, render) seconds
+        self._started_at = time.monotonic()
+        self._stop_event = threading.Event()
+        self._pool = self._executor = self._server = None
+        self._owns_work_dir = work_dir is None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self._server.server_address[1]}"
+
+    def start(self):
+        self.work_dir = self.work_dir or tempfile.mkdtemp(prefix="wkhtml_service_")
+        os.makedirs(self.work_dir, exist_ok=True)
+        lib_path = find_libwkhtmltox(self.libwkhtmltox_path) if self.engine == ENGINE_LIBRARY else None
+        if self.engine == ENGINE_LIBRARY and not lib_path:
+            self.log_queue.put((LOG_MSG, f"libwkhtmltox not found; rendering with '{self.wkhtmltopdf_exec}' processes instead.", True))
+        self._pool = LibraryWorkerPool(lib_path, self.max_workers) if lib_path else StdinRendererPool(self.wkhtmltopdf_exec, self.max_workers, self.work_dir)
+        self.engine = ENGINE_LIBRARY if lib_path else ENGINE_SUBPROCESS
+        started = time.monotonic()
+        try: self._pool.prewarm()
+        except (OSError, LibraryWorkerError) as e: self.log_queue.put((LOG_MSG, f"Could not start the renderers: {e}", True)); raise
+        self.log_queue.put((LOG_MSG, f"{self.max_workers} {self.engine} renderer(s) warm after {time.monotonic() - started:.1f}s.", False))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._server = ThreadingHTTPServer((self.host, self.port), RenderRequestHandler)
+        self._server.daemon_threads = True
+        self._server.service = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._cleanup_loop, daemon=True).start()
+        self.log_queue.put((LOG_MSG, f"Render service listening on {self.url} (queue depth {self.max_queue}).", False))
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server: self._server.shutdown(); self._server.server_close(); self._server = None
+        if self._executor: self._executor.shutdown(cancel_futures=True); self._executor = None
+        if self._pool: self._pool.close(); self._pool = None
+        if self._owns_work_dir and self.work_dir: shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def count(self, name, amount=1):
+        with self._lock: self.stats[name] += amount
+
+    def submit(self, url=None, html=None, options=None, base_url=None):
+        # queues a render and returns its RenderJob, or None when the queue is full (429)
+        with self._lock:
+            if self._admitted >= self.max_workers + self.max_queue: self.stats["rejected"] += 1; return None
+            self._admitted += 1; self.stats["accepted"] += 1
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.work_dir, job_id)
+        source = url
+        try:
+            os.makedirs(job_dir)
+            if html is not None:
+                source = os.path.join(job_dir, "page.html")
+                with open(source, 'wb') as f: f.write(add_base_href(html, base_url) if base_url else html)
+        except OSError:
+            with self._lock: self._admitted -= 1
+            shutil.rmtree(job_dir, ignore_errors=True); raise
+        job = RenderJob(job_id, source, options or self.options, job_dir)
+        with self._lock: self._jobs[job_id] = job
+        self._executor.submit(self._render, job)
+        return job
+
+    def _render(self, job):
+        job.started, job.status = time.monotonic(), ITEM_RUNNING
+        with self._lock: self._running += 1
+        try: ok, job.error = self._render_with_library(job) if self.engine == ENGINE_LIBRARY else self._render_with_stdin(job)
+        except Exception as e: ok, job.error = False, f"render error: {e}"
+        job.finished = time.monotonic()
+        job.status = ITEM_DONE if ok and os.path.exists(job.pdf_path) else ITEM_FAILED
+        if job.status == ITEM_FAILED and not job.error: job.error = "wkhtmltopdf wrote no pdf"
+        with self._lock:
+            self._running -= 1; self._admitted -= 1
+            self.stats["succeeded" if job.status == ITEM_DONE else "failed"] += 1
+            if job.timed_out: self.stats["timed_out"] += 1
+            self._latencies.append((job.finished - job.submitted, job.started - job.submitted, job.finished - job.started))
+        job.done.set()
+
+    def _render_with_stdin(self, job):
+        args = build_single_item_command(job.options, job.source, job.pdf_path, self.wkhtmltopdf_exec)[1:]
+        try: renderer = self._pool.acquire()
+        except OSError as e: return False, f"could not start '{self.wkhtmltopdf_exec}': {e}"
+        try: ok, error = renderer.render(args, self.item_timeout)
+        finally: self._pool.release(renderer) # a renderer that exited or was killed is replaced on the next acquire
+        job.timed_out = bool(error and error.startswith("timed out"))
+        return ok, error
+
+    def _render_with_library(self, job):
+        global_settings, objects = build_library_settings(job.options, job.source, job.pdf_path)
+        try: worker = self._pool.acquire()
+        except LibraryWorkerError as e: return False, f"libwkhtmltox worker unavailable: {e}"
+        try: ok, http_error_code = worker.convert(global_settings, objects, None, self.item_timeout)
+        except LibraryWorkerError as e:
+            self._pool.discard(worker); job.timed_out = str(e).startswith("timed out")
+            return False, str(e)
+        self._pool.release(worker)
+        return ok, None if ok else "conversion failed" + (f", HTTP error {http_error_code}" if http_error_code else "")
+
+    def job(self, job_id):
+        with self._lock: return self._jobs.get(job_id)
+
+    def discard(self, job):
+        with self._lock: self._jobs.pop(job.id, None)
+        shutil.rmtree(job.work_dir, ignore_errors=True)
+
+    def _cleanup_loop(self):
+        # async results nobody fetched (or deleted) are dropped RESULT_TTL after they finished
+        while not self._stop_event.wait(CLEANUP_INTERVAL):
+            now = time.monotonic()
+            with self._lock: expired = [job for job in self._jobs.values() if job.finished and now - job.finished > RESULT_TTL]
+            for job in expired: self.discard(job)
+
+    def retry_after(self):
+        # seconds until a queue slot is likely to free up, for 429 responses
+        with self._lock: renders = [render for _, _, render in self._latencies]; waiting = self._admitted - self._running
+        mean = sum(renders) / len(renders) if renders else 1.0
+        return max(1, math.ceil(mean * (waiting + 1) / self.max_workers))
+
+    def metrics(self):
+        with self._lock:
+            latencies, stats = list(self._latencies), dict(self.stats)
+            running, waiting, jobs = self._running, self._admitted - self._running, len(self._jobs)
+        uptime = time.monotonic() - self._started_at
+        return {"engine": self.engine, "workers": self.max_workers, "running": running, "queued": waiting, "max_queue": self.max_queue,
+                "jobs_held": jobs, "uptime_seconds": round(uptime, 1), "requests": stats,
+                "latency_seconds": summarize_seconds([total for total, _, _ in latencies]),
+                "queue_wait_seconds": summarize_seconds([wait for _, wait, _ in latencies]),
+                "render_seconds": summarize_seconds([render for _, _, render in latencies])}
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass # request counts and latencies are reported by /metrics instead
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json"); self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items(): self.send_header(name, value)
+        self.end_headers(); self.wfile.write(data)
+
+    def _send_pdf(self, job):
+        size = os.path.getsize(job.pdf_path)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf"); self.send_header("Content-Length", str(size))
+        self.send_header("X-Queue-Seconds", f"{job.started - job.submitted:.4f}"); self.send_header("X-Render-Seconds", f"{job.finished - job.started:.4f}")
+        self.end_headers()
+        with open(job.pdf_path, 'rb') as f: shutil.copyfileobj(f, self.wfile, PDF_CHUNK_BYTES)
+
+    def _send_result(self, job):
+        if job.status == ITEM_DONE: self._send_pdf(job)
+        else: self._send_json(504 if job.timed_out else 502, job.describe())
+
+    def do_GET(self):
+        service = self.server.service
+        path = self.path.partition("?")[0]
+        if path == "/metrics": self._send_json(200, service.metrics()); return
+        if path == "/healthz": self._send_json(200, {"status": "ok"}); return
+        match = re.fullmatch(r"/jobs/(\w+)(/pdf)?", path)
+        job = service.job(match.group(1)) if match else None
+        if job is None: self._send_json(404, {"error": "no such job" if match else "not found"}); return
+        if not match.group(2): self._send_json(200, job.describe()); return
+        if not job.done.is_set(): self._send_json(409, job.describe()); return
+        self._send_result(job)
+
+    def do_DELETE(self):
+        service = self.server.service
+        match = re.fullmatch(r"/jobs/(\w+)", self.path.partition("?")[0])
+        job = service.job(match.group(1)) if match else None
+        if job is None or not job.done.is_set(): self._send_json(404 if job is None else 409, {"error": "no such job" if job is None else "job still running"}); return
+        service.discard(job); self._send_json(200, {"job": job.id, "status": "deleted"})
+
+    def do_POST(self):
+        service = self.server.service
+        path, _, query = self.path.partition("?")
+        if path != "/render": self._send_json(404, {"error": "not found"}); return
+        try: length = int(self.headers.get("Content-Length") or 0)
+        except ValueError: length = -1
+        if length < 0 or length > MAX_BODY_BYTES:
+            service.count("bad_requests"); self.close_connection = True
+            self._send_json(413 if length > 0 else 400, {"error": f"body must have a Content-Length of at most {MAX_BODY_BYTES} bytes"}); return
+        body = self.rfile.read(length)
+        params = dict(parse_qsl(query))
+        try:
+            if self.headers.get("Content-Type", "").split(";")[0].strip().lower() == "application/json":
+                request = json.loads(body or b"{}")
+                if not isinstance(request, dict): raise ValueError("json body must be an object")
+                html = request["html"].encode("utf-8") if isinstance(request.get("html"), str) else None
+            else: request, html = {}, body or None
+            url = request.get("url") or params.get("url")
+            if bool(url) == bool(html): raise ValueError("send either an html body or a url")
+            if url and not is_url(url): raise ValueError("url must start with http:// or https://")
+            overrides = dict({key: value for key, value in params.items() if key not in CONTROL_PARAMS}, **(request.get("options") or {}))
+            options = merge_render_options(service.options, overrides)
+        except (ValueError, KeyError, AttributeError, TypeError) as e:
+            service.count("bad_requests"); self._send_json(400, {"error": str(e)}); return
+
+        try: job = service.submit(url, html, options, request.get("base_url") or params.get("base_url"))
+        except OSError as e: self._send_json(500, {"error": f"could not store the request: {e}"}); return
+        if job is None:
+            retry_after = service.retry_after()
+            self._send_json(429, {"error": "render queue is full", "retry_after": retry_after}, {"Retry-After": str(retry_after)}); return
+        if str(request.get("async", params.get("async", ""))).lower() in ("1", "true", "yes", "on"):
+            self._send_json(202, job.describe(), {"Location": f"/jobs/{job.id}"}); return
+        try:
+            job.done.wait()
+            self._send_result(job)
+        finally: service.discard(job)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python wkhtml_service.py", description="HTTP render service with a warm wkhtmltopdf pool.")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on (pages render with this user's rights: keep it private)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_MAX_WORKERS, help="warm renderers, i.e. documents rendered at once")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE, help="requests that may wait for a renderer before new ones get 429")
+    parser.add_argument("--engine", choices=ENGINES, default=ENGINE_SUBPROCESS, help="wkhtmltopdf processes (--read-args-from-stdin) or libwkhtmltox workers")
+    parser.add_argument("--wkhtmltopdf", default=WKHTMLTOPDF_EXEC, help="path to the wkhtmltopdf executable")
+    parser.add_argument("--libwkhtmltox", help="path to libwkhtmltox (default: $WKHTMLTOX_LIB or the system library path)")
+    parser.add_argument("--options", help="JSON file with default PDF options; requests may override them")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_RENDER_TIMEOUT, help="seconds before a render is killed (0=no limit)")
+    parser.add_argument("--work-dir", help="where request html and pdfs are kept while in flight (default: a temporary directory)")
+    args = parser.parse_args(argv)
+    try: options = load_pdf_options(args.options)
+    except (OSError, ValueError) as e: parser.error(str(e))
+
+    service = RenderService(args.jobs, args.max_queue, args.engine, args.wkhtmltopdf, args.libwkhtmltox, options, args.timeout, args.work_dir, args.host, args.port)
+    try: service.start()
+    except (OSError, LibraryWorkerError): service.stop(); return 2
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt: return 0
+    finally: service.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())